@@ -0,0 +1,702 @@
+# bench.py — офлайн-бенчмарк конвейера сбора без обращения к живым сайтам.
+#
+#   python bench.py record   [--out fixtures/http_fixtures.jsonl.gz] [--max-pages N]
+#       один живой прогон collect, все ответы safe_get / agency_template._fetch пишутся в архив
+#
+#   python bench.py pipeline [--fixtures ...] [--latency 0.05] [--jitter 0.02] [--error-rate 0.05]
+#       fetch -> parse -> detect_type/is_south/is_price_ok -> db.save_new_items -> notifier
+#       на воспроизведённых ответах; печатает wall / CPU / peak RSS / items/s по стадиям
+#
+#   python bench.py parse    [--fixtures ...] [--synthetic 50] [--repeat 3]
+#       разбор list pages agency_template: BeautifulSoup vs скомпилированный lxml-движок,
+#       (полный перебор каскадов и по профилю домена), время на страницу и сверка результатов
+#
+#   python bench.py fuzzy    [--items 3000] [--words 40]
+#       detect_type / is_south: прежние вложенные циклы SequenceMatcher против FuzzyIndex,
+#       мкс на объявление и сверка решений
+#
+#   python bench.py classify [--sizes 10000,100000] [--no-geo]
+#       фильтр пачки после текстового прохода (юг по GEO_FILTER + лимиты цен):
+#       поштучно (is_south / is_price_ok) против utils.classify_batch на numpy, объявлений в секунду
+#
+#   python bench.py listing  [--items 10000]
+#       память на объявления (dict против listing.Listing) после разбора и фильтра, на 10k объявлений,
+#       и время detect_type + is_south по ним
+#
+#   python bench.py dedup    [--sizes 10000,100000] [--queries 200] [--scan-queries 20]
+#       db.is_duplicate на таблице из N объявлений: полный перебор против индекса dup_index
+#       (построение, мс на проверку, кандидатов на проверку, совпадение решений)
+#
+#   python bench.py dbwrite  [--stored 10000] [--batches 20] [--batch-size 200]
+#       db.save_new_items: прежняя запись (соединение на вызов, commit на строку) против
+#       пакетной (общее соединение WAL, дубликаты заранее, одна транзакция); строк/с и сверка результата
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import config
+
+DEFAULT_FIXTURES = os.path.join("fixtures", "http_fixtures.jsonl.gz")
+
+
+def _peak_rss_mb():
+    # ru_maxrss в Linux — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Stage:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.items = 0
+
+    def __enter__(self):
+        self.wall0 = time.perf_counter()
+        self.cpu0 = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall0
+        cpu = time.process_time() - self.cpu0
+        rate = self.items / wall if wall > 0 else 0.0
+        self.rows.append((self.name, wall, cpu, _peak_rss_mb(), self.items, rate))
+        return False
+
+
+def _print_table(rows):
+    print()
+    print(f"{'stage':<14}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}{'items':>9}{'items/s':>12}")
+    for name, wall, cpu, rss, items, rate in rows:
+        print(f"{name:<14}{wall:>10.3f}{cpu:>10.3f}{rss:>10.1f}{items:>9}{rate:>12.1f}")
+
+
+class _NullBot:
+    """Заглушка telegram.Bot: сообщения никуда не уходят."""
+
+    def send_message(self, **kwargs):
+        return True
+
+
+def _sources(only):
+    sources = getattr(config, "SOURCES", [])
+    if only:
+        wanted = {s.strip() for s in only.split(",")}
+        sources = [s for s in sources if s[2] in wanted or s[0] in wanted]
+    return sources
+
+
+def cmd_record(args):
+    import collector
+    from parsers import _replay
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    # записываем полные ответы: без conditional GET и без пропуска страниц
+    config.SETTINGS["http_cache"] = False
+    config.SETTINGS["page_fingerprint"] = False
+    config.SETTINGS["incremental_crawl"] = False
+    recorder = _replay.record_to(args.out)
+    try:
+        max_pages = args.max_pages or config.SETTINGS.get("max_pages_per_source", 1)
+        delay = config.SETTINGS.get("delay_between_requests", 1.2)
+        results = collector.collect_sources(_sources(args.only), max_pages, delay)
+        print(f"[bench] live collect: {len(results)} items")
+    finally:
+        _replay.stop()
+        recorder.save()
+
+
+def cmd_pipeline(args):
+    from parsers import _replay
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_")
+    os.environ["CHAT_ID"] = "bench"
+
+    import db
+    db.DB_PATH = os.path.join(tmpdir, "bench.db")
+    db._known_links = None
+
+    import bot
+    import collector
+    import notifier
+
+    config.SETTINGS["enable_db"] = True
+    config.SETTINGS["save_to_csv"] = False
+    config.SETTINGS["async_collect"] = not args.sync
+    config.SETTINGS["delay_between_requests"] = 0
+    config.SETTINGS["delay_per_source"] = {}
+    if not args.with_cache:
+        config.SETTINGS["http_cache"] = False
+        config.SETTINGS["page_fingerprint"] = False
+    notifier.PAUSE_BETWEEN_MSGS = 0
+
+    stats = _replay.replay_from(args.fixtures, args.latency, args.jitter, args.error_rate)
+    rows = []
+    t0 = time.perf_counter()
+    cpu0 = time.process_time()
+    try:
+        max_pages = args.max_pages or config.SETTINGS.get("max_pages_per_source", 1)
+        with Stage("fetch+parse", rows) as st:
+            results = collector.collect_sources(_sources(args.only), max_pages, 0)
+            st.items = len(results)
+        with Stage("classify", rows) as st:
+            candidates = bot.filter_candidates(results)
+            st.items = len(results)
+        with Stage("db_save", rows) as st:
+            new_items = bot.save_new(candidates, results)
+            st.items = len(candidates)
+        with Stage("notify", rows) as st:
+            notifier.notify_new_items(new_items, bot=_NullBot())
+            st.items = len(new_items)
+    finally:
+        _replay.stop()
+
+    wall = time.perf_counter() - t0
+    rows.append(("total", wall, time.process_time() - cpu0, _peak_rss_mb(), len(results),
+                 len(results) / wall if wall > 0 else 0.0))
+    _print_table(rows)
+    print()
+    print(
+        f"replay: {stats['requests']} requests, {stats['served']} served, {stats['missing']} missing, "
+        f"{stats['errors']} injected errors, {stats['fetch_seconds']:.2f}s in transport"
+    )
+    print(f"candidates={len(candidates)} new={len(new_items)}")
+
+
+def _html_pages(args):
+    """(url, html) list pages из архива фикстур; если архива нет — синтетические страницы."""
+    pages = []
+    if os.path.exists(args.fixtures):
+        import base64
+        from parsers import _replay
+        for url, rec in _replay.load_archive(args.fixtures).items():
+            ctype = (rec.get("headers") or {}).get("Content-Type", "") or ""
+            if rec.get("status") != 200 or "html" not in ctype.lower():
+                continue
+            body = base64.b64decode(rec.get("body") or "")
+            pages.append((url, body.decode(rec.get("encoding") or "utf-8", "replace")))
+    if not pages:
+        pages = _synthetic_pages(args.synthetic)
+    return pages
+
+
+def _synthetic_pages(count, cards=24):
+    import random
+    rnd = random.Random(42)
+    pages = []
+    for n in range(count):
+        body = []
+        for i in range(cards):
+            body.append(
+                f"<article class='property-card'><div class='media'><img src='/img/{n}/{i}.jpg'></div>"
+                f"<h2><a href='/property/{n}-{i}'>Villa {n}-{i} in Adeje</a></h2>"
+                f"<div class='price'>€ {rnd.randint(90, 900)}.000</div>"
+                "<div class='location'>Costa Adeje, Tenerife <span>South</span></div>"
+                f"<p class='card-text'>{rnd.randint(2, 6)} bedrooms, terrace, sea view. " + "Lorem ipsum. " * 20 + "</p>"
+                "</article>"
+            )
+        nav = "".join(f"<li><a href='/page/{k}'>{k}</a></li>" for k in range(1, 30))
+        html = (
+            "<!DOCTYPE html><html><head><title>Listings</title><script>var x = 1;</script></head>"
+            f"<body><header><ul>{nav}</ul></header><main>{''.join(body)}</main><footer>(c)</footer></body></html>"
+        )
+        pages.append((f"https://example.test/list?page={n}", html))
+    return pages
+
+
+def cmd_parse(args):
+    from parsers import agency_template as at, _selector_profiles
+
+    pages = _html_pages(args)
+    # профили доменов — во временном файле, рабочий selector_profiles.json не трогаем
+    _selector_profiles._store = _selector_profiles.ProfileStore(
+        os.path.join(tempfile.mkdtemp(prefix="bench_"), "profiles.json")
+    )
+    engines = [
+        ("soup", at._parse_html_cards),
+        ("lxml", at._parse_lxml_cards),
+        ("profile", lambda html, url: at._parse_lxml_cards(html, url, use_profile=True)),
+    ]
+    timings = {name: [] for name, _ in engines}
+    mismatches = 0
+    cards = 0
+    for url, html in pages:
+        outputs = {}
+        for name, fn in engines:
+            best = None
+            for _ in range(max(1, args.repeat)):
+                t0 = time.perf_counter()
+                outputs[name] = fn(html, url)
+                dt = time.perf_counter() - t0
+                best = dt if best is None else min(best, dt)
+            timings[name].append(best)
+        cards += len(outputs["soup"])
+        if outputs["lxml"] is not None and outputs["lxml"] != outputs["soup"]:
+            mismatches += 1
+            print(f"[bench] output mismatch: {url}")
+
+    print()
+    print(f"{len(pages)} pages, {cards} cards")
+    print(f"{'engine':<8}{'total s':>10}{'ms/page':>10}{'median ms':>11}{'p95 ms':>9}")
+    for name, ts in timings.items():
+        ts_sorted = sorted(ts)
+        med = ts_sorted[len(ts_sorted) // 2] if ts_sorted else 0.0
+        p95 = ts_sorted[int(len(ts_sorted) * 0.95)] if ts_sorted else 0.0
+        avg = sum(ts) / len(ts) if ts else 0.0
+        print(f"{name:<8}{sum(ts):>10.3f}{avg * 1000:>10.2f}{med * 1000:>11.2f}{p95 * 1000:>9.2f}")
+    if timings["lxml"] and sum(timings["lxml"]) > 0:
+        print(f"speedup: x{sum(timings['soup']) / sum(timings['lxml']):.1f}, mismatches: {mismatches}")
+
+
+def _naive_detect_type(item):
+    # detect_type до FuzzyIndex: каждый ключ против каждого токена и всего текста
+    from utils import text_norm, _tokens, _similar, TOKEN_FUZZY_THRESHOLD, FUZZY_THRESHOLD
+    txt = text_norm(" ".join(str(item.get(k, "") or "") for k in ("title", "address", "description")))
+    for t, keys in config.TYPE_KEYWORDS.items():
+        for k in keys:
+            if not k:
+                continue
+            if k in txt:
+                return t
+            for tok in _tokens(txt):
+                if _similar(k, tok) >= TOKEN_FUZZY_THRESHOLD:
+                    return t
+        for k in keys:
+            if _similar(k, txt) >= FUZZY_THRESHOLD:
+                return t
+    return None
+
+
+def _naive_is_south(item):
+    # is_south до FuzzyIndex (без GEO — в бенчмарке координат нет)
+    from utils import text_norm, _tokens, _similar, TOKEN_FUZZY_THRESHOLD, FUZZY_THRESHOLD
+    txt = text_norm(" ".join(str(item.get(k, "") or "") for k in ("title", "address", "description")))
+    if not txt:
+        return False
+    for b in getattr(config, "SOUTH_BLACKLIST", []) or []:
+        if b and b in txt:
+            return False
+    keywords = getattr(config, "SOUTH_KEYWORDS", []) or []
+    for k in keywords:
+        if k and k in txt:
+            return True
+    txt_tokens = _tokens(txt)
+    for k in keywords:
+        kw_norm = text_norm(k)
+        if kw_norm in txt_tokens:
+            return True
+        for kt in _tokens(kw_norm):
+            for tok in txt_tokens:
+                if _similar(kt, tok) >= TOKEN_FUZZY_THRESHOLD:
+                    return True
+        if _similar(kw_norm, txt) >= FUZZY_THRESHOLD:
+            return True
+    return False
+
+
+def _synthetic_items(count, words):
+    """Объявления из ключевых слов config (часть — с опечатками) вперемешку с обычными словами."""
+    import random
+    rnd = random.Random(42)
+    vocab = [w for keys in config.TYPE_KEYWORDS.values() for k in keys for w in k.split()]
+    vocab += [w for k in getattr(config, "SOUTH_KEYWORDS", []) for w in k.split()]
+    filler = ("sea view terrace pool garage bedrooms bathrooms modern renovated quiet near beach "
+              "puerto de la cruz santa cruz la laguna orotava icod garden parking").split()
+
+    def typo(w):
+        if len(w) < 4 or rnd.random() < 0.5:
+            return w
+        i = rnd.randrange(len(w))
+        return w[:i] + rnd.choice("aeilnorst") + w[i + 1:]
+
+    items = []
+    for _ in range(count):
+        n = rnd.randint(1, words)
+        text = [typo(rnd.choice(vocab)) if rnd.random() < 0.1 else rnd.choice(filler) for _ in range(n)]
+        items.append({"title": " ".join(text[:6]), "address": "", "description": " ".join(text[6:])})
+    return items
+
+
+def cmd_fuzzy(args):
+    import utils
+
+    # сравниваются только ключевые слова: названия мест из filler («la laguna», «orotava»)
+    # справочник (gazetteer) решает по-своему, и «nested» с ним не совпал бы
+    config.SETTINGS["gazetteer"] = False
+    items = _synthetic_items(args.items, args.words)
+    engines = [
+        ("nested", _naive_detect_type, _naive_is_south),
+        ("indexed", utils.detect_type, utils.is_south),
+    ]
+    results = {}
+    print(f"{len(items)} items, up to {args.words} words, "
+          f"thresholds token={utils.TOKEN_FUZZY_THRESHOLD} full={utils.FUZZY_THRESHOLD}")
+    print(f"{'engine':<9}{'total s':>10}{'us/item':>10}")
+    for name, detect, south in engines:
+        t0 = time.perf_counter()
+        results[name] = [(detect(it), south(it)) for it in items]
+        dt = time.perf_counter() - t0
+        print(f"{name:<9}{dt:>10.3f}{dt / len(items) * 1e6:>10.1f}")
+    mismatches = sum(1 for a, b in zip(results["nested"], results["indexed"]) if a != b)
+    fz = utils.keyword_tables().fuzzy
+    print(f"mismatches: {mismatches}, distinct tokens scanned {fz.scanned}, SequenceMatcher calls {fz.compared}")
+
+
+def _scalar_filter(items, verdicts, prices):
+    # то же решение, что у classify_batch, но по одному объявлению
+    import utils
+    kw = utils.keyword_tables()
+    circle = utils._geo_circle()
+    mask = []
+    for it, (t, south), price in zip(items, verdicts, prices):
+        if not t:
+            mask.append(False)
+            continue
+        point = utils._geo_point(it) if circle else None
+        if point is not None:
+            txt = utils.text_norm(" ".join(str(it.get(k, "") or "") for k in ("title", "address", "description")))
+            hits = kw.hits(txt) if txt else ()
+            blacklisted = not txt or any(b and b in hits for b in kw.blacklist)
+            south = not blacklisted and utils._haversine_km(point[0], point[1], circle[0], circle[1]) <= circle[2]
+        mask.append(bool(south) and utils.is_price_ok({"detected_type": t, "price": price}))
+    return mask
+
+
+def cmd_classify(args):
+    import random
+    import utils
+
+    if not utils.NUMPY_AVAILABLE:
+        print("numpy is not installed")
+        return
+    if not args.no_geo and not (getattr(config, "GEO_FILTER", None) or {}).get("enabled"):
+        # центр южного побережья; в config по умолчанию GEO_FILTER выключен
+        config.GEO_FILTER = {"enabled": True, "center": (28.08, -16.72), "radius_km": 25.0}
+    rnd = random.Random(7)
+    types = list(config.TYPE_KEYWORDS) + [None, None]
+    for size in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        items, verdicts, prices = [], [], []
+        for i in range(size):
+            t = rnd.choice(types)
+            it = {"title": f"{t or 'flat'} {i} in Adeje", "address": "", "description": "sea view"}
+            if rnd.random() < 0.5:
+                it["lat"] = 27.99 + rnd.random() * 0.6
+                it["lon"] = -16.93 + rnd.random() * 0.8
+            items.append(it)
+            verdicts.append((t, rnd.random() < 0.6))
+            prices.append(rnd.choice([None, rnd.randint(50, 900) * 1000]))
+        t0 = time.perf_counter()
+        scalar = _scalar_filter(items, verdicts, prices)
+        t_scalar = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        mask, _reasons = utils.classify_batch(items, verdicts, prices)
+        t_batch = time.perf_counter() - t0
+        mismatches = sum(1 for a, b in zip(scalar, mask.tolist()) if a != b)
+        print(
+            f"{size:>7} items: scalar {t_scalar:.3f}s ({size / t_scalar:,.0f}/s), "
+            f"numpy {t_batch:.3f}s ({size / t_batch:,.0f}/s), x{t_scalar / t_batch:.1f}, "
+            f"{int(mask.sum())} pass, mismatches: {mismatches}"
+        )
+
+
+def _listing_pages(count):
+    """JSON страниц, как его хранит кэш разобранных страниц (_fingerprint): объявления — dict парсеров."""
+    import json
+    import random
+    rnd = random.Random(11)
+    sources = [s[2] for s in getattr(config, "SOURCES", [])] or [f"Agency {n}" for n in range(20)]
+    towns = ("Adeje", "Arona", "Los Cristianos", "Costa Adeje", "Puerto de la Cruz", "La Laguna", "Granadilla")
+    kinds = [k for keys in config.TYPE_KEYWORDS.values() for k in keys] or ["apartment"]
+    items = []
+    for i in range(count):
+        town = rnd.choice(towns)
+        it = {
+            "title": f"{rnd.choice(kinds).title()} in {town}, {rnd.randint(1, 4)} bedrooms",
+            "address": f"Calle {rnd.randint(1, 300)}, {town}, Santa Cruz de Tenerife",
+            "price": f"{rnd.randint(80, 900)}.{rnd.randint(0, 999):03d} €",
+            "link": f"https://example.com/property/{i}",
+            "source": rnd.choice(sources),
+        }
+        if rnd.random() < 0.5:
+            it["description"] = " ".join(rnd.choice(("sea view", "terrace", "pool", "garage", "renovated", "quiet"))
+                                         for _ in range(rnd.randint(10, 60)))
+        if rnd.random() < 0.3:
+            it["price_eur"] = rnd.randint(80, 900) * 1000
+        items.append(it)
+    return json.dumps(items, ensure_ascii=False)
+
+
+def cmd_listing(args):
+    import gc
+    import json
+    import tracemalloc
+    import utils
+    from listing import listings
+
+    blob = _listing_pages(args.items)
+    per = 10000.0 / args.items
+    print(f"{args.items} listings, memory per 10k after collect + filter_candidates field updates")
+    print(f"{'record':<9}{'retained MB':>13}{'peak MB':>10}{'classify s':>12}")
+    for name, build in (("dict", json.loads), ("Listing", lambda b: listings(json.loads(b)))):
+        gc.collect()
+        tracemalloc.start()
+        items = build(blob)
+        for it in items:
+            # то, что делает filter_candidates до классификации
+            it.setdefault("title", "")
+            it.setdefault("address", "")
+            it.setdefault("description", "")
+            it.setdefault("price", None)
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        t0 = time.perf_counter()
+        for it in items:
+            t = utils.detect_type(it)
+            it["detected_type"] = t
+            if t:
+                utils.is_south(it)
+        dt = time.perf_counter() - t0
+        print(f"{name:<9}{retained * per / 2**20:>13.2f}{peak * per / 2**20:>10.2f}{dt * per:>12.3f}")
+        del items
+
+
+def _dedup_items(count, seed):
+    """Объявления с разнообразными названиями и адресами (улицы из случайных слогов)."""
+    import random
+    rnd = random.Random(seed)
+    syl = "ba be bi bo ca ce co da de do fa fe la le li lo ma me mi mo na ne no pa pe ra re ri ro sa se so ta te to".split()
+    kinds = [k for keys in config.TYPE_KEYWORDS.values() for k in keys] or ["apartment"]
+    adjs = ("sea view", "renovated", "with pool", "frontline", "luxury", "bright", "modern", "quiet", "new build")
+    towns = ("Adeje", "Arona", "Los Cristianos", "Costa Adeje", "Playa de las Americas", "Puerto de la Cruz",
+             "La Laguna", "Granadilla", "El Medano", "Callao Salvaje", "Guia de Isora", "Los Gigantes", "San Miguel")
+
+    def word():
+        return "".join(rnd.choice(syl) for _ in range(rnd.randint(2, 4))).title()
+
+    items = []
+    for i in range(count):
+        town = rnd.choice(towns)
+        title = f"{rnd.choice(kinds).title()} {rnd.choice(adjs)} in {town}"
+        if rnd.random() < 0.6:
+            title += f", {rnd.randint(1, 5)} bedrooms"
+        street = " ".join(word() for _ in range(rnd.randint(1, 2)))
+        address = f"{rnd.choice(('Calle', 'Avenida', 'Urb.', 'Camino'))} {street} {rnd.randint(1, 200)}, {town}"
+        items.append((f"https://example.com/{seed}/{i}", title, address))
+    return items
+
+
+def _edit(rnd, s, edits):
+    s = list(s)
+    for _ in range(edits):
+        i = rnd.randrange(len(s))
+        op = rnd.random()
+        if op < 0.4:
+            s[i] = rnd.choice("abcdefghijklmnopqrstuvwxyz0123456789 ")
+        elif op < 0.7 and len(s) > 1:
+            del s[i]
+        else:
+            s.insert(i, rnd.choice("abcdefghijklmnopqrstuvwxyz0123456789 "))
+    return "".join(s)
+
+
+def cmd_dedup(args):
+    import random
+    import db
+    import dup_index
+
+    rnd = random.Random(5)
+    for size in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = os.path.join(tmp, "props.db")
+            conn = db.get_conn()
+            stored = _dedup_items(size, seed=size)
+            conn.executemany("INSERT INTO listings (link, title, address) VALUES (?, ?, ?)", stored)
+            conn.commit()
+            t0 = time.perf_counter()
+            dup_index.ensure(conn)
+            t_build = time.perf_counter() - t0
+            # половина проверок — переизданные объявления с правками, половина — новые
+            queries = []
+            for n in range(args.queries):
+                if n % 2 == 0:
+                    _link, title, address = rnd.choice(stored)
+                    queries.append((_edit(rnd, title, rnd.randint(0, 4)), _edit(rnd, address, rnd.randint(0, 4))))
+                else:
+                    queries.append(_dedup_items(1, seed=size * 1000 + n)[0][1:])
+            config.SETTINGS["dup_index"] = True
+            dup_index.STATS["lookups"] = dup_index.STATS["candidates"] = 0
+            t0 = time.perf_counter()
+            fast = [db.is_duplicate(conn, "", t, a) for t, a in queries]
+            t_index = (time.perf_counter() - t0) / len(queries)
+            cands = dup_index.STATS["candidates"] / max(1, dup_index.STATS["lookups"])
+            config.SETTINGS["dup_index"] = False
+            scan_queries = queries[:args.scan_queries]
+            t0 = time.perf_counter()
+            slow = [db.is_duplicate(conn, "", t, a) for t, a in scan_queries]
+            t_scan = (time.perf_counter() - t0) / max(1, len(scan_queries))
+            config.SETTINGS["dup_index"] = True
+            pairs = list(zip(slow, fast))
+            missed = sum(1 for s, f in pairs if s and not f)
+            extra = sum(1 for s, f in pairs if f and not s)
+            conn.close()
+            print(
+                f"{size:>7} rows: index built in {t_build:.1f}s; full scan {t_scan * 1000:.1f} ms/check, "
+                f"index {t_index * 1000:.2f} ms/check ({cands:.0f} candidates), x{t_scan / t_index:.0f}; "
+                f"{sum(fast)}/{len(fast)} duplicates, vs scan on {len(pairs)}: {missed} missed, {extra} extra"
+            )
+            dup_index._ready.clear()
+
+
+def _legacy_save_new_items(items):
+    # save_new_items до пакетной записи: новое соединение на вызов, проверка и commit на каждую строку
+    import sqlite3
+    from datetime import datetime
+    import db
+    import dup_index
+    conn = db.get_conn()
+    cur = conn.cursor()
+    new_inserted = []
+    for it in items:
+        link = it.get("link") or ""
+        title = it.get("title") or ""
+        address = it.get("address") or ""
+        try:
+            price = int(it.get("price")) if it.get("price") not in (None, "") else None
+        except Exception:
+            price = None
+        try:
+            if db.is_duplicate(conn, link, title, address):
+                continue
+            cur.execute(
+                "INSERT INTO listings (link, title, price, address, source, first_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                (link, title, price, address, it.get("source"), datetime.utcnow())
+            )
+            if dup_index.enabled():
+                dup_index.add(conn, cur.lastrowid, db.listing_key(title, address))
+            conn.commit()
+            new_inserted.append(it)
+        except sqlite3.IntegrityError:
+            continue
+    conn.close()
+    return new_inserted
+
+
+def cmd_dbwrite(args):
+    import random
+    import shutil
+    import db
+    import dup_index
+
+    rnd = random.Random(9)
+    stored = _dedup_items(args.stored, seed=1)
+    batches = []
+    fresh = iter(_dedup_items(args.batches * args.batch_size, seed=2))
+    for _ in range(args.batches):
+        batch = []
+        for _ in range(args.batch_size):
+            r = rnd.random()
+            if r < 0.15:
+                link, title, address = rnd.choice(stored)            # та же ссылка
+            elif r < 0.3:
+                _link, title, address = rnd.choice(stored)           # переиздание с правками
+                link = f"https://example.com/repost/{rnd.randrange(1 << 30)}"
+                title = _edit(rnd, title, rnd.randint(0, 2))
+            else:
+                link, title, address = next(fresh)
+            batch.append({"link": link, "title": title, "address": address,
+                          "price": str(rnd.randint(80, 900) * 1000), "source": "bench"})
+        batches.append(batch)
+    total = sum(len(b) for b in batches)
+    if args.writes_only:
+        # без сравнения title+address у обеих реализаций — остаётся запись и проверка ссылок
+        db.any_similar = lambda keys, key, threshold=db.DUP_THRESHOLD: False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_db = os.path.join(tmp, "seed.db")
+        db.DB_PATH = seed_db
+        conn = db.get_conn()
+        conn.executemany("INSERT INTO listings (link, title, address) VALUES (?, ?, ?)", stored)
+        conn.commit()
+        dup_index.ensure(conn)
+        conn.close()
+        results = {}
+        print(f"{args.stored} stored listings, {args.batches} batches x {args.batch_size} items")
+        for name, save in (("per-row", _legacy_save_new_items), ("batched", db.save_new_items)):
+            db.close()
+            db.DB_PATH = os.path.join(tmp, f"{name}.db")
+            shutil.copy(seed_db, db.DB_PATH)
+            dup_index._ready.clear()
+            t0 = time.perf_counter()
+            saved = [it["link"] for b in batches for it in save(b)]
+            dt = time.perf_counter() - t0
+            results[name] = saved
+            print(f"{name:<9}{dt:>8.2f}s  {total / dt:>8,.0f} items/s  {len(saved)} inserted")
+        db.close()
+        print("same inserted items:", results["per-row"] == results["batched"])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline benchmarks for the collect pipeline")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rec = sub.add_parser("record", help="record live HTTP responses into a fixture archive")
+    rec.add_argument("--out", default=DEFAULT_FIXTURES)
+    rec.add_argument("--max-pages", type=int, default=0)
+    rec.add_argument("--only", default="", help="comma-separated source names or module paths")
+    rec.set_defaults(func=cmd_record)
+
+    pipe = sub.add_parser("pipeline", help="run the full pipeline on replayed fixtures")
+    pipe.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    pipe.add_argument("--latency", type=float, default=0.0, help="seconds per replayed request")
+    pipe.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to latency")
+    pipe.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing (timeout/500/429)")
+    pipe.add_argument("--max-pages", type=int, default=0)
+    pipe.add_argument("--only", default="", help="comma-separated source names or module paths")
+    pipe.add_argument("--sync", action="store_true", help="sequential collect instead of the async engine")
+    pipe.add_argument("--with-cache", action="store_true", help="keep HTTP cache and page fingerprints on")
+    pipe.set_defaults(func=cmd_pipeline)
+
+    prs = sub.add_parser("parse", help="agency_template list-page parsing: BeautifulSoup vs compiled lxml")
+    prs.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    prs.add_argument("--synthetic", type=int, default=50, help="synthetic pages when there is no fixture archive")
+    prs.add_argument("--repeat", type=int, default=3, help="best of N runs per page")
+    prs.set_defaults(func=cmd_parse)
+
+    fz = sub.add_parser("fuzzy", help="detect_type / is_south: nested SequenceMatcher loops vs FuzzyIndex")
+    fz.add_argument("--items", type=int, default=3000)
+    fz.add_argument("--words", type=int, default=40, help="max words per synthetic listing")
+    fz.set_defaults(func=cmd_fuzzy)
+
+    cls = sub.add_parser("classify", help="batch type/south/price filter: per-item vs numpy classify_batch")
+    cls.add_argument("--sizes", default="10000,100000", help="comma-separated batch sizes")
+    cls.add_argument("--no-geo", action="store_true", help="leave GEO_FILTER as configured")
+    cls.set_defaults(func=cmd_classify)
+
+    lst = sub.add_parser("listing", help="memory per 10k listings: plain dicts vs slotted listing.Listing")
+    lst.add_argument("--items", type=int, default=10000)
+    lst.set_defaults(func=cmd_listing)
+
+    dd = sub.add_parser("dedup", help="db.is_duplicate: full table scan vs dup_index candidates")
+    dd.add_argument("--sizes", default="10000,100000", help="comma-separated table sizes")
+    dd.add_argument("--queries", type=int, default=200)
+    dd.add_argument("--scan-queries", type=int, default=20, help="how many checks to repeat with the full scan")
+    dd.set_defaults(func=cmd_dedup)
+
+    dw = sub.add_parser("dbwrite", help="db.save_new_items: per-row commits vs one batched WAL transaction")
+    dw.add_argument("--stored", type=int, default=10000)
+    dw.add_argument("--batches", type=int, default=20)
+    dw.add_argument("--batch-size", type=int, default=200)
+    dw.add_argument("--writes-only", action="store_true",
+                    help="duplicates by link only (no title/address scoring): pure write path")
+    dw.set_defaults(func=cmd_dbwrite)
+
+    args = ap.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
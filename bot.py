@@ -2,9 +2,9 @@
 # Telegram polling bot + minimal HTTP server so Render Web Service is happy (binds a port).
 # Совместим с config.py, user_limits.py, utils.py, notifier.py, db.py и parsers/*.
 
+import json
 import threading
 import time
-import importlib
 import traceback
 import os
 from threading import Thread
@@ -19,14 +19,24 @@ from telegram.ext import (
     ContextTypes,
 )
 
+import classify_cache
 import config
+import collector
+import decision_trace
+import dup_index
+import parse_pool
+import pipeline
+import scheduler
+from health import breaker
+from parsers import registry
 from user_limits import user_price_limits
-from utils import detect_type, is_south, is_price_ok, save_to_csv
+import utils
+from utils import is_price_ok, save_to_csv
 
 # notifier и db (db — опционально)
 import notifier
 try:
-    from db import save_new_items as db_save_new_items
+    from db import save_new_items as db_save_new_items, mark_seen as db_mark_seen, known_links as db_known_links
     DB_MODULE_AVAILABLE = True
 except Exception:
     DB_MODULE_AVAILABLE = False
@@ -39,6 +49,9 @@ LIMIT_OPTIONS = {
     "finca": [200000, 250000, 300000, 350000]
 }
 
+# запущенный AdaptiveScheduler (для /sources)
+_SCHEDULER = None
+
 
 # --------------------------
 # Minimal HTTP server helper
@@ -56,6 +69,17 @@ def start_http_server_in_background():
 
     class _Handler(SimpleHTTPRequestHandler):
         def do_GET(self):
+            if self.path.rstrip("/") == "/sources":
+                # состояние источников: circuit breaker + адаптивный планировщик
+                data = {"health": breaker.snapshot(), "parser_errors": registry.errors()}
+                if _SCHEDULER is not None:
+                    data["schedule"] = _SCHEDULER.status()
+                body = json.dumps(data, ensure_ascii=False, indent=1).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-type", "application/json; charset=utf-8")
+                self.end_headers()
+                self.wfile.write(body)
+                return
             # возвращаем короткий health-check ответ
             self.send_response(200)
             self.send_header("Content-type", "text/plain; charset=utf-8")
@@ -159,62 +183,170 @@ async def callback_query_handler(update: Update, context: ContextTypes.DEFAULT_T
 # --------------------------
 # Collect & notify
 # --------------------------
+def _price_int(v):
+    try:
+        return int(v) if v not in (None, "") else None
+    except Exception:
+        s = "".join(ch for ch in str(v or "") if ch.isdigit())
+        return int(s) if s else None
+
+
+def filter_candidates(results):
+    """Классификация и фильтры: тип, юг, цена. Возвращает кандидатов для БД/уведомлений."""
+    candidates = []
+    todo = []
+    # объявления с неизменившихся страниц (_fingerprint) тоже проходят фильтры: лимиты цен и ключевые
+    # слова могли поменяться, а прошлое сохранение/уведомление — не дойти; повторы отсекает db
+    for it in results:
+        it.setdefault("title", "")
+        it.setdefault("address", "")
+        it.setdefault("description", "")
+        it.setdefault("price", None)
+        todo.append(it)
+    # detect_type / is_south — CPU: уже встречавшиеся объявления берутся из classify_cache,
+    # остальные большими пачками считаются в процессах parse_pool
+    try:
+        verdicts = classify_cache.classify(todo, parse_pool.classify)
+    except Exception as e:
+        print("classify error:", e)
+        print(traceback.format_exc())
+        return candidates
+    # цена к int — как и раньше, только у объявлений с типом
+    prices = [_price_int(it.get("price")) if v[0] else None for it, v in zip(todo, verdicts)]
+    if utils.NUMPY_AVAILABLE:
+        # юг по координатам (GEO_FILTER) и лимиты цен — над всей пачкой сразу
+        try:
+            mask, reasons = utils.classify_batch(todo, verdicts, prices)
+        except Exception as e:
+            print("classify_batch error:", e)
+            print(traceback.format_exc())
+            return candidates
+        decision_trace.record(todo, verdicts, prices, reasons)
+        for it, v, price, reason, ok in zip(todo, verdicts, prices, reasons, mask):
+            it["detected_type"] = v[0]
+            if reason in ("no type", "not south"):
+                continue
+            it["price"] = price
+            if ok:
+                candidates.append(it)
+        return candidates
+    # для трассировки — объявления до замены price на int
+    traced = [dict(it) for it in todo] if decision_trace.enabled() else todo
+    reasons = []
+    for it, v, price in zip(todo, verdicts, prices):
+        try:
+            it["detected_type"] = v[0]
+            if not it["detected_type"]:
+                reasons.append("no type")
+                continue
+            if not v[1]:
+                reasons.append("not south")
+                continue
+            it["price"] = price
+            if is_price_ok(it):
+                candidates.append(it)
+                reasons.append("ok")
+            elif utils.normalize_price(price) is None:
+                reasons.append("no price")
+            else:
+                reasons.append("over price limit")
+        except Exception as e:
+            reasons.append(f"error: {e}")
+            print("item processing error:", e)
+            print(traceback.format_exc())
+    decision_trace.record(traced, verdicts, prices, reasons)
+    return candidates
+
+
+def save_new(candidates, results):
+    """Сохраняет кандидатов в БД (если включена) и возвращает только новые."""
+    new_items = candidates
+    if config.SETTINGS.get("enable_db", False) and DB_MODULE_AVAILABLE:
+        try:
+            new_items = db_save_new_items(candidates)
+            print(f"DB: {len(new_items)} new items saved")
+        except Exception as e:
+            print("DB save error:", e)
+            print(traceback.format_exc())
+        # все собранные ссылки (и не прошедшие фильтры) — для incremental crawl
+        try:
+            db_mark_seen([it.get("link") for it in results])
+        except Exception as e:
+            print("DB mark_seen error:", e)
+    return new_items
+
+
+def notify(new_items, bot):
+    if new_items:
+        try:
+            notifier.notify_new_items(new_items, bot=bot)
+            print(f"Notified {len(new_items)} items")
+        except Exception as e:
+            print("Notify error:", e)
+            print(traceback.format_exc())
+    else:
+        print("No new items to notify")
+
+
+def log_filter_stats():
+    """Статистика за цикл отбора: кэш классификации, трассировка решений, индекс дубликатов."""
+    classify_cache.log_stats()
+    decision_trace.log_stats()
+    dup_index.log_stats()
+
+
+def stream_and_notify(sources, bot, max_pages, delay):
+    """
+    Потоковый вариант сбора (pipeline.py): объявления фильтруются, пишутся в БД и уходят
+    в Telegram по мере разбора страниц. Возвращает (summary, candidates, fresh),
+    fresh — ссылок, которых раньше не видели (None без БД).
+    """
+    all_candidates = []
+    counters = {"fresh": None}
+    track_fresh = config.SETTINGS.get("enable_db", False) and DB_MODULE_AVAILABLE
+
+    def classify(batch):
+        if track_fresh:
+            try:
+                known = db_known_links()
+                n = sum(1 for it in batch if it.get("link") and it.get("link") not in known)
+                counters["fresh"] = (counters["fresh"] or 0) + n
+            except Exception as e:
+                print("known links lookup error:", e)
+        candidates = filter_candidates(batch)
+        all_candidates.extend(candidates)
+        return candidates
+
+    summary = pipeline.run(
+        sources, max_pages, delay,
+        classify=classify,
+        dedupe=save_new,
+        notify=lambda new_items: notify(new_items, bot),
+    )
+    log_filter_stats()
+    return summary, all_candidates, counters["fresh"]
+
+
 def collect_and_notify(bot):
     try:
         print("Collect: starting")
-        results = []
         sources = getattr(config, "SOURCES", [])
         max_pages = config.SETTINGS.get("max_pages_per_source", 1)
         delay = config.SETTINGS.get("delay_between_requests", 1.2)
 
-        for module_path, start_url, friendly_name in sources:
-            try:
-                mod = importlib.import_module(module_path)
-            except Exception as e:
-                print(f"[{friendly_name}] import error: {e}")
-                continue
-
-            if not hasattr(mod, "get_listings"):
-                print(f"[{friendly_name}] parser has no get_listings(), skipping")
-                continue
+        if config.SETTINGS.get("streaming_pipeline", False):
+            _summary, candidates, _fresh = stream_and_notify(sources, bot, max_pages, delay)
+            print(f"Collect: candidates after filter = {len(candidates)}")
+            if config.SETTINGS.get("save_to_csv", True):
+                csv_path = save_to_csv(candidates)
+                if csv_path:
+                    print("Saved CSV:", csv_path)
+            return
 
-            try:
-                found = mod.get_listings(start_url, max_pages=max_pages, delay=delay, source_name=friendly_name)
-                if not isinstance(found, list):
-                    print(f"[{friendly_name}] parser returned non-list, skipping")
-                    continue
-                for it in found:
-                    it.setdefault("source", friendly_name)
-                print(f"[{friendly_name}] collected {len(found)} items")
-                results.extend(found)
-            except Exception as e:
-                print(f"[{friendly_name}] runtime error: {e}")
-                print(traceback.format_exc())
-
-        candidates = []
-        for it in results:
-            try:
-                it.setdefault("title", "")
-                it.setdefault("address", "")
-                it.setdefault("description", "")
-                it.setdefault("price", None)
-                it["detected_type"] = detect_type(it)
-                if not it["detected_type"]:
-                    continue
-                if not is_south(it):
-                    continue
-                try:
-                    it["price"] = int(it["price"]) if it.get("price") not in (None, "") else None
-                except Exception:
-                    s = str(it.get("price") or "")
-                    s = "".join(ch for ch in s if ch.isdigit())
-                    it["price"] = int(s) if s else None
-                if is_price_ok(it):
-                    candidates.append(it)
-            except Exception as e:
-                print("item processing error:", e)
-                print(traceback.format_exc())
+        # все источники параллельно (см. collector.py)
+        results = collector.collect_sources(sources, max_pages, delay)
 
+        candidates = filter_candidates(results)
         print(f"Collect: candidates after filter = {len(candidates)}")
 
         if config.SETTINGS.get("save_to_csv", True):
@@ -222,36 +354,87 @@ def collect_and_notify(bot):
             if csv_path:
                 print("Saved CSV:", csv_path)
 
-        new_items = candidates
+        new_items = save_new(candidates, results)
+        notify(new_items, bot)
+        log_filter_stats()
+
+    except Exception as e:
+        print("Collect_and_notify critical error:", e)
+        print(traceback.format_exc())
+
+
+def save_source_csv(candidates, friendly_name):
+    """
+    CSV кандидатов одного опроса источника (adaptive_schedule). Опрос бывает раз в несколько минут,
+    поэтому файл пишется только при SETTINGS["save_source_csv"] (и общем save_to_csv).
+    """
+    s = config.SETTINGS
+    if not candidates or not s.get("save_to_csv", True) or not s.get("save_source_csv", False):
+        return
+    slug = "".join(ch if ch.isalnum() else "_" for ch in friendly_name.lower())
+    ts = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+    save_to_csv(candidates, filename=f"candidates_{slug}_{ts}.csv")
+
+
+def collect_source_and_notify(source, bot):
+    """
+    Один источник как независимая задача адаптивного планировщика.
+    Возвращает (число новых ссылок, исход опроса collector.source_status) — по ним
+    планировщик подстраивает интервал.
+    """
+    module_path, start_url, friendly_name = source
+    max_pages = config.SETTINGS.get("max_pages_per_source", 1)
+    delay = config.SETTINGS.get("delay_between_requests", 1.2)
+
+    if config.SETTINGS.get("streaming_pipeline", False):
+        summary, candidates, fresh = stream_and_notify([source], bot, max_pages, delay)
+        if fresh is None:
+            fresh = summary["new"]
+    else:
+        results = collector.collect_sources([source], max_pages, delay)
+
+        # темп новых объявлений меряем по ссылкам, которых раньше не видели (до фильтров)
+        fresh = None
         if config.SETTINGS.get("enable_db", False) and DB_MODULE_AVAILABLE:
             try:
-                new_items = db_save_new_items(candidates)
-                print(f"DB: {len(new_items)} new items saved")
+                known = db_known_links()
+                fresh = sum(1 for it in results if it.get("link") and it.get("link") not in known)
             except Exception as e:
-                print("DB save error:", e)
-                print(traceback.format_exc())
+                print(f"[{friendly_name}] known links lookup error:", e)
 
-        if new_items:
-            try:
-                notifier.notify_new_items(new_items, bot=bot)
-                print(f"Notified {len(new_items)} items")
-            except Exception as e:
-                print("Notify error:", e)
-                print(traceback.format_exc())
-        else:
-            print("No new items to notify")
+        candidates = filter_candidates(results)
+        new_items = save_new(candidates, results)
+        notify(new_items, bot)
+        log_filter_stats()
+        if fresh is None:
+            fresh = len(new_items)
 
-    except Exception as e:
-        print("Collect_and_notify critical error:", e)
-        print(traceback.format_exc())
+    print(f"[{friendly_name}] candidates after filter = {len(candidates)}")
+    save_source_csv(candidates, friendly_name)
+    return fresh, collector.source_status(friendly_name)
 
 
 # --------------------------
 # Periodic collect
 # --------------------------
 def start_periodic_collect(app):
+    global _SCHEDULER
     interval = config.SETTINGS.get("collect_interval_seconds", 3600)
 
+    if config.SETTINGS.get("adaptive_schedule", True):
+        # каждый источник — своя задача со своим интервалом (scheduler.py)
+        def run_source(source):
+            try:
+                bot = app.bot
+            except Exception:
+                bot = None
+            return collect_source_and_notify(source, bot)
+
+        sched = scheduler.AdaptiveScheduler(getattr(config, "SOURCES", []), run_source)
+        sched.start()
+        _SCHEDULER = sched
+        return sched
+
     def job():
         time.sleep(5)
         while True:
@@ -287,6 +470,9 @@ def main():
     except Exception:
         pass
 
+    # проверка config.SOURCES без импорта парсеров: о битых источниках — один раз здесь
+    registry.validate_sources(getattr(config, "SOURCES", []))
+
     # Start a minimal HTTP server so Render Web Service sees an open port
     start_http_server_in_background()
 
@@ -0,0 +1,255 @@
+# classify_cache.py
+# Кэш классификации объявлений: detect_type / is_south для объявления, которое уже встречалось
+# с тем же текстом и ценой, не пересчитываются (большинство объявлений каждый час приходят без изменений).
+# - ключ: хэш нормализованных title/address/description/price + версия таблиц config
+#   (TYPE_KEYWORDS, SOUTH_KEYWORDS, SOUTH_BLACKLIST, SOUTH_MUNICIPALITIES, пороги нечёткого поиска,
+#   версия справочника мест)
+# - в процессе: LRU на classify_cache_size записей; за ним — SQLite (CLASSIFY_CACHE_PATH), переживает рестарт
+# - поменяли ключевые слова или пороги — меняется версия: старые записи не находятся и при
+#   первом обращении с новой версией удаляются с диска
+# Не кэшируются объявления с координатами при включённом GEO_FILTER или справочнике: там is_south решают lat/lon.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+CACHE_PATH = os.getenv("CLASSIFY_CACHE_PATH", "classify_cache.db")
+MAX_ROWS = int(os.getenv("CLASSIFY_CACHE_MAX_ROWS", 200000))
+
+# поднять, если поменялась сама логика detect_type / is_south (а не только таблицы config)
+LOGIC_VERSION = 2
+
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS classify_cache (
+    key TEXT PRIMARY KEY,
+    version TEXT,
+    detected_type TEXT,
+    south INTEGER,
+    evidence TEXT,
+    last_access REAL
+);
+"""
+
+_SQL_CHUNK = 500
+
+_lock = threading.Lock()
+_conn = None
+_conn_version = None
+_lru = OrderedDict()
+
+STATS = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stored": 0}
+
+
+def enabled():
+    return bool(config.SETTINGS.get("classify_cache", True))
+
+
+def version_stamp():
+    """Хэш таблиц config и порогов, от которых зависит результат классификации."""
+    import utils
+    gz = utils.gazetteer_index()
+    tables = {
+        "logic": LOGIC_VERSION,
+        "type_keywords": config.TYPE_KEYWORDS,
+        "south_keywords": getattr(config, "SOUTH_KEYWORDS", []) or [],
+        "south_blacklist": getattr(config, "SOUTH_BLACKLIST", []) or [],
+        "fuzzy": utils.FUZZY_THRESHOLD,
+        "token_fuzzy": utils.TOKEN_FUZZY_THRESHOLD,
+        "gazetteer": gz.version if gz is not None else None,
+        "south_municipalities": getattr(config, "SOUTH_MUNICIPALITIES", []) or [],
+    }
+    data = json.dumps(tables, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+def item_key(item, version):
+    from utils import text_norm
+    price = item.get("price")
+    parts = [text_norm(item.get(k, "") or "") for k in ("title", "address", "description")]
+    parts.append("" if price is None else str(price).strip())
+    parts.append(version)
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8", "replace"), digest_size=16).hexdigest()
+
+
+def _cacheable(item):
+    geo_conf = getattr(config, "GEO_FILTER", None)
+    if (not geo_conf or not geo_conf.get("enabled", False)) and not config.SETTINGS.get("gazetteer", True):
+        return True
+    lat = item.get("lat") or item.get("latitude") or item.get("geo_lat")
+    lon = item.get("lon") or item.get("longitude") or item.get("geo_lon")
+    return lat is None or lon is None
+
+
+def _get_conn(version):
+    global _conn, _conn_version
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_PATH, timeout=30, check_same_thread=False)
+        _conn.execute(CREATE_SQL)
+        columns = {row[1] for row in _conn.execute("PRAGMA table_info(classify_cache)")}
+        if "evidence" not in columns:
+            _conn.execute("ALTER TABLE classify_cache ADD COLUMN evidence TEXT")
+    if _conn_version != version:
+        # таблицы config поменялись: записи других версий больше никогда не совпадут
+        cur = _conn.execute("DELETE FROM classify_cache WHERE version != ?", (version,))
+        if cur.rowcount:
+            print(f"[classify_cache] keyword tables changed, dropped {cur.rowcount} cached verdicts")
+        _conn.commit()
+        _lru.clear()
+        _conn_version = version
+    return _conn
+
+
+def _remember(key, verdict):
+    _lru[key] = verdict
+    _lru.move_to_end(key)
+    limit = int(config.SETTINGS.get("classify_cache_size", 20000))
+    while len(_lru) > limit:
+        _lru.popitem(last=False)
+
+
+def lookup(items, version):
+    """
+    Кэшированные вердикты: список той же длины, (detected_type, south, evidence) или None для промахов,
+    и ключи объявлений (None — объявление не кэшируется).
+    """
+    keys = [item_key(it, version) if _cacheable(it) else None for it in items]
+    out = [None] * len(items)
+    pending = {}
+    with _lock:
+        for i, key in enumerate(keys):
+            if key is None:
+                continue
+            verdict = _lru.get(key)
+            if verdict is not None:
+                _lru.move_to_end(key)
+                out[i] = verdict
+                STATS["memory_hits"] += 1
+            else:
+                pending.setdefault(key, []).append(i)
+    if not pending:
+        return out, keys
+    rows = []
+    try:
+        with _lock:
+            conn = _get_conn(version)
+            wanted = list(pending)
+            for n in range(0, len(wanted), _SQL_CHUNK):
+                chunk = wanted[n:n + _SQL_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows.extend(conn.execute(
+                    f"SELECT key, detected_type, south, evidence FROM classify_cache WHERE version = ? AND key IN ({marks})",
+                    [version] + chunk,
+                ).fetchall())
+            if rows:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE classify_cache SET last_access = ? WHERE key = ?", [(now, r[0]) for r in rows]
+                )
+                conn.commit()
+    except Exception as e:
+        print("[classify_cache] read error:", e)
+        rows = []
+    with _lock:
+        for key, detected_type, south, evidence in rows:
+            try:
+                evidence = json.loads(evidence) if evidence else None
+            except ValueError:
+                evidence = None
+            verdict = (detected_type, bool(south), evidence)
+            _remember(key, verdict)
+            for i in pending.pop(key, ()):
+                out[i] = verdict
+                STATS["disk_hits"] += 1
+        STATS["misses"] += sum(len(v) for v in pending.values())
+    return out, keys
+
+
+def store(pairs, version):
+    """pairs: [(key, (detected_type, south[, evidence]))] — посчитанные заново вердикты."""
+    pairs = [(k, v) for k, v in pairs if k is not None]
+    if not pairs:
+        return
+    now = time.time()
+    try:
+        with _lock:
+            for key, verdict in pairs:
+                _remember(key, verdict)
+            conn = _get_conn(version)
+            conn.executemany(
+                "INSERT OR REPLACE INTO classify_cache (key, version, detected_type, south, evidence, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (k, version, v[0], 1 if v[1] else 0,
+                     json.dumps(v[2], ensure_ascii=False) if len(v) > 2 and v[2] is not None else None, now)
+                    for k, v in pairs
+                ],
+            )
+            conn.commit()
+            STATS["stored"] += len(pairs)
+    except Exception as e:
+        print("[classify_cache] write error:", e)
+
+
+def _prune():
+    with _lock:
+        if _conn is None:
+            return
+        try:
+            count = _conn.execute("SELECT COUNT(*) FROM classify_cache").fetchone()[0]
+            if count > MAX_ROWS:
+                _conn.execute(
+                    "DELETE FROM classify_cache WHERE key IN "
+                    "(SELECT key FROM classify_cache ORDER BY last_access LIMIT ?)",
+                    (count - MAX_ROWS,),
+                )
+                _conn.commit()
+        except Exception as e:
+            print("[classify_cache] prune error:", e)
+
+
+def classify(items, compute):
+    """
+    [(detected_type, south, evidence)] для каждого объявления; compute(items) считает промахи кэша
+    (parse_pool.classify и т.п.) и вызывается только для них.
+    """
+    if not enabled() or not items:
+        return compute(items)
+    version = version_stamp()
+    out, keys = lookup(items, version)
+    # одинаковые объявления (одно и то же с нескольких страниц/агентств) считаются один раз
+    todo, first = [], {}
+    for i, v in enumerate(out):
+        if v is None and (keys[i] is None or keys[i] not in first):
+            if keys[i] is not None:
+                first[keys[i]] = i
+            todo.append(i)
+    if todo:
+        fresh = compute([items[i] for i in todo])
+        for i, verdict in zip(todo, fresh):
+            out[i] = tuple(verdict)
+        for i, v in enumerate(out):
+            if v is None:
+                out[i] = out[first[keys[i]]]
+        store([(keys[i], out[i]) for i in todo], version)
+    return out
+
+
+def log_stats():
+    total = STATS["memory_hits"] + STATS["disk_hits"] + STATS["misses"]
+    if not total:
+        return
+    hits = STATS["memory_hits"] + STATS["disk_hits"]
+    print(
+        f"[classify_cache] {hits}/{total} verdicts from cache ({100.0 * hits / total:.0f}%: "
+        f"{STATS['memory_hits']} memory, {STATS['disk_hits']} disk), {STATS['stored']} stored, "
+        f"{len(_lru)} in memory"
+    )
+    for k in STATS:
+        STATS[k] = 0
+    _prune()
@@ -0,0 +1,350 @@
+# collector.py
+# Асинхронный движок сбора объявлений со всех config.SOURCES.
+# - все источники опрашиваются параллельно (asyncio + aiohttp)
+# - глобальный лимит соединений и лимит одновременных запросов на один хост
+# - вежливая пауза между запросами к одному хосту — общий token bucket из parsers._common
+# - парсеры с async_get_listings(fetch, ...) работают нативно,
+#   старые get_listings(start_url, max_pages, delay, source_name) — через адаптер в пуле потоков
+# - объявления парсеров на выходе становятся listing.Listing (слоты, интернированный source)
+
+import asyncio
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import config
+import parse_pool
+from health import breaker
+from listing import Listing, listings
+from parsers import _http_cache, _fingerprint, _selector_profiles, registry
+from parsers._common import (
+    BASE_HEADERS, _choose_ua, log_pool_stats, get_rate_limiter, transport_overridden, HARD_FAIL_STATUSES,
+)
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except Exception:
+    aiohttp = None
+    AIOHTTP_AVAILABLE = False
+
+DEFAULT_MAX_CONNECTIONS = 16
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 2
+FETCH_TIMEOUT = 20
+
+# исход последнего опроса источника (для планировщика): ok — опрошен (пусть и без объявлений),
+# failed — ошибка загрузки парсера или разбора, skipped — не опрашивался (circuit open)
+SOURCE_OK = "ok"
+SOURCE_FAILED = "failed"
+SOURCE_SKIPPED = "skipped"
+_last_status = {}
+
+
+def _host(url):
+    try:
+        return urlparse(url).netloc.lower()
+    except Exception:
+        return ""
+
+
+def load_parser(module_path, friendly_name):
+    """Модуль парсера из реестра (импорт и проверка один раз); None, если источник неисправен."""
+    return registry.load(module_path, friendly_name)
+
+
+def source_max_pages(friendly_name, max_pages):
+    """Страниц за опрос для источника: SETTINGS['pages_per_source'] или общий max_pages_per_source."""
+    per_source = config.SETTINGS.get("pages_per_source") or {}
+    try:
+        return max(1, int(per_source.get(friendly_name, max_pages)))
+    except (TypeError, ValueError):
+        return max_pages
+
+
+def source_delay(friendly_name, delay):
+    """Пауза между запросами для источника: SETTINGS['delay_per_source'] или общая."""
+    per_source = config.SETTINGS.get("delay_per_source") or {}
+    try:
+        return float(per_source.get(friendly_name, delay))
+    except (TypeError, ValueError):
+        return delay
+
+
+def _accept_result(found, friendly_name):
+    if not isinstance(found, list):
+        print(f"[{friendly_name}] parser returned non-list, skipping")
+        return []
+    found = listings(found)
+    for it in found:
+        it.setdefault("source", friendly_name)
+    print(f"[{friendly_name}] collected {len(found)} items")
+    return found
+
+
+def fetch_mark(start_url):
+    """Снимок счётчиков fetch-слоя для хоста источника перед опросом (см. _fetch_error)."""
+    return start_url, get_rate_limiter(start_url).fetch_counts()
+
+
+def _fetch_error(mark):
+    """
+    Парсеры превращают 403/429/5xx и сетевые ошибки в None и идут дальше, так что заблокированный
+    источник выглядит как пустой опрос. Отказ — ни одной страницы хоста не скачано, а неудачи были
+    (или хост в fast-fail); «скачано, но объявлений нет» — нормальный опрос.
+    """
+    start_url, (fetched0, failed0) = mark
+    limiter = get_rate_limiter(start_url)
+    fetched, failed = limiter.fetch_counts()
+    if fetched > fetched0:
+        return None
+    if failed > failed0 or limiter.is_failing():
+        return f"no page fetched ({failed - failed0} fetch errors)"
+    return None
+
+
+def record_health(friendly_name, error, mark=None):
+    """
+    Итог опроса источника для circuit breaker и планировщика (source_status).
+    Отказ — error (загрузка парсера, ошибка разбора) или ни одной скачанной страницы
+    (mark — fetch_mark() перед опросом); пустая выдача при скачанных страницах — нормальный опрос.
+    """
+    if error is None and mark is not None:
+        error = _fetch_error(mark)
+    _last_status[friendly_name] = SOURCE_OK if error is None else SOURCE_FAILED
+    breaker.record(friendly_name, error is None, error)
+
+
+def source_status(friendly_name):
+    """Исход последнего опроса источника: SOURCE_OK / SOURCE_FAILED / SOURCE_SKIPPED."""
+    return _last_status.get(friendly_name, SOURCE_OK)
+
+
+def admit(sources, max_pages):
+    """
+    Circuit breaker: убирает источники в состоянии open, для half-open
+    оставляет пробный опрос в одну страницу. Возвращает [(source, max_pages)].
+    """
+    admitted = []
+    for src in sources:
+        allowed, probe = breaker.allow(src[2])
+        if not allowed:
+            print(f"[{src[2]}] circuit open, skipping")
+            _last_status[src[2]] = SOURCE_SKIPPED
+            continue
+        if probe:
+            print(f"[{src[2]}] circuit half-open, probing 1 page")
+        admitted.append((src, 1 if probe else source_max_pages(src[2], max_pages)))
+    return admitted
+
+
+def iter_source(mod, start_url, max_pages, delay, friendly_name):
+    """
+    Потоковый протокол: объявления источника по мере разбора страниц.
+    Парсеры с iter_listings отдают их постранично; старые (только get_listings) — одной пачкой.
+    """
+    if hasattr(mod, "iter_listings"):
+        for it in mod.iter_listings(start_url, max_pages=max_pages, delay=delay, source_name=friendly_name):
+            it = Listing.of(it)
+            it.setdefault("source", friendly_name)
+            yield it
+        return
+    found = mod.get_listings(start_url, max_pages=max_pages, delay=delay, source_name=friendly_name)
+    yield from _accept_result(found, friendly_name)
+
+
+# --------------------------
+# Sequential path (без aiohttp)
+# --------------------------
+def collect_sources_sync(sources, max_pages, delay):
+    results = []
+    for (module_path, start_url, friendly_name), pages in admit(sources, max_pages):
+        mod = load_parser(module_path, friendly_name)
+        if mod is None or not hasattr(mod, "get_listings"):
+            record_health(friendly_name, "parser not loadable")
+            continue
+        src_delay = source_delay(friendly_name, delay)
+        found, error = [], None
+        mark = fetch_mark(start_url)
+        try:
+            found = mod.get_listings(start_url, max_pages=pages, delay=src_delay, source_name=friendly_name)
+            found = _accept_result(found, friendly_name)
+            results.extend(found)
+        except Exception as e:
+            error = f"runtime error: {e}"
+            print(f"[{friendly_name}] runtime error: {e}")
+            print(traceback.format_exc())
+        record_health(friendly_name, error, mark)
+    return results
+
+
+# --------------------------
+# Async engine
+# --------------------------
+class HostGate:
+    """Ограничивает параллелизм и частоту запросов к одному хосту."""
+
+    def __init__(self, url, max_concurrent):
+        self.sem = asyncio.Semaphore(max_concurrent)
+        # тот же лимитер, что и у блокирующих safe_get/_fetch — темп хоста общий
+        self.limiter = get_rate_limiter(url)
+
+    async def wait_turn(self):
+        wait = self.limiter.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_NOT_CACHED = object()
+
+
+class AsyncFetcher:
+    def __init__(self, session, max_per_host):
+        self.session = session
+        self.max_per_host = max_per_host
+        self.gates = {}
+
+    def gate(self, url):
+        host = _host(url)
+        g = self.gates.get(host)
+        if g is None:
+            g = HostGate(url, self.max_per_host)
+            self.gates[host] = g
+        return g
+
+    async def fetch_text(self, url, timeout=FETCH_TIMEOUT):
+        """Возвращает текст страницы или None (аналог agency_template._fetch)."""
+        gate = self.gate(url)
+        if gate.limiter.is_failing():
+            print(f"[fetch skipped] host is failing, fast-fail for url: {url}")
+            return None
+        async with gate.sem:
+            await gate.wait_turn()
+            cond = _http_cache.conditional_headers(url)
+            try:
+                text = await self._get(gate, url, cond, timeout)
+                if text is _NOT_CACHED:
+                    # 304, но запись кэша вытеснена или повреждена — обычный запрос (как в safe_get)
+                    await gate.wait_turn()
+                    text = await self._get(gate, url, {}, timeout)
+                return text
+            except Exception as e:
+                print(f"[fetch error] {e} for url: {url}")
+                gate.limiter.record_failure()
+                return None
+
+    async def _get(self, gate, url, cond, timeout):
+        """Один GET: текст, None при ошибке или _NOT_CACHED — 304 без тела в кэше."""
+        headers = {"User-Agent": _choose_ua()}
+        headers.update(cond)
+        async with self.session.get(
+            url,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            allow_redirects=True,
+        ) as r:
+            if r.status == 304 and cond:
+                entry = _http_cache.cached_entry(url)
+                if entry is None:
+                    return _NOT_CACHED
+                gate.limiter.on_success()
+                content, _ctype, encoding = entry
+                return content.decode(encoding or "utf-8", errors="replace")
+            if r.status == 429:
+                gate.limiter.penalize(r.headers.get("Retry-After"))
+            if r.status != 200:
+                print(f"[fetch error] {r.status} for url: {url}")
+                if r.status in HARD_FAIL_STATUSES:
+                    gate.limiter.record_failure()
+                return None
+            gate.limiter.on_success()
+            content = await r.read()
+            _http_cache.store(url, r.headers, content, r.charset)
+            return content.decode(r.charset or "utf-8", errors="replace")
+
+
+async def _collect_one(fetcher, executor, global_sem, source, max_pages, delay):
+    module_path, start_url, friendly_name = source
+    mod = load_parser(module_path, friendly_name)
+    if mod is None:
+        record_health(friendly_name, "parser not loadable")
+        return []
+    delay = source_delay(friendly_name, delay)
+    found, error = [], None
+    mark = fetch_mark(start_url)
+    try:
+        if hasattr(mod, "async_get_listings") and not transport_overridden():
+            # нативный путь: запросы идут через общий aiohttp-пул и HostGate
+            # (при записи/воспроизведении фикстур — через requests-адаптер, как старые парсеры)
+            found = await mod.async_get_listings(
+                fetcher.fetch_text, start_url, max_pages=max_pages, delay=delay, source_name=friendly_name
+            )
+        else:
+            # адаптер для старых блокирующих парсеров: отдельный поток,
+            # но под тем же глобальным и per-host лимитом
+            gate = fetcher.gate(start_url)
+            async with global_sem, gate.sem:
+                loop = asyncio.get_running_loop()
+                found = await loop.run_in_executor(
+                    executor,
+                    lambda: mod.get_listings(start_url, max_pages=max_pages, delay=delay, source_name=friendly_name),
+                )
+        found = _accept_result(found, friendly_name)
+    except Exception as e:
+        error = f"runtime error: {e}"
+        print(f"[{friendly_name}] runtime error: {e}")
+        print(traceback.format_exc())
+        found = []
+    record_health(friendly_name, error, mark)
+    return found
+
+
+async def collect_sources_async(sources, max_pages, delay):
+    max_conn = int(config.SETTINGS.get("max_connections", DEFAULT_MAX_CONNECTIONS))
+    max_per_host = int(config.SETTINGS.get("max_connections_per_host", DEFAULT_MAX_CONNECTIONS_PER_HOST))
+
+    connector = aiohttp.TCPConnector(limit=max_conn, limit_per_host=max_per_host)
+    global_sem = asyncio.Semaphore(max_conn)
+    executor = ThreadPoolExecutor(max_workers=max_conn, thread_name_prefix="collect")
+    t0 = time.monotonic()
+    try:
+        # trust_env=True — прокси из HTTP_PROXY/HTTPS_PROXY, как в create_session()
+        async with aiohttp.ClientSession(connector=connector, headers=BASE_HEADERS, trust_env=True) as session:
+            fetcher = AsyncFetcher(session, max_per_host)
+            tasks = [
+                _collect_one(fetcher, executor, global_sem, src, pages, delay)
+                for src, pages in admit(sources, max_pages)
+            ]
+            per_source = await asyncio.gather(*tasks)
+    finally:
+        executor.shutdown(wait=False)
+
+    results = []
+    for found in per_source:
+        results.extend(found)
+    print(f"Collect: {len(sources)} sources done in {time.monotonic() - t0:.1f}s")
+    return results
+
+
+def collect_sources(sources, max_pages, delay):
+    """
+    Собирает объявления со всех источников и возвращает общий список dict.
+    Вызывается из потока сбора (не из event loop телеграм-бота).
+    """
+    if not sources:
+        return []
+    if not AIOHTTP_AVAILABLE or not config.SETTINGS.get("async_collect", True):
+        results = collect_sources_sync(sources, max_pages, delay)
+    else:
+        results = asyncio.run(collect_sources_async(sources, max_pages, delay))
+    log_cycle_stats()
+    return results
+
+
+def log_cycle_stats():
+    """Статистика за цикл сбора: пулы соединений, кэши, профили селекторов, процессы разбора."""
+    log_pool_stats()
+    _http_cache.log_stats()
+    _fingerprint.log_stats()
+    _selector_profiles.log_stats()
+    parse_pool.log_stats()
@@ -5,10 +5,52 @@ import os
 # -----------------------------
 SETTINGS = {
     "max_pages_per_source": 2,        # максимум страниц на одно агентство
-    "delay_between_requests": 1.5,    # задержка между запросами (сек)
+    "pages_per_source": {             # своё число страниц для отдельных источников (по friendly name):
+        "Idealista": 10,              # с ранней остановкой пагинации (EARLY_STOP) или на первичный backfill
+    },
+    "incremental_crawl": True,        # не листать дальше страницы, где все ссылки уже известны (db)
+    "delay_between_requests": 1.5,    # задержка между запросами к одному хосту (сек)
+    "delay_per_source": {             # своя задержка для отдельных источников (по friendly name)
+        # "Fotocasa": 3.0,
+    },
+    "rate_limit_burst": 1,            # сколько запросов к хосту можно сделать подряд без паузы
+    "parse_engine": "lxml",           # agency_template: "lxml" (скомпилированные XPath) или "soup" (BeautifulSoup)
+    "selector_profiles": True,        # запоминать рабочие селекторы по доменам (parsers/_selector_profiles.py)
+    "parse_pool": True,               # разбор list pages и классификация в отдельных процессах (parse_pool.py)
+    "parse_processes": 0,             # сколько процессов; 0 — cpu_count - 1 (на 1 ядре пул не запускается)
+    "parse_pool_min_batch": 200,      # меньше стольких объявлений классифицируем на месте
+    "detail_workers": 4,              # параллельная догрузка detail pages (agency_template)
+    "host_fail_fast_after": 3,        # после стольких 403/429/5xx/сетевых ошибок подряд хост пропускается...
+    "host_fail_fast_seconds": 300,    # ...на это время (сек)
+    "circuit_breaker": True,          # пропускать источники, которые стабильно падают (health.py)
+    "breaker_failure_threshold": 3,   # неудачных опросов подряд до состояния open
+    "breaker_cooldown_seconds": 900,  # пауза до пробного опроса (удваивается при повторной неудаче)
+    "breaker_max_cooldown": 6 * 3600,
     "save_to_csv": True,              # сохранять найденные объекты в CSV
+    "save_source_csv": False,         # ...и отдельный CSV на каждый опрос источника (adaptive_schedule, до раза в 5 минут)
     "enable_db": True,                # включить сохранение в базу данных
-    "collect_interval_seconds": 3600  # интервал автосбора (сек) = 1 час
+    "dup_index": True,                # поиск почти-дубликатов по индексу MinHash/LSH (dup_index.py), а не по всей таблице
+    "collect_interval_seconds": 3600, # интервал автосбора (сек) = 1 час (стартовый при adaptive_schedule)
+    "adaptive_schedule": True,        # свой интервал опроса для каждого источника (scheduler.py)
+    "poll_min_seconds": 300,          # не чаще раза в 5 минут на источник
+    "poll_max_seconds": 6 * 3600,     # и не реже раза в 6 часов
+    "scheduler_workers": 4,           # сколько источников опрашивается одновременно
+    "async_collect": True,            # опрашивать источники параллельно (collector.py, aiohttp)
+    "max_connections": 16,            # глобальный лимит одновременных соединений
+    "max_connections_per_host": 2,    # лимит одновременных запросов к одному хосту
+    "streaming_pipeline": False,      # потоковый конвейер fetch -> classify -> БД -> Telegram (pipeline.py)
+    "stream_queue_size": 200,         # объявлений в очереди между стадиями (backpressure на парсеры)
+    "stream_batch_size": 50,          # сколько объявлений классифицируется за раз
+    "stream_source_workers": 4,       # источников, которые качаются одновременно
+    "http_cache": True,               # conditional GET (ETag/Last-Modified) + дисковый кэш ответов
+    "page_fingerprint": True,         # не парсить list page, если её содержимое не изменилось
+    "classify_cache": True,           # не пересчитывать detect_type/is_south для уже виденных объявлений
+    "classify_cache_size": 20000,     # вердиктов в памяти (LRU); на диске — CLASSIFY_CACHE_PATH
+    "gazetteer": True,                # юг по справочнику мест: координаты -> муниципалитет, названия посёлков
+    "decision_trace": False,          # писать решения фильтра (тип, юг, цена и почему) в outputs/decision_trace.csv.gz
+    "decision_trace_sample": 1.0,     # доля объявлений в трассировке (0..1)
+    "decision_trace_max_mb": 20,      # размер файла трассировки до ротации
+    "decision_trace_backups": 5,      # сколько старых файлов (.1.gz ... .N.gz) хранить
 }
 
 # -----------------------------
@@ -40,22 +82,22 @@ SOURCES = [
     ("parsers.idealista", "https://www.idealista.com/en/venta-viviendas/tenerife/", "Idealista"),
     ("parsers.fotocasa", "https://www.fotocasa.es/en/buy/homes/santa-cruz-de-tenerife-province/all-zones/l", "Fotocasa"),
 
-    # Кастомные агентства (пример — замени URL на реальные)
-    ("parsers.agency1", "https://example1.com/tenerife", "Agency 1"),
-    ("parsers.agency2", "https://example2.com/tenerife", "Agency 2"),
-    ("parsers.agency3", "https://example3.com/tenerife", "Agency 3"),
-    ("parsers.agency4", "https://example4.com/tenerife", "Agency 4"),
-    ("parsers.agency5", "https://example5.com/tenerife", "Agency 5"),
-    ("parsers.agency6", "https://example6.com/tenerife", "Agency 6"),
-    ("parsers.agency7", "https://example7.com/tenerife", "Agency 7"),
-    ("parsers.agency8", "https://example8.com/tenerife", "Agency 8"),
-    ("parsers.agency9", "https://example9.com/tenerife", "Agency 9"),
-    ("parsers.agency10", "https://example10.com/tenerife", "Agency 10"),
-    ("parsers.agency11", "https://example11.com/tenerife", "Agency 11"),
-    ("parsers.agency12", "https://example12.com/tenerife", "Agency 12"),
-    ("parsers.agency13", "https://example13.com/tenerife", "Agency 13"),
-    ("parsers.agency14", "https://example14.com/tenerife", "Agency 14"),
-    ("parsers.agency15", "https://example15.com/tenerife", "Agency 15"),
+    # Агентства (parsers/agency_*.py на общем agency_template)
+    ("parsers.agency_morfitt", "https://www.morfittpropertiestenerife.com/", "Morfitt Properties Tenerife"),
+    ("parsers.agency_all_properties", "https://allpropertiestenerife.com/", "All Properties Tenerife"),
+    ("parsers.agency_asten_realty", "https://www.astenrealty.com/", "ASTEN Realty"),
+    ("parsers.agency_astliz", "https://www.astliz.com/", "Astliz Property"),
+    ("parsers.agency_clear_blue_skies", "https://www.clearbluetenerife.com/", "Clear Blue Skies Group"),
+    ("parsers.agency_engelvokkers", "https://www.engelvoelkers.com/en-es/tenerife/", "Engel & Völkers Tenerife"),
+    ("parsers.agency_feel_good", "https://www.feelgoodpropertiestenerife.com/", "Feel Good Properties Tenerife"),
+    ("parsers.agency_tenerealty", "https://www.tenerealty.com/", "Tenerealty Tenerife"),
+    ("parsers.agency_tenerife_properties", "https://www.tenerifeproperties.es/", "Tenerife Properties"),
+    ("parsers.agency_tenerife_property_agents", "https://www.tenerifepropertyagents.com/", "Tenerife Property Agents"),
+    ("parsers.agency_tenerife_property_consultancy", "https://www.tenerifepropertyconsultancy.com/", "Tenerife Property Consultancy"),
+    ("parsers.agency_tenerife_property_shop", "https://www.tenerifepropertyshop.com/", "Tenerife Property Shop"),
+    ("parsers.agency_tenerife_real", "https://www.tenerifereal.com/", "Tenerife Real"),
+    ("parsers.agency_tenerife_royale", "https://www.teneriferoyale.com/", "Tenerife Royale Estate Agents"),
+    ("parsers.agecy_vim_canarias", "https://tenerifecenter.com/", "VYM Canarias"),
 ]
 
 # -----------------------------
@@ -82,3 +124,7 @@ SOUTH_KEYWORDS = [
     "torviscas", "fanabe", "chayofa", "guaza", "palm mar",
     "las galletas", "amarilla golf", "golf del sur", "san miguel de abona",
 ]
+
+# Муниципалитеты юга для справочника мест (gazetteer.py, data/tenerife_gazetteer.json):
+# по координатам объявления или по названию посёлка в тексте
+SOUTH_MUNICIPALITIES = ["Adeje", "Arona", "San Miguel de Abona"]
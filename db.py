@@ -1,10 +1,14 @@
 # db.py
+import atexit
 import sqlite3
 import os
 import re
+import threading
 from datetime import datetime
 from difflib import SequenceMatcher
 
+import dup_index
+
 DB_PATH = os.getenv("DB_PATH", "props.db")
 CREATE_SQL = """
 CREATE TABLE IF NOT EXISTS listings (
@@ -16,13 +20,60 @@ CREATE TABLE IF NOT EXISTS listings (
     source TEXT,
     first_seen DATETIME DEFAULT CURRENT_TIMESTAMP
 );
+CREATE TABLE IF NOT EXISTS seen_links (
+    link TEXT PRIMARY KEY,
+    first_seen DATETIME DEFAULT CURRENT_TIMESTAMP
+);
 """
 
+# Соединение процесса: WAL (чтение не ждёт записи), synchronous=NORMAL (в WAL не теряет целостность,
+# fsync только на checkpoint), кэш страниц 16 МБ
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
+DUP_THRESHOLD = 0.86
+_SQL_CHUNK = 500
+
+# In-memory множество известных ссылок (listings + seen_links) для incremental crawl:
+# загружается один раз, дальше пополняется при сохранении
+_known_links = None
+_known_lock = threading.Lock()
+
+# долгоживущее соединение (общее для потоков бота и конвейера) — только под _conn_lock
+_conn = None
+_conn_path = None
+_conn_lock = threading.RLock()
+
 def get_conn():
+    """Отдельное соединение (закрывает вызывающий)."""
     conn = sqlite3.connect(DB_PATH, timeout=30)
-    conn.execute(CREATE_SQL)
+    conn.executescript(CREATE_SQL)
     return conn
 
+def _shared_conn():
+    global _conn, _conn_path
+    if _conn is None or _conn_path != DB_PATH:
+        if _conn is not None:
+            _conn.close()
+        conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conn.executescript(CREATE_SQL)
+        _conn, _conn_path = conn, DB_PATH
+    return _conn
+
+def close():
+    global _conn, _conn_path
+    with _conn_lock:
+        if _conn is not None:
+            _conn.close()
+        _conn, _conn_path = None, None
+
+atexit.register(close)
+
 def normalize_text(s: str) -> str:
     if not s:
         return ""
@@ -34,7 +85,21 @@ def normalize_text(s: str) -> str:
 def similar(a: str, b: str) -> float:
     return SequenceMatcher(None, a, b).ratio()
 
-def is_duplicate(conn: sqlite3.Connection, link: str, title: str, address: str, threshold: float = 0.86) -> bool:
+def any_similar(keys, key: str, threshold: float = DUP_THRESHOLD) -> bool:
+    """similar(existing, key) >= threshold хоть для одного existing из keys."""
+    # key — второй аргумент SequenceMatcher: её индекс строится один раз на все сравнения,
+    # real_quick_ratio / quick_ratio — верхние оценки ratio, отсекают без полного сравнения
+    sm = SequenceMatcher(None, "", key)
+    for existing in keys:
+        sm.set_seq1(existing)
+        if sm.real_quick_ratio() >= threshold and sm.quick_ratio() >= threshold and sm.ratio() >= threshold:
+            return True
+    return False
+
+def listing_key(title: str, address: str) -> str:
+    return normalize_text(" ".join(filter(None, [title, address])))
+
+def is_duplicate(conn: sqlite3.Connection, link: str, title: str, address: str, threshold: float = DUP_THRESHOLD) -> bool:
     cur = conn.cursor()
     # 1) по ссылке
     if link:
@@ -42,9 +107,13 @@ def is_duplicate(conn: sqlite3.Connection, link: str, title: str, address: str,
         if cur.fetchone():
             return True
     # 2) по сходству title+address
-    key = normalize_text(" ".join(filter(None, [title, address])))
+    key = listing_key(title, address)
     if not key:
         return False
+    if dup_index.enabled():
+        # только кандидаты из индекса почти-дубликатов (dup_index.py), порог тот же
+        dup_index.ensure(conn)
+        return any_similar(dup_index.candidates(conn, key), key, threshold)
     cur.execute("SELECT title, address FROM listings")
     rows = cur.fetchall()
     for rtitle, raddr in rows:
@@ -55,19 +124,121 @@ def is_duplicate(conn: sqlite3.Connection, link: str, title: str, address: str,
             return True
     return False
 
+def _select_links(conn, links, columns="link"):
+    # SQLite ограничивает число параметров в запросе — идём пачками
+    rows = []
+    for i in range(0, len(links), _SQL_CHUNK):
+        chunk = links[i:i + _SQL_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        rows.extend(conn.execute(f"SELECT {columns} FROM listings WHERE link IN ({placeholders})", chunk).fetchall())
+    return rows
+
+def existing_links(links):
+    """Возвращает множество ссылок из links, которые уже есть в таблице listings."""
+    links = [l for l in dict.fromkeys(links) if l]
+    if not links:
+        return set()
+    with _conn_lock:
+        return {r[0] for r in _select_links(_shared_conn(), links)}
+
+def known_links():
+    """
+    Множество ссылок, которые уже встречались: сохранённые объявления (listings)
+    и все ссылки, собранные в прошлых циклах (seen_links).
+    """
+    global _known_links
+    with _known_lock:
+        if _known_links is None:
+            with _conn_lock:
+                rows = _shared_conn().execute(
+                    "SELECT link FROM listings WHERE link IS NOT NULL AND link != '' "
+                    "UNION SELECT link FROM seen_links"
+                ).fetchall()
+            _known_links = {r[0] for r in rows}
+        return _known_links
+
+def _remember_links(links):
+    with _known_lock:
+        if _known_links is not None:
+            _known_links.update(links)
+
+def mark_seen(links):
+    """Запоминает ссылки, собранные в этом цикле (в т.ч. не прошедшие фильтры)."""
+    links = [l for l in dict.fromkeys(links) if l]
+    if not links:
+        return
+    now = datetime.utcnow()
+    with _conn_lock:
+        with _shared_conn() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO seen_links (link, first_seen) VALUES (?, ?)", [(l, now) for l in links]
+            )
+    _remember_links(links)
+
+def _new_rows(conn, rows):
+    """
+    Строки пачки, которых нет в базе: ни по ссылке, ни почти-дубликатом title+address —
+    ни с сохранёнными объявлениями, ни с объявлениями раньше в этой же пачке.
+    """
+    known = {r[0] for r in _select_links(conn, list(dict.fromkeys(r[1] for r in rows)))}
+    out = []
+    batch_keys = []
+    for row in rows:
+        _it, link, title, address, _price, key = row
+        if link in known:
+            continue
+        try:
+            if is_duplicate(conn, "", title, address):
+                continue
+        except Exception as e:
+            print("DB duplicate check error:", e)
+            continue
+        if key and any_similar(batch_keys, key):
+            continue
+        known.add(link)
+        if key:
+            batch_keys.append(key)
+        out.append(row)
+    return out
+
+def _insert_rows(conn, rows):
+    """Пишет строки одной транзакцией; возвращает действительно вставленные."""
+    if not rows:
+        return []
+    now = datetime.utcnow()
+    params = [(link, title, price, address, it.get("source"), now) for it, link, title, address, price, _k in rows]
+    sql = "INSERT INTO listings (link, title, price, address, source, first_seen) VALUES (?, ?, ?, ?, ?, ?)"
+    try:
+        with conn:
+            conn.executemany(sql, params)
+            if dup_index.enabled():
+                ids = dict(_select_links(conn, [r[1] for r in rows], "link, id"))
+                dup_index.add_many(conn, [(ids[r[1]], r[5]) for r in rows if r[1] in ids])
+        return rows
+    except sqlite3.IntegrityError:
+        pass
+    # ссылку успел записать другой процесс — поштучно, пропуская занятые
+    inserted = []
+    with conn:
+        for row, p in zip(rows, params):
+            cur = conn.execute(sql.replace("INSERT", "INSERT OR IGNORE", 1), p)
+            if cur.rowcount:
+                inserted.append(row)
+                if dup_index.enabled():
+                    dup_index.add(conn, cur.lastrowid, row[5])
+    return inserted
+
 def save_new_items(items):
     """
     Save items to SQLite.
     items: list of dicts with keys link, title, price, address, source
     Returns list of items that were inserted (new).
+    Дубликаты отсеиваются для всей пачки заранее, новые строки пишутся одной транзакцией.
     """
     if not items:
         return []
 
-    conn = get_conn()
-    cur = conn.cursor()
-    new_inserted = []
-
+    rows = []
     for it in items:
         link = it.get("link") or ""
         title = it.get("title") or ""
@@ -77,22 +248,14 @@ def save_new_items(items):
             price = int(it.get("price")) if it.get("price") not in (None, "") else None
         except:
             price = None
+        rows.append((it, link, title, address, price, listing_key(title, address)))
 
+    with _conn_lock:
+        conn = _shared_conn()
         try:
-            if is_duplicate(conn, link, title, address):
-                continue
-            cur.execute(
-                "INSERT INTO listings (link, title, price, address, source, first_seen) VALUES (?, ?, ?, ?, ?, ?)",
-                (link, title, price, address, it.get("source"), datetime.utcnow())
-            )
-            conn.commit()
-            new_inserted.append(it)
-        except sqlite3.IntegrityError:
-            # возможно race condition — уже вставлено, пропускаем
-            continue
+            inserted = _insert_rows(conn, _new_rows(conn, rows))
         except Exception as e:
             print("DB insert error:", e)
-            continue
-
-    conn.close()
-    return new_inserted
+            return []
+    _remember_links([r[1] for r in inserted if r[1]])
+    return [r[0] for r in inserted]
@@ -0,0 +1,195 @@
+# decision_trace.py
+# Трассировка решений фильтра: для каждого объявления (или выборки decision_trace_sample)
+# пишется, чем совпал тип, почему юг / не юг и что с ценой — то, что detect_type / is_south /
+# classify_batch уже выяснили по ходу (evidence из вердиктов), без второго прохода по тексту.
+# - record() только кладёт строки в очередь; сжатие и запись — в фоновом потоке
+# - файл TRACE_PATH (csv.gz), при превышении decision_trace_max_mb — ротация .1.gz ... .N.gz
+# - очередь ограничена: если писатель не успевает, строки отбрасываются (и считаются), сбор не ждёт
+# - выключено (по умолчанию) — record() сразу выходит
+# Читает show_debug.py.
+
+import atexit
+import csv
+import gzip
+import io
+import os
+import queue
+import random
+import threading
+import time
+
+import config
+
+TRACE_PATH = os.getenv("DECISION_TRACE_PATH", os.path.join("outputs", "decision_trace.csv.gz"))
+
+FIELDS = (
+    "ts", "source", "title", "address", "link", "price_raw", "price_norm",
+    "detected_type", "type_match", "is_south", "explain", "decision",
+)
+
+_QUEUE_SIZE = 10000
+_FLUSH_SECONDS = 2.0
+
+_lock = threading.Lock()
+_queue = None
+_writer = None
+
+STATS = {"recorded": 0, "dropped": 0, "written": 0, "rotations": 0}
+
+
+def enabled():
+    return bool(config.SETTINGS.get("decision_trace", False))
+
+
+def _type_match(evidence):
+    if not evidence:
+        return ""
+    kind, key = evidence[0], evidence[1]
+    return f"{kind}:{key}"
+
+
+def _row(it, verdict, price, reason):
+    # вызывается в фоновом потоке: форматирование и normalize_price — не на пути сбора
+    from utils import explain_south, normalize_price
+    evidence = verdict[2] if len(verdict) > 2 and verdict[2] else (None, None)
+    t_ev, s_ev = evidence
+    south = "" if reason == "no type" else reason != "not south"
+    explain = explain_south(s_ev) if s_ev else ("" if verdict[0] else "type not detected")
+    if south != "" and south != bool(verdict[1]):
+        explain += " (overridden by coordinates)"  # classify_batch: GEO_FILTER / справочник по lat, lon
+    try:
+        price_norm = normalize_price(price if price is not None else it.get("price"))
+    except Exception:
+        price_norm = None
+    return {
+        "ts": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        "source": it.get("source", ""),
+        "title": it.get("title", ""),
+        "address": it.get("address", ""),
+        "link": it.get("link", ""),
+        "price_raw": it.get("price", ""),
+        "price_norm": "" if price_norm is None else price_norm,
+        "detected_type": verdict[0] or "",
+        "type_match": _type_match(t_ev),
+        "is_south": south,
+        "explain": explain,
+        "decision": reason,
+    }
+
+
+def _rotate():
+    backups = max(1, int(config.SETTINGS.get("decision_trace_backups", 5)))
+    base = TRACE_PATH[:-3] if TRACE_PATH.endswith(".gz") else TRACE_PATH
+    for n in range(backups - 1, 0, -1):
+        src = f"{base}.{n}.gz"
+        if os.path.exists(src):
+            os.replace(src, f"{base}.{n + 1}.gz")
+    if os.path.exists(TRACE_PATH):
+        os.replace(TRACE_PATH, f"{base}.1.gz")
+    STATS["rotations"] += 1
+
+
+def _open():
+    os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+    new = not os.path.exists(TRACE_PATH) or os.path.getsize(TRACE_PATH) == 0
+    # дозапись в gzip — новый member в том же файле, gzip.open читает их подряд
+    raw = gzip.open(TRACE_PATH, "ab", compresslevel=6)
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    w = csv.DictWriter(text, fieldnames=FIELDS, extrasaction="ignore")
+    if new:
+        w.writeheader()
+    return text, w
+
+
+def _writer_loop(q):
+    max_bytes = float(config.SETTINGS.get("decision_trace_max_mb", 20)) * 1024 * 1024
+    out, w = None, None
+    last_flush = time.monotonic()
+    while True:
+        try:
+            batch = q.get(timeout=_FLUSH_SECONDS)
+        except queue.Empty:
+            batch = ()
+        if batch is None:
+            break
+        try:
+            if batch:
+                if out is None:
+                    out, w = _open()
+                for args in batch:
+                    w.writerow(_row(*args))
+                STATS["written"] += len(batch)
+            if out is not None and (time.monotonic() - last_flush >= _FLUSH_SECONDS or not batch):
+                out.close()  # закрываем member: на диске всегда читаемый файл, размер — реальный
+                out, w = None, None
+                last_flush = time.monotonic()
+                if os.path.getsize(TRACE_PATH) >= max_bytes:
+                    _rotate()
+        except Exception as e:
+            print("[decision_trace] write error:", e)
+            out, w = None, None
+    if out is not None:
+        try:
+            out.close()
+        except Exception as e:
+            print("[decision_trace] close error:", e)
+
+
+def _start():
+    global _queue, _writer
+    with _lock:
+        if _writer is None:
+            _queue = queue.Queue(maxsize=_QUEUE_SIZE)
+            _writer = threading.Thread(target=_writer_loop, args=(_queue,), daemon=True, name="decision-trace")
+            _writer.start()
+        return _queue
+
+
+def record(items, verdicts, prices, reasons):
+    """
+    items / verdicts (detected_type, south, evidence) / цены, которые видел фильтр / причины classify_batch
+    ("ok", "no type", "not south", ...). Пишется выборка decision_trace_sample (0..1) объявлений.
+    """
+    if not enabled() or not items:
+        return
+    rate = float(config.SETTINGS.get("decision_trace_sample", 1.0))
+    if rate >= 1.0:
+        batch = list(zip(items, verdicts, prices, reasons))
+    else:
+        rnd = random.random
+        batch = [args for args in zip(items, verdicts, prices, reasons) if rnd() < rate]
+    if not batch:
+        return
+    # строки собираются в писателе; здесь — только поверхностная копия (фильтр дальше меняет price)
+    batch = [(dict(it), v, p, r) for it, v, p, r in batch]
+    q = _start()
+    try:
+        q.put_nowait(batch)
+        STATS["recorded"] += len(batch)
+    except queue.Full:
+        STATS["dropped"] += len(batch)
+
+
+def close(timeout=5.0):
+    global _queue, _writer
+    with _lock:
+        q, t = _queue, _writer
+        _queue, _writer = None, None
+    if t is None:
+        return
+    q.put(None)
+    t.join(timeout)
+
+
+def log_stats():
+    if not STATS["recorded"] and not STATS["dropped"]:
+        return
+    print(
+        f"[decision_trace] {STATS['recorded']} items traced, {STATS['written']} written, "
+        f"{STATS['dropped']} dropped (writer busy), {STATS['rotations']} rotations -> {TRACE_PATH}"
+    )
+    for k in STATS:
+        STATS[k] = 0
+
+
+atexit.register(close)
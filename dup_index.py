@@ -0,0 +1,161 @@
+# dup_index.py
+# Индекс почти-дубликатов для db.is_duplicate: вместо SequenceMatcher против каждой строки listings
+# ratio считается только для небольшого набора кандидатов.
+# - ключ объявления — normalize_text(title + address), как и раньше; хранится в dup_keys
+#   (строки таблицы больше не нормализуются на каждой проверке)
+# - MinHash по символьным шинглам ключа (SHINGLE символов, BANDS x ROWS хэшей), LSH по полосам:
+#   у похожих ключей хотя бы одна полоса совпадает, корзины полос лежат в dup_buckets (SQLite)
+# - кандидаты — объявления из тех же корзин; решение о дубликате — тот же SequenceMatcher с порогом 0.86
+# - поменялись параметры (INDEX_VERSION) или в listings есть строки без индекса — индекс
+#   достраивается при первом обращении к базе
+# LSH вероятностный: на синтетике (случайные правки до ~10 символов) он находит ~98% пар с ratio >= 0.86;
+# переиздания одного и того же объявления (почти одинаковый текст) — все. Полный перебор — dup_index: False.
+
+import functools
+import hashlib
+import random
+import threading
+import zlib
+
+import config
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+SHINGLE = 3
+BANDS = 32
+ROWS = 4
+INDEX_VERSION = f"minhash-{SHINGLE}-{BANDS}x{ROWS}-1"
+
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS dup_keys (
+    listing_id INTEGER PRIMARY KEY,
+    key TEXT
+);
+CREATE TABLE IF NOT EXISTS dup_buckets (
+    bucket INTEGER,
+    listing_id INTEGER,
+    PRIMARY KEY (bucket, listing_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS dup_meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_MASK = 0xFFFFFFFF
+# хэш-функции h -> (a*h + b) mod 2^32, одни и те же в каждом процессе
+_rnd = random.Random(0x5EED)
+_A = [_rnd.randrange(1, 1 << 32) | 1 for _ in range(BANDS * ROWS)]
+_B = [_rnd.randrange(0, 1 << 32) for _ in range(BANDS * ROWS)]
+if np is not None:
+    _A_NP = np.array(_A, dtype=np.uint64)
+    _B_NP = np.array(_B, dtype=np.uint64)
+
+_lock = threading.Lock()
+_ready = set()   # файлы БД, для которых индекс уже проверен в этом процессе
+
+STATS = {"lookups": 0, "candidates": 0, "indexed": 0}
+
+
+def enabled():
+    return bool(config.SETTINGS.get("dup_index", True))
+
+
+def signature(key):
+    """MinHash ключа: BANDS * ROWS минимумов по шинглам."""
+    shingles = {key[i:i + SHINGLE] for i in range(max(1, len(key) - SHINGLE + 1))}
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+    if np is not None:
+        h = np.array(hashes, dtype=np.uint64)
+        # uint64 переполняется по модулю 2^64 — младшие 32 бита те же, что у точного произведения
+        return ((h[:, None] * _A_NP[None, :] + _B_NP[None, :]) & np.uint64(_MASK)).min(axis=0).tolist()
+    return [min((h * a + b) & _MASK for h in hashes) for a, b in zip(_A, _B)]
+
+
+@functools.lru_cache(maxsize=4096)
+def buckets(key):
+    """Корзины ключа — по одной на полосу (номер полосы входит в хэш); проверка и запись нового — один расчёт."""
+    sig = signature(key)
+    out = []
+    for band in range(BANDS):
+        part = sig[band * ROWS:(band + 1) * ROWS]
+        data = band.to_bytes(2, "big") + b"".join(v.to_bytes(4, "big") for v in part)
+        out.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big", signed=True))
+    return tuple(out)
+
+
+def add(conn, listing_id, key):
+    """Индексирует одно объявление (commit — за вызывающим, вместе с INSERT в listings)."""
+    if not key:
+        return
+    conn.execute("INSERT OR REPLACE INTO dup_keys (listing_id, key) VALUES (?, ?)", (listing_id, key))
+    conn.executemany(
+        "INSERT OR IGNORE INTO dup_buckets (bucket, listing_id) VALUES (?, ?)",
+        [(b, listing_id) for b in buckets(key)],
+    )
+
+
+def add_many(conn, pairs):
+    """add() для пачки [(listing_id, key)] — одним executemany на таблицу."""
+    pairs = [(listing_id, key) for listing_id, key in pairs if key]
+    if not pairs:
+        return
+    conn.executemany("INSERT OR REPLACE INTO dup_keys (listing_id, key) VALUES (?, ?)", pairs)
+    conn.executemany(
+        "INSERT OR IGNORE INTO dup_buckets (bucket, listing_id) VALUES (?, ?)",
+        [(b, listing_id) for listing_id, key in pairs for b in buckets(key)],
+    )
+
+
+def ensure(conn):
+    """Создаёт таблицы индекса и доиндексирует строки listings, которых в нём нет."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    if path in _ready:
+        return
+    with _lock:
+        if path in _ready:
+            return
+        from db import normalize_text
+        conn.executescript(CREATE_SQL)
+        row = conn.execute("SELECT value FROM dup_meta WHERE name = 'version'").fetchone()
+        if not row or row[0] != INDEX_VERSION:
+            conn.execute("DELETE FROM dup_keys")
+            conn.execute("DELETE FROM dup_buckets")
+            conn.execute("INSERT OR REPLACE INTO dup_meta (name, value) VALUES ('version', ?)", (INDEX_VERSION,))
+        rows = conn.execute(
+            "SELECT id, title, address FROM listings WHERE id NOT IN (SELECT listing_id FROM dup_keys)"
+        ).fetchall()
+        add_many(conn, [(listing_id, normalize_text(" ".join(filter(None, [title, address]))))
+                        for listing_id, title, address in rows])
+        conn.commit()
+        if rows:
+            print(f"[dup_index] indexed {len(rows)} stored listings")
+        STATS["indexed"] += len(rows)
+        if path:
+            _ready.add(path)
+
+
+def candidates(conn, key):
+    """Ключи сохранённых объявлений, попавших с key хотя бы в одну корзину."""
+    marks = ",".join("?" * BANDS)
+    rows = conn.execute(
+        f"SELECT k.key FROM dup_keys k WHERE k.listing_id IN "
+        f"(SELECT listing_id FROM dup_buckets WHERE bucket IN ({marks}))",
+        buckets(key),
+    ).fetchall()
+    STATS["lookups"] += 1
+    STATS["candidates"] += len(rows)
+    return [r[0] for r in rows]
+
+
+def log_stats():
+    if not STATS["lookups"]:
+        return
+    print(
+        f"[dup_index] {STATS['lookups']} lookups, {STATS['candidates'] / STATS['lookups']:.1f} candidates "
+        f"per lookup on average"
+    )
+    STATS["lookups"] = STATS["candidates"] = 0
@@ -0,0 +1,214 @@
+# gazetteer.py
+# Офлайн-справочник муниципалитетов и посёлков Тенерифе (data/tenerife_gazetteer.json):
+# - municipality_at(lat, lon): точка -> муниципалитет. Полигоны лежат в сетке GRID_DEG градусов,
+#   для точки проверяются только полигоны её ячейки (O(1)); вне полигонов — ближайшая известная точка
+#   (центр или посёлок) муниципалитета без полигона, не дальше MAX_SEAT_KM
+# - municipalities_at(lats, lons): то же для массивов numpy, сразу для всей пачки
+# - resolve(tokens): названия посёлков/муниципалитетов в тексте -> муниципалитеты;
+#   поиск по словарю n-грамм токенов, без нечёткого сравнения
+# Полигоны грубые (десяток вершин, берег вынесен в море) и есть только у южных муниципалитетов —
+# для решения «юг / не юг» этого хватает.
+
+import json
+import math
+import os
+import unicodedata
+
+DATA_PATH = os.getenv(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tenerife_gazetteer.json")
+)
+
+GRID_DEG = 0.05        # размер ячейки пространственного индекса
+MAX_SEAT_KM = 12.0     # дальше — точка не относится ни к одному муниципалитету
+
+
+def _strip_accents(s):
+    return "".join(ch for ch in unicodedata.normalize("NFD", s) if unicodedata.category(ch) != "Mn")
+
+
+def _inside(lat, lon, poly):
+    # ray casting: сколько рёбер пересекает луч от точки на восток
+    inside = False
+    j = len(poly) - 1
+    for i in range(len(poly)):
+        yi, xi = poly[i]
+        yj, xj = poly[j]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _km(lat1, lon1, lat2, lon2):
+    # равнопромежуточная проекция: на масштабе острова ошибка меньше процента
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2.0))
+    y = math.radians(lat2 - lat1)
+    return 6371.0 * math.hypot(x, y)
+
+
+class Municipality:
+    __slots__ = ("index", "name", "zone", "seat", "polygon", "bbox")
+
+    def __init__(self, index, d):
+        self.index = index
+        self.name = d["name"]
+        self.zone = d.get("zone", "")
+        self.seat = tuple(d["seat"])
+        self.polygon = [tuple(p) for p in d.get("polygon") or []] or None
+        if self.polygon:
+            lats = [p[0] for p in self.polygon]
+            lons = [p[1] for p in self.polygon]
+            self.bbox = (min(lats), min(lons), max(lats), max(lons))
+        else:
+            self.bbox = None
+
+    def __repr__(self):
+        return f"Municipality({self.name!r}, {self.zone!r})"
+
+
+class Gazetteer:
+    """
+    municipalities — список Municipality; by_name — по официальному названию.
+    text_norm / tokens — те же функции, что у utils: названия индексируются в том виде,
+    в каком их увидит is_south.
+    """
+
+    def __init__(self, data, text_norm, tokens):
+        self.version = data.get("version", 0)
+        self.bounds = tuple(data.get("bbox") or (-90.0, -180.0, 90.0, 180.0))
+        self.municipalities = [Municipality(i, d) for i, d in enumerate(data.get("municipalities") or [])]
+        self.by_name = {m.name: m for m in self.municipalities}
+        # опорные точки муниципалитетов без полигона: центр и посёлки
+        self.anchors = [(m.seat[0], m.seat[1], m) for m in self.municipalities if m.polygon is None]
+        for _name, municipality, lat, lon in data.get("localities") or []:
+            m = self.by_name.get(municipality)
+            if m is not None and m.polygon is None:
+                self.anchors.append((float(lat), float(lon), m))
+
+        # сетка: (ячейка lat, ячейка lon) -> муниципалитеты, чей bbox задевает ячейку
+        self.grid = {}
+        for m in self.municipalities:
+            if m.bbox is None:
+                continue
+            lat0, lon0, lat1, lon1 = m.bbox
+            for gy in range(self._cell(lat0), self._cell(lat1) + 1):
+                for gx in range(self._cell(lon0), self._cell(lon1) + 1):
+                    self.grid.setdefault((gy, gx), []).append(m)
+
+        # словарь названий: нормализованная n-грамма токенов -> муниципалитет
+        # (None — название, которое ничего не говорит о месте: провинция «Santa Cruz de Tenerife»)
+        self.names = {}
+        self.max_words = 1
+
+        def add(name, m):
+            for variant in {name, _strip_accents(name)}:
+                key = " ".join(tokens(text_norm(variant)))
+                if key and (key not in self.names or m is None):
+                    self.names[key] = m
+                    self.max_words = max(self.max_words, key.count(" ") + 1)
+
+        for m, d in zip(self.municipalities, data.get("municipalities") or []):
+            add(m.name, m)
+            for alias in d.get("aliases") or []:
+                add(alias, m)
+        for name, municipality, _lat, _lon in data.get("localities") or []:
+            m = self.by_name.get(municipality)
+            if m is not None:
+                add(name, m)
+        for name in data.get("ambiguous") or []:
+            add(name, None)
+        # первое слово названия -> [(число слов, название)], длинные первыми
+        self.first_words = {}
+        for key in self.names:
+            words = key.split(" ")
+            self.first_words.setdefault(words[0], []).append((len(words), key))
+        for variants in self.first_words.values():
+            variants.sort(reverse=True)
+
+    @staticmethod
+    def _cell(v):
+        return int(math.floor(v / GRID_DEG))
+
+    def in_bounds(self, lat, lon):
+        lat0, lon0, lat1, lon1 = self.bounds
+        return lat0 <= lat <= lat1 and lon0 <= lon <= lon1
+
+    def municipality_at(self, lat, lon):
+        """Муниципалитет точки или None (вне острова / слишком далеко от всех)."""
+        if not self.in_bounds(lat, lon):
+            return None
+        for m in self.grid.get((self._cell(lat), self._cell(lon)), ()):
+            lat0, lon0, lat1, lon1 = m.bbox
+            if lat0 <= lat <= lat1 and lon0 <= lon <= lon1 and _inside(lat, lon, m.polygon):
+                return m
+        best = min(self.anchors, key=lambda a: _km(lat, lon, a[0], a[1]), default=None)
+        if best is None or _km(lat, lon, best[0], best[1]) > MAX_SEAT_KM:
+            return None
+        return best[2]
+
+    def municipalities_at(self, lats, lons):
+        """Индексы муниципалитетов для массивов координат (numpy), -1 — не определён."""
+        import numpy as np
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        out = np.full(lats.shape, -1, dtype=np.int32)
+        lat0, lon0, lat1, lon1 = self.bounds
+        ok = (lats >= lat0) & (lats <= lat1) & (lons >= lon0) & (lons <= lon1)
+        for m in self.municipalities:
+            if m.bbox is None:
+                continue
+            b0, b1, b2, b3 = m.bbox
+            cand = np.flatnonzero(ok & (out < 0) & (lats >= b0) & (lats <= b2) & (lons >= b1) & (lons <= b3))
+            if not len(cand):
+                continue
+            y, x = lats[cand], lons[cand]
+            inside = np.zeros(len(cand), dtype=bool)
+            poly = m.polygon
+            j = len(poly) - 1
+            for i in range(len(poly)):
+                yi, xi = poly[i]
+                yj, xj = poly[j]
+                if yi != yj:
+                    cross = ((yi > y) != (yj > y)) & (x < (xj - xi) * (y - yi) / (yj - yi) + xi)
+                    inside ^= cross
+                j = i
+            out[cand[inside]] = m.index
+        rest = np.flatnonzero(ok & (out < 0))
+        if len(rest) and self.anchors:
+            seats = np.array([(a[0], a[1]) for a in self.anchors])
+            y = lats[rest][:, None]
+            x = lons[rest][:, None]
+            dx = np.radians(seats[:, 1][None, :] - x) * np.cos(np.radians((y + seats[:, 0][None, :]) / 2.0))
+            dy = np.radians(seats[:, 0][None, :] - y)
+            km = 6371.0 * np.hypot(dx, dy)
+            nearest = km.argmin(axis=1)
+            close = km[np.arange(len(rest)), nearest] <= MAX_SEAT_KM
+            idx = np.array([a[2].index for a in self.anchors], dtype=np.int32)
+            out[rest[close]] = idx[nearest[close]]
+        return out
+
+    def resolve(self, tokens):
+        """
+        Муниципалитеты, чьи названия (или названия их посёлков) встречаются в списке токенов,
+        в порядке появления; у перекрывающихся названий побеждает самое длинное.
+        """
+        found = []
+        names = self.names
+        first_words = self.first_words
+        i, n = 0, len(tokens)
+        while i < n:
+            step = 1
+            for width, key in first_words.get(tokens[i], ()):
+                if i + width <= n and (width == 1 or " ".join(tokens[i:i + width]) == key):
+                    m = names[key]
+                    if m is not None and m not in found:
+                        found.append(m)
+                    step = width
+                    break
+            i += step
+        return found
+
+
+def load(text_norm, tokens, path=None):
+    with open(path or DATA_PATH, encoding="utf-8") as f:
+        return Gazetteer(json.load(f), text_norm, tokens)
@@ -0,0 +1,158 @@
+# health.py
+# Circuit breaker на источник: мёртвые/заблокированные сайты не тратят время каждый цикл.
+#   closed    — источник опрашивается как обычно; считаем неудачи подряд
+#   open      — после failure_threshold неудач подряд источник пропускается до конца cooldown
+#   half_open — cooldown истёк: один пробный опрос (1 страница); успех -> closed,
+#               неудача -> снова open с удвоенным cooldown (не больше breaker_max_cooldown)
+# Состояние хранится в JSON и переживает рестарт; snapshot() — для мониторинга.
+
+import json
+import os
+import threading
+import time
+
+import config
+
+STATE_PATH = os.getenv("SOURCE_HEALTH_PATH", "source_health.json")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class SourceHealth:
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0            # неудач подряд
+        self.total_failures = 0
+        self.total_ok = 0
+        self.opened_at = 0.0
+        self.cooldown = 0.0
+        self.last_error = ""
+        self.last_change = time.time()
+        self.probing = False
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "total_failures": self.total_failures,
+            "total_ok": self.total_ok,
+            "opened_at": self.opened_at,
+            "cooldown": self.cooldown,
+            "last_error": self.last_error,
+            "last_change": self.last_change,
+        }
+
+
+class CircuitBreaker:
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.sources = {}
+        self._load()
+
+    def _settings(self):
+        s = config.SETTINGS
+        return (
+            int(s.get("breaker_failure_threshold", 3)),
+            float(s.get("breaker_cooldown_seconds", 900)),
+            float(s.get("breaker_max_cooldown", 6 * 3600)),
+        )
+
+    def _get(self, name):
+        h = self.sources.get(name)
+        if h is None:
+            h = SourceHealth(name)
+            self.sources[name] = h
+        return h
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print("[health] state load error:", e)
+            return
+        for name, d in (data or {}).items():
+            h = self._get(name)
+            for k, v in d.items():
+                if hasattr(h, k):
+                    setattr(h, k, v)
+            # пробный запрос, оборванный рестартом, начнётся заново
+            if h.state == HALF_OPEN:
+                h.state = OPEN
+
+    def _save_locked(self):
+        data = {name: h.to_dict() for name, h in self.sources.items()}
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print("[health] state save error:", e)
+
+    def _set_state(self, h, state):
+        if h.state != state:
+            print(f"[health] {h.name}: {h.state} -> {state}")
+            h.state = state
+            h.last_change = time.time()
+
+    def allow(self, name):
+        """
+        (allowed, probe): можно ли опрашивать источник сейчас и является ли это пробным опросом.
+        """
+        if not config.SETTINGS.get("circuit_breaker", True):
+            return True, False
+        with self.lock:
+            h = self._get(name)
+            if h.state == CLOSED:
+                return True, False
+            if h.state == OPEN:
+                if time.time() < h.opened_at + h.cooldown:
+                    return False, False
+                self._set_state(h, HALF_OPEN)
+                h.probing = False
+            # half-open: ровно один пробный опрос за раз
+            if h.probing:
+                return False, False
+            h.probing = True
+            return True, True
+
+    def record(self, name, ok, error=""):
+        if not config.SETTINGS.get("circuit_breaker", True):
+            return
+        threshold, base_cooldown, max_cooldown = self._settings()
+        with self.lock:
+            h = self._get(name)
+            h.probing = False
+            if ok:
+                h.total_ok += 1
+                h.failures = 0
+                h.cooldown = 0.0
+                h.last_error = ""
+                self._set_state(h, CLOSED)
+            else:
+                h.total_failures += 1
+                h.failures += 1
+                h.last_error = str(error or "")[:300]
+                if h.state == HALF_OPEN:
+                    h.cooldown = min(max_cooldown, max(base_cooldown, h.cooldown * 2))
+                    h.opened_at = time.time()
+                    self._set_state(h, OPEN)
+                elif h.state == CLOSED and h.failures >= threshold:
+                    h.cooldown = base_cooldown
+                    h.opened_at = time.time()
+                    self._set_state(h, OPEN)
+            self._save_locked()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: h.to_dict() for name, h in self.sources.items()}
+
+
+breaker = CircuitBreaker()
@@ -0,0 +1,143 @@
+# keyword_matcher.py
+# Ключевые слова config (TYPE_KEYWORDS, SOUTH_KEYWORDS, SOUTH_BLACKLIST), собранные в один
+# матчер: все точные вхождения в нормализованный текст находятся один раз,
+# а detect_type / is_south / explain_is_south дальше только смотрят в готовое множество хитов
+# (порядок приоритетов — их собственный, как и раньше: первый ключ в порядке config выигрывает).
+#
+# Проход — C-поиск подстроки (`kw in txt`) по списку уникальных ключей. Автомат Aho–Corasick
+# на чистом Python пробовали: цикл по символам текста дороже ~60 вызовов str.__contains__
+# (замер на config по умолчанию: ~22 мкс против ~6 мкс на объявление), а выигрыш у него
+# появился бы только на сотнях ключей — в config их нет.
+#
+# Нечёткое совпадение (FuzzyIndex): решение то же, что у SequenceMatcher(None, key, tok).ratio() >= порог,
+# но токен текста сравнивается не со всем словарём ключей, а только с кандидатами:
+# - ratio = 2*M / (len(key) + len(tok)), а M (совпавших символов) не больше min(len) — ключи
+#   лежат в корзинах по длине, и корзины, где даже полное совпадение не дотянет до порога, пропускаются;
+# - M не больше пересечения мультимножеств символов (как SequenceMatcher.quick_ratio) — вторая отсечка;
+# - SequenceMatcher считается только для оставшихся, а ответ по токену кэшируется:
+#   словарь токенов объявлений небольшой и сильно повторяется.
+# Обе оценки — верхние границы ratio, так что ни одно совпадение не теряется.
+
+from difflib import SequenceMatcher
+
+# сколько токенов текста помнит FuzzyIndex (при переполнении кэш сбрасывается целиком)
+FUZZY_CACHE_SIZE = 50000
+
+
+def _char_counts(s):
+    counts = {}
+    for ch in s:
+        counts[ch] = counts.get(ch, 0) + 1
+    return counts
+
+
+def similar_at_least(a, b, threshold):
+    """SequenceMatcher(None, a, b).ratio() >= threshold, с дешёвыми отсечками по длине и составу символов."""
+    if not a or not b:
+        return 0.0 >= threshold
+    total = len(a) + len(b)
+    if 2.0 * min(len(a), len(b)) / total < threshold:
+        return False
+    cb = _char_counts(b)
+    common = sum(min(n, cb.get(ch, 0)) for ch, n in _char_counts(a).items())
+    if 2.0 * common / total < threshold:
+        return False
+    return SequenceMatcher(None, a, b).ratio() >= threshold
+
+
+class FuzzyIndex:
+    """
+    Словарь ключей для нечёткого сравнения с токенами текста.
+    matches(tok) — множество ключей key, для которых SequenceMatcher(None, key, tok).ratio() >= threshold.
+    """
+
+    def __init__(self, keys, threshold, cache_size=FUZZY_CACHE_SIZE):
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.by_len = {}    # длина ключа -> [(key, счётчики символов)]
+        for k in sorted(set(k for k in keys if k)):
+            self.by_len.setdefault(len(k), []).append((k, _char_counts(k)))
+        self.lengths = sorted(self.by_len)
+        self._cache = {}
+        self.scanned = 0    # токенов, посчитанных без кэша
+        self.compared = 0   # вызовов SequenceMatcher
+
+    def matches(self, tok):
+        found = self._cache.get(tok)
+        if found is None:
+            found = self._scan(tok)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[tok] = found
+        return found
+
+    def _scan(self, tok):
+        self.scanned += 1
+        thr = self.threshold
+        n = len(tok)
+        counts = None
+        found = []
+        for lk in self.lengths:
+            total = lk + n
+            if 2.0 * min(lk, n) / total < thr:
+                continue
+            if counts is None:
+                counts = _char_counts(tok)
+            for key, kc in self.by_len[lk]:
+                common = 0
+                for ch, c in kc.items():
+                    m = counts.get(ch, 0)
+                    common += c if c < m else m
+                if 2.0 * common / total < thr:
+                    continue
+                self.compared += 1
+                if SequenceMatcher(None, key, tok).ratio() >= thr:
+                    found.append(key)
+        return frozenset(found)
+
+    def any_matches(self, tokens):
+        """Объединение matches() по токенам текста."""
+        out = set()
+        for tok in set(tokens):
+            out |= self.matches(tok)
+        return out
+
+
+class KeywordMatcher:
+    """
+    Скомпилированные таблицы ключевых слов.
+      types     — [(type, [keywords])] в порядке config.TYPE_KEYWORDS
+      south     — [(kw, kw_norm, kw_tokens)] для SOUTH_KEYWORDS
+      blacklist — SOUTH_BLACKLIST как есть
+    hits(txt) — множество всех ключей (любой таблицы), входящих в txt подстрокой.
+    fuzzy     — FuzzyIndex по ключам типов и токенам южных ключей (порог token_threshold).
+    """
+
+    def __init__(self, type_keywords, south_keywords, blacklist, text_norm, tokens, token_threshold=0.92):
+        self.types = [(t, list(keys)) for t, keys in type_keywords.items()]
+        self.south = []
+        for kw in south_keywords:
+            if not kw:
+                continue
+            kw_norm = text_norm(kw)
+            self.south.append((kw, kw_norm, tokens(kw_norm)))
+        self.blacklist = list(blacklist)
+        patterns = set()
+        for _t, keys in self.types:
+            patterns.update(k for k in keys if k)
+        patterns.update(kw for kw, _n, _tk in self.south)
+        patterns.update(b for b in self.blacklist if b)
+        self.patterns = sorted(patterns)
+        vocab = {k for _t, keys in self.types for k in keys if k}
+        vocab.update(kt for _kw, _n, kw_tokens in self.south for kt in kw_tokens)
+        self.fuzzy = FuzzyIndex(vocab, token_threshold)
+        # detect_type и is_south вызываются подряд для одного объявления — последний результат держим
+        self._last = (None, frozenset())
+
+    def hits(self, txt):
+        last_txt, last_hits = self._last
+        if txt == last_txt:
+            return last_hits
+        found = frozenset(p for p in self.patterns if p in txt)
+        self._last = (txt, found)
+        return found
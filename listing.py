@@ -0,0 +1,186 @@
+# listing.py
+# Listing — компактная запись объявления вместо dict на пути collector -> filter_candidates -> БД -> notifier.
+# - поля в __slots__ (без словаря атрибутов на каждое объявление); редкие ключи парсеров — в отдельном dict
+# - source / detected_type интернируются: одна строка на источник, а не копия на каждое объявление
+#   (после json.loads из кэша страниц у каждого объявления своя копия имени источника)
+# - price_value — цена int (normalize_price), norm_text — text_norm(title + address + description);
+#   считаются при первом обращении и сбрасываются при записи исходных полей
+# - интерфейс dict: it["title"], get, setdefault, pop, in, keys/items, dict(it) — старый код работает как был.
+#   Ключ, которого парсер не задал, отсутствует так же, как в dict (get -> default, [] -> KeyError)
+# Listing.of(d) делает запись из dict парсера; to_dict() — обратно (json, процессы parse_pool).
+
+import sys
+
+FIELDS = (
+    "title", "address", "description", "price", "price_eur", "link", "source",
+    "detected_type", "lat", "lon",
+)
+_FIELD_SET = frozenset(FIELDS)
+_INTERNED = frozenset(("source", "detected_type"))
+_TEXT_FIELDS = frozenset(("title", "address", "description"))
+_MISSING = object()
+
+
+class Listing:
+    __slots__ = FIELDS + ("_extra", "_price_value", "_norm_text")
+
+    def __init__(self, **fields):
+        self._extra = None
+        self._price_value = _MISSING
+        self._norm_text = None
+        for k, v in fields.items():
+            self[k] = v
+
+    @classmethod
+    def of(cls, d):
+        """Listing из dict парсера (Listing возвращается как есть)."""
+        if isinstance(d, cls):
+            return d
+        it = cls()
+        for k, v in d.items():
+            it[k] = v
+        return it
+
+    # --- вычисляемые поля ---
+    @property
+    def price_value(self):
+        """Цена int (utils.normalize_price) или None."""
+        if self._price_value is _MISSING:
+            from utils import normalize_price
+            try:
+                self._price_value = normalize_price(getattr(self, "price", None))
+            except Exception:
+                self._price_value = None
+        return self._price_value
+
+    @property
+    def norm_text(self):
+        """text_norm(title + address + description) — то, по чему работают detect_type / is_south."""
+        if self._norm_text is None:
+            from utils import text_norm
+            self._norm_text = text_norm(" ".join(
+                [str(getattr(self, k, "") or "") for k in ("title", "address", "description")]
+            ))
+        return self._norm_text
+
+    # --- интерфейс dict ---
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            if key in _INTERNED and type(value) is str:
+                value = sys.intern(value)
+            elif key in _TEXT_FIELDS:
+                self._norm_text = None
+            elif key == "price":
+                self._price_value = _MISSING
+            object.__setattr__(self, key, value)
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                object.__delattr__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            if key in _TEXT_FIELDS:
+                self._norm_text = None
+            elif key == "price":
+                self._price_value = _MISSING
+            return
+        if self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            return getattr(self, key, default)
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = default
+            return self[key]
+        return value
+
+    def pop(self, key, default=_MISSING):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        del self[key]
+        return value
+
+    def update(self, other=(), **kw):
+        pairs = other.items() if hasattr(other, "items") else other
+        for k, v in pairs:
+            self[k] = v
+        for k, v in kw.items():
+            self[k] = v
+
+    def keys(self):
+        out = [k for k in FIELDS if hasattr(self, k)]
+        if self._extra:
+            out.extend(self._extra)
+        return out
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Listing, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Listing({self.to_dict()!r})"
+
+    # pickle (parse_pool, decision_trace): __slots__ без __dict__ — состояние явно
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self._extra = None
+        self._price_value = _MISSING
+        self._norm_text = None
+        for k, v in state.items():
+            self[k] = v
+
+
+def listings(items):
+    """Список Listing из того, что вернул парсер (dict или уже Listing)."""
+    return [Listing.of(it) for it in items]
@@ -0,0 +1,203 @@
+# parse_pool.py
+# CPU-стадия сбора в отдельных процессах: разбор list pages (agency_template, lxml-движок)
+# и классификация объявлений (utils.detect_type / utils.is_south).
+# Всё это — чистый CPU, а сбор идёт в потоках одного процесса, так что из-за GIL
+# остальные ядра простаивают. Здесь:
+# - ProcessPoolExecutor (spawn) на parse_processes воркеров, по умолчанию cpu_count - 1
+# - воркер прогревается один раз: импорт парсеров, компиляция каскадов селекторов,
+#   разбор ключевых слов config (utils.keyword_tables), справочник мест (utils.gazetteer_index)
+# - в воркер уходит сырой текст страницы, обратно — компактные кортежи, а не dict/деревья
+# - профили селекторов и лимиты цен остаются в основном процессе
+# - log_stats(): глубина очереди и пропускная способность каждого воркера
+# Если пул выключен или недоступен — всё считается на месте, как раньше.
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+
+ITEM_FIELDS = ("title", "price", "link", "address", "description")
+
+_lock = threading.Lock()
+_pool = None
+_pool_broken = False
+
+# очередь: отправлено, но ещё не готово
+QUEUE = {"pending": 0, "max_pending": 0, "tasks": 0}
+# pid воркера -> [задач, объявлений, секунд работы]
+WORKER_STATS = {}
+
+
+def pool_size():
+    n = int(config.SETTINGS.get("parse_processes", 0) or 0)
+    if n <= 0:
+        n = (os.cpu_count() or 1) - 1
+    return max(0, n)
+
+
+def enabled():
+    return bool(config.SETTINGS.get("parse_pool", True)) and not _pool_broken and pool_size() > 0
+
+
+# --- в воркере ---
+def _warm():
+    # один раз на процесс: парсеры, скомпилированные XPath и таблицы ключевых слов
+    from parsers import agency_template
+    import utils
+    agency_template._cascades()
+    utils.keyword_tables()
+    utils.gazetteer_index()
+
+
+def _parse_job(html, base_url, plan, use_profile):
+    from parsers import agency_template
+    t0 = time.perf_counter()
+    res = agency_template._extract_page(html, base_url, plan, use_profile)
+    if res is None:
+        payload = None
+        count = 0
+    else:
+        outcome, items, stats = res
+        rows = [tuple(it[f] for f in ITEM_FIELDS) for it in items]
+        payload = (outcome, rows, stats)
+        count = len(rows)
+    return os.getpid(), count, time.perf_counter() - t0, payload
+
+
+def _classify_job(rows):
+    # rows: (title, address, description, (lat, lon) или None) -> (detected_type, south, (evidence типа, evidence юга))
+    # координаты едут вместе с текстом: is_south в процессе решает по GEO_FILTER / справочнику, как на месте
+    from utils import detect_type_evidence, south_evidence
+    t0 = time.perf_counter()
+    out = []
+    for title, address, description, point in rows:
+        it = {"title": title, "address": address, "description": description}
+        if point is not None:
+            it["lat"], it["lon"] = point
+        t, t_ev = detect_type_evidence(it)
+        south, s_ev = south_evidence(it) if t else (False, None)
+        out.append((t, south, (t_ev, s_ev)))
+    return os.getpid(), len(rows), time.perf_counter() - t0, out
+
+
+# --- в основном процессе ---
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            n = pool_size()
+            ctx = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=n, mp_context=ctx, initializer=_warm)
+            print(f"[parse_pool] started {n} worker processes")
+        return _pool
+
+
+def _done(fut):
+    with _lock:
+        QUEUE["pending"] -= 1
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        pid, count, seconds, _payload = fut.result()
+        st = WORKER_STATS.setdefault(pid, [0, 0, 0.0])
+        st[0] += 1
+        st[1] += count
+        st[2] += seconds
+
+
+def _submit(fn, *args):
+    pool = _get_pool()
+    with _lock:
+        QUEUE["pending"] += 1
+        QUEUE["tasks"] += 1
+        QUEUE["max_pending"] = max(QUEUE["max_pending"], QUEUE["pending"])
+    try:
+        fut = pool.submit(fn, *args)
+    except Exception:
+        with _lock:
+            QUEUE["pending"] -= 1
+        raise
+    fut.add_done_callback(_done)
+    return fut
+
+
+def _result(fut):
+    global _pool_broken
+    try:
+        return fut.result()[3]
+    except BrokenProcessPool as e:
+        # воркер упал / пул не стартовал — дальше считаем на месте
+        print("[parse_pool] pool is broken, falling back to in-process parsing:", e)
+        _pool_broken = True
+        raise
+
+
+def parse_cards(html, base_url, use_profile=False):
+    """agency_template._parse_lxml_cards, но разбор — в процессе пула. None — нужен путь через soup."""
+    from parsers import agency_template
+    if not enabled():
+        return agency_template._parse_lxml_cards(html, base_url, use_profile)
+    plan = agency_template._profile_plan(base_url) if use_profile else None
+    try:
+        payload = _result(_submit(_parse_job, html, base_url, plan, use_profile))
+    except Exception as e:
+        print("[parse_pool] parse error, parsing in-process:", e)
+        return agency_template._parse_lxml_cards(html, base_url, use_profile)
+    if payload is None:
+        return None
+    outcome, rows, stats = payload
+    if use_profile:
+        agency_template._record_page(base_url, outcome, stats)
+    return [dict(zip(ITEM_FIELDS, row)) for row in rows]
+
+
+def classify(items, chunk_size=None):
+    """
+    [(detected_type, south, evidence)] для каждого объявления; south считается только при найденном типе,
+    evidence — чем совпали тип и юг (для decision_trace).
+    Маленькие пачки и выключенный пул — на месте.
+    """
+    from utils import _geo_point
+    rows = [
+        (it.get("title", ""), it.get("address", ""), it.get("description", ""), _geo_point(it)) for it in items
+    ]
+    min_batch = int(config.SETTINGS.get("parse_pool_min_batch", 200))
+    if not enabled() or len(rows) < min_batch:
+        return _classify_job(rows)[3]
+
+    n = pool_size()
+    size = chunk_size or max(50, -(-len(rows) // (n * 4)))
+    try:
+        futures = [_submit(_classify_job, rows[i:i + size]) for i in range(0, len(rows), size)]
+        return [x for fut in futures for x in _result(fut)]
+    except Exception as e:
+        print("[parse_pool] classify error, classifying in-process:", e)
+        return _classify_job(rows)[3]
+
+
+def log_stats():
+    with _lock:
+        if not QUEUE["tasks"]:
+            return
+        print(f"[parse_pool] {QUEUE['tasks']} tasks, max queue depth {QUEUE['max_pending']}, pending {QUEUE['pending']}")
+        for pid, (tasks, items, seconds) in sorted(WORKER_STATS.items()):
+            rate = items / seconds if seconds > 0 else 0.0
+            print(f"[parse_pool] worker {pid}: {tasks} tasks, {items} items, {seconds:.2f}s busy, {rate:.0f} items/s")
+        QUEUE["tasks"] = 0
+        QUEUE["max_pending"] = QUEUE["pending"]
+        WORKER_STATS.clear()
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown)
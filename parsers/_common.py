@@ -2,10 +2,17 @@
 import time
 import random
 import os
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+import config
+from parsers import _http_cache
+
 # Набор User-Agent'ов — ротация уменьшает шанс простого блокирования
 UA_LIST = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36",
@@ -23,10 +30,211 @@ BASE_HEADERS = {
 def _choose_ua():
     return random.choice(UA_LIST)
 
-def create_session():
+# Размеры пула keep-alive соединений (на один Session / хост); можно переопределить через env
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 4))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 8))
+
+# Общий на процесс реестр Session по хосту: TCP/TLS соединения переиспользуются
+# между страницами, detail pages и циклами сбора
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# --------------------------
+# Per-host rate limiter (token bucket)
+# --------------------------
+# Случайная добавка к паузе (как в прежнем polite_sleep(delay, delay + 0.5))
+RATE_JITTER = 0.5
+# Максимальный интервал между запросами к хосту после серии 429
+MAX_HOST_INTERVAL = 60.0
+# Ответы, которые считаем «хост мёртв/блокирует» для fast-fail (плюс сетевые ошибки)
+HARD_FAIL_STATUSES = {401, 403, 429, 500, 502, 503, 504}
+
+class HostRateLimiter:
+    """
+    Token bucket на один хост: не больше burst запросов подряд,
+    дальше — один запрос в interval секунд. Потокобезопасный:
+    reserve() бронирует слот и возвращает, сколько ждать (потоки и asyncio).
+    На 429 интервал удваивается (и учитывается Retry-After), на успехах плавно
+    возвращается к базовому.
+    """
+
+    def __init__(self, interval, burst=1):
+        self.lock = threading.Lock()
+        self.base_interval = max(0.0, float(interval))
+        self.interval = self.base_interval
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.failures = 0          # жёстких неудач подряд (fast-fail)
+        self.failing_until = 0.0
+        # счётчики за всё время: удачные загрузки / жёсткие неудачи (см. fetch_counts)
+        self.fetched = 0
+        self.failed = 0
+
+    def configure(self, interval, burst=None):
+        with self.lock:
+            self.base_interval = max(0.0, float(interval))
+            self.interval = max(self.interval, self.base_interval)
+            if burst is not None:
+                self.burst = max(1, int(burst))
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.interval > 0:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+            else:
+                self.tokens = float(self.burst)
+            self.updated = now
+            self.tokens -= 1.0
+            # отрицательные токены — очередь уже забронированных слотов
+            wait = -self.tokens * self.interval if self.tokens < 0 else 0.0
+            wait = max(wait, self.blocked_until - now)
+        if wait > 0:
+            wait += random.uniform(0, RATE_JITTER)
+        return wait
+
+    def penalize(self, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            self.throttled += 1
+            self.interval = min(MAX_HOST_INTERVAL, max(self.interval * 2, 1.0))
+            pause = _parse_retry_after(retry_after)
+            self.blocked_until = max(self.blocked_until, now + (pause if pause is not None else self.interval))
+            self.tokens = min(self.tokens, 0.0)
+
+    def record_failure(self):
+        after = int(config.SETTINGS.get("host_fail_fast_after", 3))
+        with self.lock:
+            self.failures += 1
+            self.failed += 1
+            if after > 0 and self.failures >= after:
+                self.failing_until = time.monotonic() + float(config.SETTINGS.get("host_fail_fast_seconds", 300))
+
+    def is_failing(self):
+        with self.lock:
+            return self.failing_until > time.monotonic()
+
+    def fetch_counts(self):
+        """(удачных загрузок, жёстких неудач) — разница до/после опроса источника, см. collector."""
+        with self.lock:
+            return self.fetched, self.failed
+
+    def on_success(self):
+        with self.lock:
+            self.fetched += 1
+            self.failures = 0
+            self.failing_until = 0.0
+            if self.interval > self.base_interval:
+                self.interval = max(self.base_interval, self.interval * 0.9)
+
+def _parse_retry_after(value):
+    if value in (None, ""):
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+def _rate_key(url):
+    try:
+        return (urlparse(url).hostname or "").lower()
+    except Exception:
+        return ""
+
+def get_rate_limiter(url_or_host):
+    key = _rate_key(url_or_host) if "/" in url_or_host else url_or_host.lower()
+    with _LIMITERS_LOCK:
+        lim = _LIMITERS.get(key)
+        if lim is None:
+            lim = HostRateLimiter(
+                config.SETTINGS.get("delay_between_requests", 1.2),
+                config.SETTINGS.get("rate_limit_burst", 1),
+            )
+            _LIMITERS[key] = lim
+        return lim
+
+def configure_host(url, delay):
+    """Задаёт интервал запросов к хосту url (delay источника из config)."""
+    get_rate_limiter(url).configure(delay)
+
+def throttle(url):
+    """Блокирует текущий поток до свободного слота для хоста url; другие хосты не ждут."""
+    wait = get_rate_limiter(url).reserve()
+    if wait > 0:
+        time.sleep(wait)
+
+def host_failing(url):
+    """Fast-fail: хост подряд отвечал 403/429/5xx или не отвечал — не тратим время до конца паузы."""
+    return get_rate_limiter(url).is_failing()
+
+def note_failure(url, status=None):
+    if status is None or status in HARD_FAIL_STATUSES:
+        get_rate_limiter(url).record_failure()
+
+def rate_limit_stats():
+    with _LIMITERS_LOCK:
+        items = list(_LIMITERS.items())
+    return {host: {"interval": round(lim.interval, 2), "throttled": lim.throttled} for host, lim in items}
+
+class _AdaptiveRetry(Retry):
+    """
+    Retry, который сообщает лимитеру хоста о 429 (с Retry-After) — единственное место штрафа за 429.
+    Паузу перед повтором после 429 тоже выдаёт token bucket хоста, а не собственный sleep urllib3
+    (respect_retry_after_header=False), чтобы Retry-After не отсыпался дважды.
+    """
+
+    _throttle_host = None   # хост, чей лимитер выдаёт паузу перед следующей попыткой
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        host = None
+        if response is not None and response.status == 429 and _pool is not None:
+            host = str(_pool.host)
+            get_rate_limiter(host).penalize(response.headers.get("Retry-After"))
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        retry._throttle_host = host
+        return retry
+
+    def sleep(self, response=None):
+        if self._throttle_host is None:
+            return super().sleep(response)
+        wait = get_rate_limiter(self._throttle_host).reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+# Подмена транспорта requests (запись/воспроизведение фикстур, см. parsers/_replay.py):
+# factory(**kwargs HTTPAdapter) -> adapter; None — обычный HTTPAdapter
+_ADAPTER_FACTORY = None
+
+def set_transport(factory):
+    """Ставит фабрику адаптеров для всех новых Session и сбрасывает реестр get_session()."""
+    global _ADAPTER_FACTORY
+    _ADAPTER_FACTORY = factory
+    close_sessions()
+
+def transport_overridden():
+    return _ADAPTER_FACTORY is not None
+
+def create_session(pool_connections=None, pool_maxsize=None):
     s = requests.Session()
-    retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-    adapter = HTTPAdapter(max_retries=retries)
+    retries = _AdaptiveRetry(
+        total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=False,
+    )
+    adapter = (_ADAPTER_FACTORY or HTTPAdapter)(
+        max_retries=retries,
+        pool_connections=pool_connections or POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize or POOL_MAXSIZE,
+    )
     s.mount("https://", adapter)
     s.mount("http://", adapter)
 
@@ -48,22 +256,165 @@ def create_session():
 
     return s
 
-def safe_get(session, url, timeout=20):
+def _host_key(url):
+    try:
+        return urlparse(url).netloc.lower()
+    except Exception:
+        return ""
+
+def get_session(url):
+    """
+    Возвращает общий keep-alive Session для хоста из url (создаёт при первом обращении).
+    Retry и прокси — как в create_session().
+    """
+    key = _host_key(url)
+    with _SESSIONS_LOCK:
+        s = _SESSIONS.get(key)
+        if s is None:
+            s = create_session()
+            _SESSIONS[key] = s
+        return s
+
+def close_sessions():
+    with _SESSIONS_LOCK:
+        sessions = list(_SESSIONS.values())
+        _SESSIONS.clear()
+    for s in sessions:
+        try:
+            s.close()
+        except Exception:
+            pass
+
+def pool_stats():
+    """
+    Счётчики переиспользования соединений по хостам:
+    {host: {"requests": N, "connections": M, "reused": N - M}}
+    (по данным urllib3-пулов, которые ещё живы в реестре).
+    """
+    with _SESSIONS_LOCK:
+        items = list(_SESSIONS.items())
+    stats = {}
+    for host, s in items:
+        req = conn = 0
+        for adapter in set(s.adapters.values()):
+            pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+            if pools is None:
+                continue
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                req += getattr(pool, "num_requests", 0)
+                conn += getattr(pool, "num_connections", 0)
+        stats[host] = {"requests": req, "connections": conn, "reused": max(0, req - conn)}
+    return stats
+
+def log_pool_stats():
+    stats = pool_stats()
+    req = sum(v["requests"] for v in stats.values())
+    reused = sum(v["reused"] for v in stats.values())
+    print(f"[_common] http pool: {len(stats)} hosts, {req} requests, {reused} on reused connections")
+    for host, st in rate_limit_stats().items():
+        if st["throttled"]:
+            print(f"[_common] rate limited by {host}: {st['throttled']} times, interval now {st['interval']}s")
+
+def response_from_cache(url, not_modified):
+    """Собирает Response(200) из тела в дисковом кэше по ответу 304; None, если тела нет."""
+    entry = _http_cache.cached_entry(url)
+    if entry is None:
+        return None
+    content, content_type, encoding = entry
+    r = requests.Response()
+    r.status_code = 200
+    r._content = content
+    r.url = url
+    r.request = not_modified.request
+    r.headers.update(not_modified.headers)
+    r.headers.pop("Content-Length", None)
+    if content_type:
+        r.headers["Content-Type"] = content_type
+    r.encoding = encoding
+    r.from_cache = True
+    return r
+
+def safe_get(session, url, timeout=20, use_cache=True):
+    if host_failing(url):
+        print(f"[fetch skipped] host is failing, fast-fail for url: {url}")
+        return None
     try:
         # иногда помогает менять UA между попытками
         session.headers["User-Agent"] = _choose_ua()
-        r = session.get(url, timeout=timeout, allow_redirects=True)
+        # conditional GET: If-None-Match / If-Modified-Since из дискового кэша
+        cond = _http_cache.conditional_headers(url) if use_cache else {}
+        throttle(url)
+        r = session.get(url, timeout=timeout, allow_redirects=True, headers=cond or None)
+        if r.status_code == 304 and cond:
+            cached = response_from_cache(url, r)
+            if cached is not None:
+                get_rate_limiter(url).on_success()
+                return cached
+            # запись успели вытеснить — обычный запрос
+            throttle(url)
+            r = session.get(url, timeout=timeout, allow_redirects=True)
         # логируем линк и статус для диагностики
         if r.status_code != 200:
             print(f"[fetch error] {r.status_code} for url: {url}")
+        # 429 лимитер уже учёл в _AdaptiveRetry.increment
         r.raise_for_status()
+        get_rate_limiter(url).on_success()
+        if use_cache:
+            _http_cache.store(url, r.headers, r.content, r.encoding)
         return r
     except requests.HTTPError as e:
         print(f"[fetch error] {e} for url: {url}")
-        return getattr(e, "response", None)
+        resp = getattr(e, "response", None)
+        note_failure(url, getattr(resp, "status_code", None))
+        return resp
     except Exception as e:
         print(f"[fetch error] {e} for url: {url}")
+        note_failure(url)
         return None
 
+def page_is_known(links):
+    """
+    Incremental crawl: True, если все ссылки страницы уже встречались раньше
+    (db.known_links) — дальше по пагинации идти незачем.
+    """
+    if not config.SETTINGS.get("incremental_crawl", True) or not config.SETTINGS.get("enable_db", False):
+        return False
+    links = [l for l in links if l]
+    if not links:
+        return False
+    try:
+        from db import known_links
+        known = known_links()
+    except Exception as e:
+        print("[_common] known links lookup error:", e)
+        return False
+    return all(l in known for l in links)
+
+def emit_page(items, page, max_pages, source_name, early_stop=True):
+    """
+    yield from объявлений страницы; возвращает True, если дальше по пагинации идти незачем
+    (incremental crawl: все ссылки страницы уже известны, см. page_is_known).
+    Проверка — до yield: потребитель может успеть пометить эти ссылки как известные.
+    early_stop=False — для выдачи, у которой порядок «сначала новые» не подтверждён:
+    известная страница там не значит, что дальше нет новых.
+    В парсере: if (yield from emit_page(page_out, p, max_pages, source_name)): break
+    """
+    items = list(items)
+    stop = early_stop and page < max_pages and page_is_known([it.get("link") for it in items])
+    yield from items
+    if stop:
+        print(f"[{source_name}] page {page}: all links already known, stop paging")
+    return stop
+
+def with_query(url, param):
+    """Добавляет к url параметр запроса ("a=b") через ? или &."""
+    if not param:
+        return url
+    return f"{url}&{param}" if "?" in url else f"{url}?{param}"
+
+# Устаревшее: паузы теперь делает throttle() внутри safe_get / agency_template._fetch
 def polite_sleep(min_s=0.8, max_s=1.8):
     time.sleep(random.uniform(min_s, max_s))
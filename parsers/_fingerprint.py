@@ -0,0 +1,147 @@
+# parsers/_fingerprint.py
+# Отпечаток содержимого list page: если страница по сути не изменилась с прошлого цикла,
+# парсинг (BeautifulSoup, карточки, detail pages) пропускается и берутся объявления прошлого разбора.
+# Работает и без ETag/Last-Modified: сравнивается нормализованный текст страницы, из которого
+# выброшены скрипты/стили, рекламные слоты, скрытые поля (CSRF), мета-теги и "плавающие"
+# токены (время, таймстемпы, длинные hex-идентификаторы, cache-buster параметры ссылок).
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+import config
+from parsers._http_cache import CACHE_PATH
+
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS page_items (
+    url TEXT PRIMARY KEY,
+    fingerprint TEXT,
+    items TEXT,
+    updated REAL
+);
+"""
+
+_BLOCK_RE = re.compile(r"<(script|style|noscript|iframe|ins|svg|template)\b[^>]*>.*?</\1\s*>", re.I | re.S)
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.S)
+_HIDDEN_INPUT_RE = re.compile(r"<input\b[^>]*type\s*=\s*['\"]?hidden\b[^>]*>", re.I)
+_META_RE = re.compile(r"<(meta|link)\b[^>]*>", re.I)
+# рекламные контейнеры без вложенных тегов (типичные пустые слоты GPT/AdSense)
+_AD_SLOT_RE = re.compile(
+    r"<div\b[^>]*\b(?:id|class)\s*=\s*['\"][^'\"]*\b(?:ad|ads|advert|adslot|banner|gpt)[-_][^'\"]*['\"][^>]*>[^<]*</div>",
+    re.I,
+)
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w:-]*)([^>]*)>")
+_HREF_RE = re.compile(r"""\bhref\s*=\s*(['"])(.*?)\1""", re.I | re.S)
+_VOLATILE_QS_RE = re.compile(r"([?&])(?:utm_[^=&#]*|_|sid|session[^=&#]*|token|csrf[^=&#]*|ts|t|v|ver|cb)=[^&#]*", re.I)
+_VOLATILE_RE = re.compile(
+    r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?"  # ISO datetime
+    r"|\b\d{1,2}:\d{2}(?::\d{2})?\b"                                                  # время
+    r"|\b[0-9a-f]{24,}\b"                                                             # nonce / hash
+    r"|\b\d{10,}\b",                                                                  # unix ts / счётчики
+    re.I,
+)
+_WS_RE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_conn = None
+
+# source -> [pages, skipped]
+PAGE_STATS = {}
+
+
+def _keep_tag(m):
+    # от тега остаются имя и href (ссылки карточек); классы/id/data-* часто генерируются
+    href = _HREF_RE.search(m.group(3))
+    if href:
+        link = _VOLATILE_QS_RE.sub(r"\1", href.group(2))
+        return f"<{m.group(1)}{m.group(2).lower()} {link}>"
+    return f"<{m.group(1)}{m.group(2).lower()}>"
+
+
+def normalize_page(html):
+    s = html or ""
+    s = _BLOCK_RE.sub(" ", s)
+    s = _COMMENT_RE.sub(" ", s)
+    s = _HIDDEN_INPUT_RE.sub(" ", s)
+    s = _META_RE.sub(" ", s)
+    s = _AD_SLOT_RE.sub(" ", s)
+    s = _TAG_RE.sub(_keep_tag, s)
+    s = _VOLATILE_RE.sub("#", s)
+    return _WS_RE.sub(" ", s).strip()
+
+
+def page_fingerprint(html):
+    return hashlib.sha1(normalize_page(html).encode("utf-8", "replace")).hexdigest()
+
+
+def enabled():
+    return bool(config.SETTINGS.get("page_fingerprint", True))
+
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_PATH, timeout=30, check_same_thread=False)
+        _conn.execute(CREATE_SQL)
+    return _conn
+
+
+def _count(source, skipped):
+    st = PAGE_STATS.setdefault(source or "?", [0, 0])
+    st[0] += 1
+    if skipped:
+        st[1] += 1
+
+
+def cached_items(url, html, source=None):
+    """
+    Объявления прошлого разбора этой страницы, если отпечаток не изменился; иначе None.
+    Переиспользуется только разбор: дальше объявления идут через классификацию, БД и уведомления
+    как свежие (classify_cache и проверка дубликатов делают это дешёвым).
+    """
+    if not enabled():
+        return None
+    fp = page_fingerprint(html)
+    try:
+        with _lock:
+            row = _get_conn().execute(
+                "SELECT items FROM page_items WHERE url = ? AND fingerprint = ?", (url, fp)
+            ).fetchone()
+    except Exception as e:
+        print("[fingerprint] read error:", e)
+        return None
+    items = None
+    if row and row[0] is not None:
+        try:
+            items = json.loads(row[0])
+        except Exception:
+            items = None
+    _count(source, items is not None)
+    return items
+
+
+def put_items(url, html, items):
+    """Запоминает отпечаток страницы и разобранные с неё объявления."""
+    if not enabled():
+        return
+    try:
+        data = json.dumps(items, ensure_ascii=False, default=str)
+        with _lock:
+            conn = _get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO page_items (url, fingerprint, items, updated) VALUES (?, ?, ?, ?)",
+                (url, page_fingerprint(html), data, time.time()),
+            )
+            conn.commit()
+    except Exception as e:
+        print("[fingerprint] write error:", e)
+
+
+def log_stats():
+    for source, (pages, skipped) in sorted(PAGE_STATS.items()):
+        rate = 100.0 * skipped / pages if pages else 0.0
+        print(f"[fingerprint] {source}: {skipped}/{pages} pages unchanged ({rate:.0f}% parse skipped)")
+    PAGE_STATS.clear()
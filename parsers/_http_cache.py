@@ -0,0 +1,164 @@
+# parsers/_http_cache.py
+# Дисковый кэш ответов для conditional GET (ETag / Last-Modified).
+# - перед запросом: conditional_headers(url) -> If-None-Match / If-Modified-Since
+# - ответ 200 с валидаторами: store(...) сохраняет тело (zlib) и валидаторы
+# - ответ 304: cached_entry(url) отдаёт сохранённое тело, сеть не качает его заново
+# Повторное использование разобранных объявлений при 304 / неизменной странице — parsers/_fingerprint.py
+# Размер ограничен (LRU по времени последнего обращения), есть счётчики hit/miss/bytes saved:
+# miss — при поиске записи (нет записи для conditional GET или тело на 304 вытеснено/повреждено).
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import config
+
+CACHE_PATH = os.getenv("HTTP_CACHE_PATH", "http_cache.db")
+MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS http_cache (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_type TEXT,
+    encoding TEXT,
+    body BLOB,
+    size INTEGER,
+    last_access REAL
+);
+"""
+
+_lock = threading.Lock()
+_conn = None
+_total_bytes = 0
+
+STATS = {"hits": 0, "misses": 0, "bytes_saved": 0, "evicted": 0}
+
+
+def enabled():
+    return bool(config.SETTINGS.get("http_cache", True))
+
+
+def _get_conn():
+    global _conn, _total_bytes
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_PATH, timeout=30, check_same_thread=False)
+        _conn.execute(CREATE_SQL)
+        row = _conn.execute("SELECT COALESCE(SUM(LENGTH(body)), 0) FROM http_cache").fetchone()
+        _total_bytes = int(row[0] or 0)
+    return _conn
+
+
+def conditional_headers(url):
+    """Заголовки If-None-Match / If-Modified-Since для url (пустой dict, если записи нет)."""
+    if not enabled():
+        return {}
+    try:
+        with _lock:
+            row = _get_conn().execute(
+                "SELECT etag, last_modified FROM http_cache WHERE url = ?", (url,)
+            ).fetchone()
+    except Exception as e:
+        print("[http_cache] read error:", e)
+        return {}
+    if not row:
+        STATS["misses"] += 1
+        return {}
+    headers = {}
+    if row[0]:
+        headers["If-None-Match"] = row[0]
+    if row[1]:
+        headers["If-Modified-Since"] = row[1]
+    return headers
+
+
+def store(url, headers, content, encoding=None):
+    """Сохраняет ответ 200, если у него есть ETag или Last-Modified."""
+    global _total_bytes
+    if not enabled() or content is None:
+        return
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return
+    packed = zlib.compress(content, 6)
+    try:
+        with _lock:
+            conn = _get_conn()
+            old = conn.execute("SELECT LENGTH(body) FROM http_cache WHERE url = ?", (url,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO http_cache "
+                "(url, etag, last_modified, content_type, encoding, body, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, headers.get("Content-Type"), encoding,
+                 packed, len(content), time.time()),
+            )
+            _total_bytes += len(packed) - (int(old[0] or 0) if old else 0)
+            _evict_locked(conn)
+            conn.commit()
+    except Exception as e:
+        print("[http_cache] write error:", e)
+
+
+def _evict_locked(conn):
+    global _total_bytes
+    if _total_bytes <= MAX_BYTES:
+        return
+    rows = conn.execute("SELECT url, LENGTH(body) FROM http_cache ORDER BY last_access").fetchall()
+    for url, size in rows:
+        if _total_bytes <= MAX_BYTES:
+            break
+        conn.execute("DELETE FROM http_cache WHERE url = ?", (url,))
+        _total_bytes -= int(size or 0)
+        STATS["evicted"] += 1
+
+
+def cached_entry(url):
+    """
+    Для ответа 304: возвращает (content_bytes, content_type, encoding) из кэша
+    и обновляет время обращения. None, если записи уже нет.
+    """
+    global _total_bytes
+    try:
+        with _lock:
+            conn = _get_conn()
+            row = conn.execute(
+                "SELECT body, content_type, encoding, size FROM http_cache WHERE url = ?", (url,)
+            ).fetchone()
+            if not row:
+                STATS["misses"] += 1
+                return None
+            try:
+                content = zlib.decompress(row[0])
+            except zlib.error as e:
+                # повреждённая запись — удаляем, страница будет скачана заново
+                print("[http_cache] corrupt entry dropped:", e)
+                conn.execute("DELETE FROM http_cache WHERE url = ?", (url,))
+                conn.commit()
+                _total_bytes -= len(row[0] or b"")
+                STATS["misses"] += 1
+                return None
+            conn.execute("UPDATE http_cache SET last_access = ? WHERE url = ?", (time.time(), url))
+            conn.commit()
+    except Exception as e:
+        print("[http_cache] read error:", e)
+        return None
+    STATS["hits"] += 1
+    STATS["bytes_saved"] += int(row[3] or 0)
+    return content, row[1], row[2]
+
+
+def log_stats():
+    """Счётчики за цикл сбора (после вывода обнуляются); кэш выключен — строки нет."""
+    if not enabled():
+        return
+    print(
+        f"[http_cache] hits={STATS['hits']} misses={STATS['misses']} "
+        f"bytes_saved={STATS['bytes_saved']} "
+        f"evicted={STATS['evicted']} size={_total_bytes}"
+    )
+    for k in STATS:
+        STATS[k] = 0
@@ -0,0 +1,169 @@
+# parsers/_jsonld.py
+# JSON-LD (schema.org) прямо из сырых байт ответа — без BeautifulSoup.
+# На больших страницах выдачи (Fotocasa) построение дерева soup ради пары
+# <script type="application/ld+json"> занимает основную часть времени и памяти;
+# здесь блоки вырезаются регуляркой по bytes и разбираются быстрым JSON (orjson, если установлен).
+# Используется в parsers.fotocasa, parsers.kyero, parsers.idealista.
+
+import json
+import re
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+_SCRIPT_RE = re.compile(
+    rb"<script\b[^>]*\btype\s*=\s*(['\"]?)application/ld\+json\1[^>]*>(.*?)</script\s*>",
+    re.I | re.S,
+)
+
+# типы schema.org, которые считаются объявлениями; всё остальное (шапка сайта, хлебные крошки,
+# поиск, агентство, FAQ, Event и т.п.) пропускается. Ещё два вида, как в прежнем разборе Fotocasa:
+# Product — только с offers (цена есть — это объект продажи), ListItem — элемент выдачи ItemList
+# без вложенного item (сам со ссылкой и названием)
+LISTING_TYPES = {
+    "realestatelisting", "residence", "singlefamilyresidence", "apartment", "house", "offer",
+    "accommodation", "listitem",
+}
+# JSON-LD заметно беднее карточек на странице (в разметке только часть выдачи) — разбирается HTML.
+# Карточки считаются (строится soup) только если объявлений в JSON-LD меньше полной страницы
+# выдачи: FULL_PAGE и больше — разметка и так описывает всю страницу (на этих сайтах 20–40 карточек)
+MIN_CARD_SHARE = 0.5
+FULL_PAGE = 20
+
+
+def _as_bytes(raw, encoding=None):
+    if isinstance(raw, (bytes, bytearray)):
+        return bytes(raw)
+    return (raw or "").encode(encoding or "utf-8", "replace")
+
+
+def loads(chunk, encoding=None):
+    """bytes -> объект JSON; orjson, если есть, иначе json. Не UTF-8 байты декодируются по encoding."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(chunk)
+        except orjson.JSONDecodeError:
+            pass  # не UTF-8 или нестрогий JSON — дальше разбирается стандартным json
+    try:
+        return json.loads(chunk)
+    except UnicodeDecodeError:
+        return json.loads(chunk.decode(encoding or "utf-8", "replace"))
+
+
+def blocks(raw, encoding=None):
+    """Содержимое всех <script type="application/ld+json"> страницы (bytes, без пробелов по краям)."""
+    out = []
+    for m in _SCRIPT_RE.finditer(_as_bytes(raw, encoding)):
+        body = m.group(2).strip()
+        if body:
+            out.append(body)
+    return out
+
+
+def parse_block(body, encoding=None):
+    try:
+        return loads(body, encoding)
+    except Exception:
+        # иногда в теге несколько JSON объектов или мусор — пробуем выделить JSON внутри
+        try:
+            start = body.find(b"{")
+            end = body.rfind(b"}") + 1
+            if start < 0 or end <= start:
+                return None
+            return loads(body[start:end], encoding)
+        except Exception:
+            return None
+
+
+def ld_objects(data):
+    """Плоский список объектов: dict / list / @graph / ItemList.itemListElement ({"item": {...}} или сами объекты)."""
+    if isinstance(data, list):
+        return data
+    if not isinstance(data, dict):
+        return []
+    if str(data.get("@type") or "").lower() == "breadcrumblist":
+        # элементы хлебных крошек — навигация, не выдача
+        return []
+    if isinstance(data.get("@graph"), list):
+        return data["@graph"]
+    if isinstance(data.get("itemListElement"), list):
+        items = []
+        for el in data["itemListElement"]:
+            if isinstance(el, dict) and isinstance(el.get("item"), dict):
+                items.append(el["item"])
+            else:
+                items.append(el)
+        return items
+    return [data]
+
+
+def _is_listing(el):
+    t = el.get("@type")
+    types = [x.lower() for x in (t if isinstance(t, list) else [t]) if isinstance(x, str)]
+    if "product" in types and el.get("offers"):
+        return True
+    return any(x in LISTING_TYPES for x in types)
+
+
+def _link(el):
+    """url, иначе @id — если это адрес страницы, а не фрагмент «#...» или пустой узел «_:...»."""
+    link = el.get("url")
+    if isinstance(link, str) and link:
+        return link
+    link = el.get("@id")
+    if isinstance(link, str) and link and not link.startswith(("#", "_:")):
+        return link
+    return ""
+
+
+def covers_cards(json_items, count_cards):
+    """
+    JSON-LD можно брать вместо HTML: объявлений в нём не заметно меньше, чем карточек на странице.
+    count_cards() — число карточек в HTML; вызывается, только когда JSON-LD меньше FULL_PAGE.
+    """
+    if not json_items:
+        return False
+    if len(json_items) >= FULL_PAGE:
+        return True
+    return len(json_items) >= count_cards() * MIN_CARD_SHARE
+
+
+def listing_items(raw, encoding=None):
+    """
+    Объявления из JSON-LD страницы: list[dict] с title, address, price (сырой), link.
+    Берутся только объекты типов LISTING_TYPES (и Product с offers) со ссылкой (url или @id);
+    у Offer название, адрес и ссылка могут лежать в itemOffered.
+    Пустой список — структурированных данных нет, нужен разбор HTML.
+    """
+    out = []
+    for body in blocks(raw, encoding):
+        data = parse_block(body, encoding)
+        if data is None:
+            continue
+        for el in ld_objects(data):
+            if not isinstance(el, dict) or not _is_listing(el):
+                continue
+            offered = el.get("itemOffered") if isinstance(el.get("itemOffered"), dict) else {}
+            link = _link(el) or _link(offered)
+            if not link:
+                # без ссылки объявление не сохранить и не проверить на дубли — это не карточка выдачи
+                continue
+            title = el.get("name") or el.get("headline") or offered.get("name") or ""
+            address = el.get("address") or offered.get("address") or ""
+            price = el.get("price") or ""
+            # цена обычно внутри offers
+            offers = el.get("offers") or el.get("priceSpecification") or {}
+            if isinstance(offers, dict):
+                price = price or offers.get("price") or offers.get("priceCurrency") or ""
+            elif isinstance(offers, str):
+                price = price or offers
+            out.append({
+                "title": title,
+                "address": address if isinstance(address, str) else "",
+                "price": price,
+                "link": link,
+            })
+    return out
@@ -0,0 +1,108 @@
+# parsers/_lxml_extract.py
+# Быстрое извлечение карточек для agency_template без BeautifulSoup.
+# Каскады селекторов (CARD/TITLE/PRICE/ADDRESS/DESC/LINK_SELECTORS) один раз компилируются
+# через cssselect в XPath (lxml.etree.XPath) и выполняются прямо на дереве lxml.
+# Результат совпадает с parse_card / parse_list_page на BeautifulSoup(html, "lxml"):
+# - select_one внутри карточки = первый потомок (без самой карточки) в порядке документа
+# - текст = get_text(" ", strip=True): куски текста strip()-аются, пустые выкидываются,
+#   комментарии и содержимое <script>/<style>/<template> не учитываются
+
+from cssselect import GenericTranslator
+from lxml import etree
+
+_translator = GenericTranslator()
+
+# теги, строки внутри которых BeautifulSoup не отдаёт в get_text()
+_SKIP_TEXT_TAGS = {"script", "style", "template"}
+
+
+# (selector, prefix) -> etree.XPath: один и тот же селектор компилируется один раз на процесс
+_COMPILED = {}
+
+
+def compile_selector(sel, prefix="descendant::"):
+    key = (sel, prefix)
+    xp = _COMPILED.get(key)
+    if xp is None:
+        xp = etree.XPath(_translator.css_to_xpath(sel, prefix=prefix))
+        _COMPILED[key] = xp
+    return xp
+
+
+def compile_cascade(selectors, prefix="descendant::"):
+    """Список CSS-селекторов -> список скомпилированных XPath (порядок приоритета сохраняется)."""
+    return [compile_selector(sel, prefix) for sel in selectors]
+
+
+class Cascade:
+    """Каскад селекторов: первый селектор, который что-то нашёл, выигрывает."""
+
+    def __init__(self, selectors, prefix="descendant::"):
+        self.selectors = list(selectors)
+        self.prefix = prefix
+        self.xpaths = compile_cascade(self.selectors, prefix)
+
+    def reordered(self, selectors):
+        """Тот же каскад, но в другом порядке / с подмножеством селекторов (для профилей доменов)."""
+        return Cascade(selectors, self.prefix)
+
+    def first_indexed(self, el):
+        # (элемент, селектор) — какой селектор каскада сработал; (None, None), если ни один
+        for sel, xp in zip(self.selectors, self.xpaths):
+            found = xp(el)
+            if found:
+                return found[0], sel
+        return None, None
+
+    def first(self, el):
+        # аналог цикла `for sel in SELECTORS: x = card.select_one(sel); if x: break`
+        return self.first_indexed(el)[0]
+
+    def all_indexed(self, el):
+        for sel, xp in zip(self.selectors, self.xpaths):
+            found = xp(el)
+            if found:
+                return found, sel
+        return [], None
+
+    def all(self, el):
+        # аналог цикла `for sel in SELECTORS: found = soup.select(sel); if found: break`
+        return self.all_indexed(el)[0]
+
+
+def parse_document(html):
+    """html (str|bytes) -> корневой элемент lxml или None, если разобрать не удалось."""
+    if not html:
+        return None
+    try:
+        return etree.HTML(html)
+    except (etree.ParserError, etree.XMLSyntaxError, ValueError):
+        # например str с XML-декларацией кодировки — пусть разбирает BeautifulSoup
+        return None
+
+
+def _collect_text(el, out, top):
+    tag = el.tag
+    if not isinstance(tag, str):
+        # комментарий / processing instruction: их текст не нужен, хвост — нужен
+        pass
+    elif top or tag.lower() not in _SKIP_TEXT_TAGS:
+        if el.text:
+            s = el.text.strip()
+            if s:
+                out.append(s)
+        for child in el:
+            _collect_text(child, out, False)
+    if not top and el.tail:
+        s = el.tail.strip()
+        if s:
+            out.append(s)
+
+
+def text_of(el):
+    """Эквивалент el.get_text(" ", strip=True) из BeautifulSoup."""
+    if el is None:
+        return ""
+    out = []
+    _collect_text(el, out, True)
+    return " ".join(out)
@@ -0,0 +1,153 @@
+# parsers/_replay.py
+# Запись и воспроизведение HTTP-фикстур для офлайн-бенчмарков (bench.py).
+# - record_to(path): все запросы safe_get / agency_template._fetch идут в сеть как обычно,
+#   ответы складываются в сжатый архив (gzip JSON lines: url, status, headers, body)
+# - replay_from(path, latency, jitter, error_rate): ответы отдаются из архива без сети,
+#   с искусственной задержкой, разбросом и инъекцией ошибок (таймаут / 500 / 429)
+# Работает через подмену транспорта requests (parsers._common.set_transport).
+
+import base64
+import gzip
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from parsers._common import set_transport
+
+# Заголовки, которые не имеет смысла хранить/отдавать из фикстуры
+_SKIP_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "set-cookie", "connection"}
+
+_stats_lock = threading.Lock()
+
+
+def load_archive(path):
+    fixtures = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            fixtures[rec["url"]] = rec
+    return fixtures
+
+
+class Recorder:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records = {}
+
+    def add(self, url, response):
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _SKIP_HEADERS}
+        rec = {
+            "url": url,
+            "status": response.status_code,
+            "headers": headers,
+            "encoding": response.encoding,
+            "body": base64.b64encode(response.content or b"").decode("ascii"),
+        }
+        with self.lock:
+            self.records[url] = rec
+
+    def save(self):
+        with self.lock:
+            records = list(self.records.values())
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        print(f"[replay] recorded {len(records)} responses to {self.path}")
+        return len(records)
+
+
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, recorder, **kwargs):
+        self.recorder = recorder
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        try:
+            self.recorder.add(request.url, response)
+        except Exception as e:
+            print("[replay] record error:", e)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Отдаёт ответы из архива; неизвестные URL — 404."""
+
+    def __init__(self, fixtures, latency=0.0, jitter=0.0, error_rate=0.0, stats=None, **_kwargs):
+        super().__init__()
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stats = stats if stats is not None else new_stats()
+
+    def send(self, request, **kwargs):
+        t0 = time.perf_counter()
+        outcome = "served"
+        try:
+            delay = self.latency + random.uniform(-self.jitter, self.jitter)
+            if delay > 0:
+                time.sleep(delay)
+            if self.error_rate and random.random() < self.error_rate:
+                kind = random.choice(("timeout", 500, 429))
+                outcome = "errors"
+                if kind == "timeout":
+                    raise requests.exceptions.ConnectTimeout(f"injected timeout for {request.url}", request=request)
+                return self._build(request, {"status": kind, "headers": {"Retry-After": "1"}, "body": ""})
+            rec = self.fixtures.get(request.url)
+            if rec is None:
+                outcome = "missing"
+                return self._build(request, {"status": 404, "headers": {}, "body": ""})
+            return self._build(request, rec)
+        finally:
+            with _stats_lock:
+                self.stats[outcome] += 1
+                self.stats["requests"] += 1
+                self.stats["fetch_seconds"] += time.perf_counter() - t0
+
+    def _build(self, request, rec):
+        r = requests.Response()
+        r.status_code = int(rec.get("status") or 200)
+        r.headers = CaseInsensitiveDict(rec.get("headers") or {})
+        r._content = base64.b64decode(rec.get("body") or "")
+        r.encoding = rec.get("encoding") or requests.utils.get_encoding_from_headers(r.headers)
+        r.url = request.url
+        r.request = request
+        r.reason = "Replayed"
+        return r
+
+    def close(self):
+        pass
+
+
+def new_stats():
+    return {"requests": 0, "served": 0, "missing": 0, "errors": 0, "fetch_seconds": 0.0}
+
+
+def record_to(path):
+    """Включает запись; вернёт Recorder — по окончании вызвать .save() и stop()."""
+    recorder = Recorder(path)
+    set_transport(lambda **kw: RecordingAdapter(recorder, **kw))
+    return recorder
+
+
+def replay_from(path, latency=0.0, jitter=0.0, error_rate=0.0):
+    """Включает воспроизведение из архива; возвращает dict со счётчиками."""
+    fixtures = load_archive(path)
+    stats = new_stats()
+    set_transport(lambda **kw: ReplayAdapter(fixtures, latency, jitter, error_rate, stats, **kw))
+    print(f"[replay] {len(fixtures)} fixtures loaded from {path}")
+    return stats
+
+
+def stop():
+    set_transport(None)
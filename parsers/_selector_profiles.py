@@ -0,0 +1,256 @@
+# parsers/_selector_profiles.py
+# Профили селекторов по доменам для agency_template (lxml-движок).
+# Шаблон не знает разметку конкретного сайта и на каждой странице перебирает каскады
+# CARD/TITLE/PRICE/... заново. Здесь запоминаем, какие селекторы реально дали валидные
+# объявления на домене (hit rate по каждому полю), и после PROFILE_MIN_PAGES страниц:
+# - карточки ищем только победившим селектором карточек,
+# - для полей сначала пробуем победителей, остальное — в прежнем порядке,
+# - если выход валидных объявлений упал (вёрстка поменялась) — страница разбирается
+#   полным перебором, а после PROFILE_MAX_MISSES таких страниц подряд профиль сбрасывается.
+# Профили хранятся в JSON (SELECTOR_PROFILES_PATH) и переживают рестарт.
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import config
+
+PROFILES_PATH = os.getenv("SELECTOR_PROFILES_PATH", "selector_profiles.json")
+
+PROFILE_MIN_PAGES = 3       # страниц полного перебора до включения профиля
+PROFILE_MIN_SHARE = 0.8     # доля валидных объявлений, которые дал победитель
+YIELD_ALPHA = 0.3           # вес последней страницы в EWMA выхода (валидных объявлений на страницу)
+YIELD_DROP = 0.5            # страница с профилем дала меньше этой доли от обычного — перепроверяем
+PROFILE_MAX_MISSES = 2      # столько «провалов» подряд — профиль сбрасывается и учится заново
+SAVE_EVERY = 30.0           # не чаще, чем раз в столько секунд, пишем файл
+
+FIELDS = ("title", "price", "link", "address", "description")
+
+
+def is_valid_item(it):
+    """Объявление, которое имеет смысл классифицировать: есть ссылка и название или цена."""
+    return bool(it.get("link")) and (bool(it.get("title")) or it.get("price") is not None)
+
+
+class PageStats:
+    """Что сработало на одной странице: селектор карточек и селекторы полей валидных объявлений."""
+
+    def __init__(self, card_selector):
+        self.card_selector = card_selector
+        self.cards = 0
+        self.valid = 0
+        self.fields = {f: {} for f in FIELDS}
+
+    def add(self, item, matched):
+        self.cards += 1
+        if not is_valid_item(item):
+            return
+        self.valid += 1
+        for field, sel in matched.items():
+            if sel is not None:
+                self.fields[field][sel] = self.fields[field].get(sel, 0) + 1
+
+
+class DomainProfile:
+    def __init__(self, domain):
+        self.domain = domain
+        self.pages = 0              # страниц, разобранных полным перебором
+        self.profiled_pages = 0     # страниц, разобранных по профилю
+        self.misses = 0             # провалов профиля подряд
+        self.resets = 0
+        self.yield_ewma = 0.0
+        self.cards = {}             # card selector -> валидных объявлений
+        self.fields = {f: {} for f in FIELDS}  # field -> selector -> хитов
+        self.updated = 0.0
+
+    def to_dict(self):
+        return {
+            "pages": self.pages,
+            "profiled_pages": self.profiled_pages,
+            "misses": self.misses,
+            "resets": self.resets,
+            "yield": self.yield_ewma,
+            "cards": self.cards,
+            "fields": self.fields,
+            "updated": self.updated,
+        }
+
+    def load(self, d):
+        self.pages = int(d.get("pages", 0))
+        self.profiled_pages = int(d.get("profiled_pages", 0))
+        self.misses = int(d.get("misses", 0))
+        self.resets = int(d.get("resets", 0))
+        self.yield_ewma = float(d.get("yield", 0.0))
+        self.cards = {k: int(v) for k, v in (d.get("cards") or {}).items()}
+        for f in FIELDS:
+            self.fields[f] = {k: int(v) for k, v in ((d.get("fields") or {}).get(f) or {}).items()}
+        self.updated = float(d.get("updated", 0.0))
+
+    def _winner(self, counts):
+        total = sum(counts.values())
+        if not total:
+            return None, 0.0
+        sel = max(counts, key=counts.get)
+        return sel, counts[sel] / total
+
+    def card_selector(self):
+        """Победивший селектор карточек или None, если профиль ещё не готов."""
+        if self.pages < PROFILE_MIN_PAGES:
+            return None
+        sel, share = self._winner(self.cards)
+        return sel if share >= PROFILE_MIN_SHARE else None
+
+    def field_order(self, field, selectors):
+        """Селекторы поля: сначала давшие хиты на этом домене (по убыванию), затем остальные."""
+        counts = self.fields.get(field) or {}
+        hit = sorted((s for s in selectors if counts.get(s)), key=lambda s: -counts[s])
+        return hit + [s for s in selectors if s not in counts or not counts[s]]
+
+    def min_valid(self):
+        """Сколько валидных объявлений должна дать страница, чтобы профиль считался рабочим."""
+        if self.yield_ewma <= 0:
+            return 1.0
+        return max(1.0, self.yield_ewma * YIELD_DROP)
+
+    def yield_ok(self, valid):
+        return valid >= self.min_valid()
+
+    def _add_yield(self, valid):
+        if self.yield_ewma <= 0:
+            self.yield_ewma = float(valid)
+        else:
+            self.yield_ewma = YIELD_ALPHA * valid + (1 - YIELD_ALPHA) * self.yield_ewma
+
+    def record_discovery(self, stats):
+        self.pages += 1
+        if stats.card_selector is not None and stats.valid:
+            self.cards[stats.card_selector] = self.cards.get(stats.card_selector, 0) + stats.valid
+        for f in FIELDS:
+            dst = self.fields[f]
+            for sel, n in stats.fields[f].items():
+                dst[sel] = dst.get(sel, 0) + n
+        self._add_yield(stats.valid)
+        self.updated = time.time()
+
+    def record_profiled(self, stats):
+        self.profiled_pages += 1
+        self.misses = 0
+        for f in FIELDS:
+            dst = self.fields[f]
+            for sel, n in stats.fields[f].items():
+                dst[sel] = dst.get(sel, 0) + n
+        self._add_yield(stats.valid)
+        self.updated = time.time()
+
+    def record_miss(self):
+        self.misses += 1
+        if self.misses >= PROFILE_MAX_MISSES:
+            print(f"[profiles] {self.domain}: yield dropped {self.misses} pages in a row, relearning selectors")
+            self.resets += 1
+            self.misses = 0
+            self.pages = 0
+            self.yield_ewma = 0.0
+            self.cards = {}
+            self.fields = {f: {} for f in FIELDS}
+        self.updated = time.time()
+
+
+class ProfileStore:
+    def __init__(self, path=PROFILES_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.profiles = {}
+        self.dirty = False
+        self.last_save = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print("[profiles] load error:", e)
+            return
+        for domain, d in (data or {}).items():
+            p = DomainProfile(domain)
+            p.load(d)
+            self.profiles[domain] = p
+
+    def get(self, url):
+        domain = (urlparse(url).hostname or url or "").lower()
+        if domain.startswith("www."):
+            domain = domain[4:]
+        with self.lock:
+            p = self.profiles.get(domain)
+            if p is None:
+                p = DomainProfile(domain)
+                self.profiles[domain] = p
+            return p
+
+    def update(self, fn, *args):
+        """Изменения профиля — под общим замком (страницы одного домена могут разбираться параллельно)."""
+        with self.lock:
+            fn(*args)
+            self.dirty = True
+            due = time.monotonic() - self.last_save >= SAVE_EVERY
+        if due:
+            self.save()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {d: p.to_dict() for d, p in self.profiles.items()}
+            self.dirty = False
+            self.last_save = time.monotonic()
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print("[profiles] save error:", e)
+
+    def log_stats(self):
+        with self.lock:
+            profiles = sorted(self.profiles.values(), key=lambda p: p.domain)
+        for p in profiles:
+            if not p.pages and not p.profiled_pages:
+                continue
+            card = p.card_selector()
+            state = f"card={card!r}" if card else f"learning {p.pages}/{PROFILE_MIN_PAGES}"
+            print(
+                f"[profiles] {p.domain}: {state}, {p.profiled_pages} pages by profile, "
+                f"yield {p.yield_ewma:.1f}/page, resets {p.resets}"
+            )
+
+
+def enabled():
+    return bool(config.SETTINGS.get("selector_profiles", True))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProfileStore()
+        return _store
+
+
+def save():
+    if _store is not None:
+        _store.save()
+
+
+def log_stats():
+    if _store is not None:
+        _store.log_stats()
+        _store.save()
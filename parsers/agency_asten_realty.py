@@ -1,5 +1,7 @@
 # parsers/agency_asten_realty.py
 from .agency_template import get_listings as base_get_listings
+from .agency_template import async_get_listings as base_async_get_listings
+from .agency_template import iter_listings as base_iter_listings
 
 START_URL = "https://www.astenrealty.com/"
 SOURCE_NAME = "ASTEN Realty"
@@ -8,3 +10,13 @@ def get_listings(start_url=None, max_pages=1, delay=1.2, source_name=None):
     url = start_url or START_URL
     name = source_name or SOURCE_NAME
     return base_get_listings(url, max_pages=max_pages, delay=delay, source_name=name)
+
+async def async_get_listings(fetch, start_url=None, max_pages=1, delay=1.2, source_name=None):
+    url = start_url or START_URL
+    name = source_name or SOURCE_NAME
+    return await base_async_get_listings(fetch, url, max_pages=max_pages, delay=delay, source_name=name)
+
+def iter_listings(start_url=None, max_pages=1, delay=1.2, source_name=None):
+    url = start_url or START_URL
+    name = source_name or SOURCE_NAME
+    return base_iter_listings(url, max_pages=max_pages, delay=delay, source_name=name)
@@ -13,6 +13,15 @@ from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import re
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from parsers import _http_cache, _fingerprint, _lxml_extract, _selector_profiles
+from parsers._common import (
+    get_session, response_from_cache, throttle, configure_host, get_rate_limiter, emit_page, page_is_known,
+    host_failing, note_failure,
+)
 
 HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; TenerifeBot/1.0)"}
 
@@ -43,16 +52,66 @@ LINK_SELECTORS = [
     "a[href]"
 ]
 
-def _fetch(url, timeout=18):
+# каскады селекторов, скомпилированные в XPath для lxml-движка (строятся один раз, лениво)
+_CASCADES = None
+
+# сколько detail pages качать параллельно (SETTINGS["detail_workers"])
+DETAIL_WORKERS = 4
+
+# ранняя остановка пагинации (incremental crawl): START_URL агентств — главные страницы сайтов,
+# порядок выдачи не проверен (часто это фиксированный блок «featured»), поэтому выключена.
+# Обёртка, у которой URL подтверждённо отдаёт «сначала новые», передаёт early_stop=True.
+EARLY_STOP = False
+
+def _fetch_response(url, timeout=18, use_cache=True):
+    if host_failing(url):
+        print(f"[agency_template] host is failing, fast-fail for {url}")
+        return None
     try:
-        r = requests.get(url, headers=HEADERS, timeout=timeout)
+        # общий keep-alive Session на хост (parsers._common) вместо голого requests.get
+        session = get_session(url)
+        headers = dict(HEADERS)
+        cond = _http_cache.conditional_headers(url) if use_cache else {}
+        headers.update(cond)
+        # пауза только для этого хоста (token bucket в parsers._common)
+        throttle(url)
+        r = session.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304 and cond:
+            cached = response_from_cache(url, r)
+            if cached is not None:
+                get_rate_limiter(url).on_success()
+                return cached
+            throttle(url)
+            r = session.get(url, headers=HEADERS, timeout=timeout)
+        # 429 лимитер уже учёл в _AdaptiveRetry.increment (parsers._common)
         r.raise_for_status()
-        return r.text
+        get_rate_limiter(url).on_success()
+        if use_cache:
+            _http_cache.store(url, r.headers, r.content, r.encoding)
+        return r
+    except requests.HTTPError as e:
+        print(f"[agency_template] fetch error for {url}: {e}")
+        note_failure(url, getattr(e.response, "status_code", None))
+        return None
     except Exception as e:
         # возврат None — обработаем в вызывающем коде
         print(f"[agency_template] fetch error for {url}: {e}")
+        note_failure(url)
         return None
 
+def _fetch(url, timeout=18):
+    r = _fetch_response(url, timeout=timeout)
+    return r.text if r is not None else None
+
+def _parse_cached(url, html, base_url, detail_cache=None, source_name=None):
+    # страница не изменилась (304 / тот же отпечаток) — берём объявления прошлого разбора
+    items = _fingerprint.cached_items(url, html, source_name)
+    if items is not None:
+        return items
+    items = parse_list_page(html, base_url, detail_cache)
+    _fingerprint.put_items(url, html, items)
+    return items
+
 def _parse_price(text):
     if not text:
         return None
@@ -127,7 +186,148 @@ def parse_card(card, base_url):
 
     return item
 
-def parse_list_page(html, base_url):
+def _cascades():
+    global _CASCADES
+    if _CASCADES is None:
+        _CASCADES = {
+            # soup.select(...) на документе ищет и среди самого <html>
+            "card": _lxml_extract.Cascade(CARD_SELECTORS, prefix="descendant-or-self::"),
+            "fallback_card": _lxml_extract.Cascade(["a[href]"], prefix="descendant-or-self::"),
+            "title": _lxml_extract.Cascade(TITLE_SELECTORS),
+            "price": _lxml_extract.Cascade(PRICE_SELECTORS),
+            "link": _lxml_extract.Cascade(LINK_SELECTORS),
+            "address": _lxml_extract.Cascade(ADDRESS_SELECTORS),
+            "description": _lxml_extract.Cascade(DESC_SELECTORS),
+            # _first_matching(dsoup, ...) на detail page
+            "doc_price": _lxml_extract.Cascade(PRICE_SELECTORS, prefix="descendant-or-self::"),
+            "doc_address": _lxml_extract.Cascade(ADDRESS_SELECTORS, prefix="descendant-or-self::"),
+            "doc_description": _lxml_extract.Cascade(DESC_SELECTORS, prefix="descendant-or-self::"),
+        }
+    return _CASCADES
+
+def _use_lxml():
+    return config.SETTINGS.get("parse_engine", "lxml") == "lxml"
+
+def _card_fields(card, base_url, cs):
+    # (item, matched): matched — какой селектор дал каждое поле (для профилей доменов)
+    item = {"title":"", "price":None, "link":"", "address":"", "description":""}
+    matched = {}
+
+    el, matched["title"] = cs["title"].first_indexed(card)
+    item["title"] = _lxml_extract.text_of(el)
+
+    el, matched["price"] = cs["price"].first_indexed(card)
+    price_text = _lxml_extract.text_of(el)
+    item["price"] = _parse_price(price_text) if price_text else None
+
+    el, matched["link"] = cs["link"].first_indexed(card)
+    href = el.get("href") if el is not None else None
+    if href:
+        item["link"] = href if href.startswith("http") else urljoin(base_url, href)
+    else:
+        matched["link"] = None
+
+    el, matched["address"] = cs["address"].first_indexed(card)
+    item["address"] = _lxml_extract.text_of(el)
+    el, matched["description"] = cs["description"].first_indexed(card)
+    item["description"] = _lxml_extract.text_of(el)
+    return item, matched
+
+def parse_card_lxml(card, base_url):
+    # то же, что parse_card, но card — элемент lxml, а селекторы заранее скомпилированы
+    return _card_fields(card, base_url, _cascades())[0]
+
+def _fetch_detail(link):
+    """Догружает detail page: dict с найденными price/address/description (или None)."""
+    detail_html = _fetch(link)
+    if not detail_html:
+        return None
+    root = _lxml_extract.parse_document(detail_html) if _use_lxml() else None
+    if root is not None:
+        cs = _cascades()
+        details = {}
+        price_el = cs["doc_price"].first(root)
+        if price_el is not None:
+            details["price"] = _parse_price(_lxml_extract.text_of(price_el))
+        addr_el = cs["doc_address"].first(root)
+        if addr_el is not None:
+            details["address"] = _lxml_extract.text_of(addr_el)
+        desc_el = cs["doc_description"].first(root)
+        if desc_el is not None:
+            details["description"] = _lxml_extract.text_of(desc_el)
+        return details
+    dsoup = BeautifulSoup(detail_html, "lxml")
+    details = {}
+    # найти цену на детальной странице
+    price_el = _first_matching(dsoup, PRICE_SELECTORS)
+    if price_el:
+        details["price"] = _parse_price(_safe_text(price_el))
+    # также можно уточнить адрес/description
+    addr_el = _first_matching(dsoup, ADDRESS_SELECTORS)
+    if addr_el:
+        details["address"] = _safe_text(addr_el)
+    desc_el = _first_matching(dsoup, DESC_SELECTORS)
+    if desc_el:
+        details["description"] = _safe_text(desc_el)
+    return details
+
+def _known_links(links):
+    # ссылки, которые уже есть в таблице listings — их detail pages не качаем
+    if not links or not config.SETTINGS.get("enable_db", False):
+        return set()
+    try:
+        from db import existing_links
+        return existing_links(links)
+    except Exception as e:
+        print("[agency_template] known links lookup error:", e)
+        return set()
+
+def enrich_details(items, detail_cache=None):
+    """
+    Detail-enrichment для карточек без цены: собирает их ссылки со всей страницы,
+    убирает дубли и уже известные по БД, качает остальные пулом потоков
+    (темп по хосту держит throttle в _fetch) и вливает результат в карточки.
+    detail_cache (link -> details) переиспользуется между страницами одного прогона.
+    """
+    if detail_cache is None:
+        detail_cache = {}
+    t0 = time.monotonic()
+
+    links = []
+    seen = set()
+    for it in items:
+        link = it["link"]
+        if it["price"] is not None or not link or link in seen:
+            continue
+        # только для абсолютных ссылок
+        parsed = urlparse(link)
+        if parsed.scheme and parsed.netloc:
+            seen.add(link)
+            links.append(link)
+    if not links:
+        return items
+
+    known = _known_links(links)
+    todo = [l for l in links if l not in known and l not in detail_cache]
+    if todo:
+        workers = max(1, min(int(config.SETTINGS.get("detail_workers", DETAIL_WORKERS)), len(todo)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="detail") as ex:
+            for link, details in zip(todo, ex.map(_fetch_detail, todo)):
+                detail_cache[link] = details
+
+    for it in items:
+        details = detail_cache.get(it["link"]) if it["price"] is None else None
+        if details:
+            it.update(details)
+
+    print(
+        f"[agency_template] enrichment: {len(links)} links, {len(known)} known, "
+        f"{len(todo)} fetched in {time.monotonic() - t0:.2f}s"
+    )
+    return items
+
+def _parse_html_cards(html, base_url):
+    """Карточки страницы через BeautifulSoup (исходный путь; эталон для lxml-движка)."""
     soup = BeautifulSoup(html, "lxml")
     items = []
 
@@ -149,58 +349,182 @@ def parse_list_page(html, base_url):
             # если в карточке нет названия и нет ссылки — пропускаем
             if not it["title"] and not it["link"]:
                 continue
-            # если нет цены в карточке, попытка перейти на detail page
-            if it["price"] is None and it["link"]:
-                # только для внутренних/внешних ссылок одного домена (короткий таймаут)
-                parsed = urlparse(it["link"])
-                if parsed.scheme and parsed.netloc:
-                    detail_html = _fetch(it["link"])
-                    if detail_html:
-                        dsoup = BeautifulSoup(detail_html, "lxml")
-                        # найти цену на детальной странице
-                        price_el = _first_matching(dsoup, PRICE_SELECTORS)
-                        if price_el:
-                            it["price"] = _parse_price(_safe_text(price_el))
-                        # также можно уточнить адрес/description
-                        addr_el = _first_matching(dsoup, ADDRESS_SELECTORS)
-                        if addr_el:
-                            it["address"] = _safe_text(addr_el)
-                        desc_el = _first_matching(dsoup, DESC_SELECTORS)
-                        if desc_el:
-                            it["description"] = _safe_text(desc_el)
-                        # небольшая пауза — чтобы не перегружать сайт
-                        time.sleep(0.6)
             items.append(it)
         except Exception as e:
             print("[agency_template] parse_card error:", e)
             continue
     return items
 
-def get_listings(start_url, max_pages=1, delay=1.2, source_name="Agency"):
-    results = []
+def _extract_cards(root, base_url, cs, drop_junk=False):
+    cards, card_sel = cs["card"].all_indexed(root)
+    fallback = not cards and "fallback_card" in cs
+    if fallback:
+        cards, card_sel = cs["fallback_card"].all_indexed(root)
+    stats = _selector_profiles.PageStats(None if fallback else card_sel)
+    items = []
+    for c in cards:
+        try:
+            it, matched = _card_fields(c, base_url, cs)
+            if not it["title"] and not it["link"]:
+                continue
+            stats.add(it, matched)
+            # fallback "a[href]" превращает в «карточку» любую ссылку страницы — такие не пропускаем
+            if drop_junk and fallback and not _selector_profiles.is_valid_item(it):
+                continue
+            items.append(it)
+        except Exception as e:
+            print("[agency_template] parse_card error:", e)
+            continue
+    return items, stats
+
+def _profile_cascades(plan):
+    base = _cascades()
+    cs = {"card": base["card"].reordered([plan["card"]])}
+    for field, order in plan["fields"].items():
+        cs[field] = base[field].reordered(order)
+    return cs
+
+def _profile_plan(base_url):
+    """
+    Что профиль домена предлагает для следующей страницы (picklable — уходит и в parse_pool):
+    победивший селектор карточек, порядок селекторов полей и минимальный выход. None — профиль не готов.
+    """
+    profile = _selector_profiles.store().get(base_url)
+    card_sel = profile.card_selector()
+    if not card_sel:
+        return None
+    fields = {}
+    for field, selectors in (
+        ("title", TITLE_SELECTORS), ("price", PRICE_SELECTORS), ("link", LINK_SELECTORS),
+        ("address", ADDRESS_SELECTORS), ("description", DESC_SELECTORS),
+    ):
+        fields[field] = profile.field_order(field, selectors)
+    return {"card": card_sel, "fields": fields, "min_valid": profile.min_valid()}
+
+def _extract_page(html, base_url, plan=None, use_profile=False):
+    """
+    Разбор страницы lxml-движком без побочных эффектов: (outcome, items, stats) или None.
+    outcome: "plain" — без профилей, "profiled" — профиль сработал,
+    "discovery" — полный перебор, "miss" — профиль не дал выхода, страница разобрана перебором.
+    """
+    root = _lxml_extract.parse_document(html)
+    if root is None:
+        return None
+    if not use_profile:
+        items, stats = _extract_cards(root, base_url, _cascades())
+        return "plain", items, stats
+    outcome = "discovery"
+    if plan:
+        items, stats = _extract_cards(root, base_url, _profile_cascades(plan), drop_junk=True)
+        if stats.valid >= plan["min_valid"]:
+            return "profiled", items, stats
+        # вёрстка могла поменяться — эта страница полным перебором
+        outcome = "miss"
+    items, stats = _extract_cards(root, base_url, _cascades(), drop_junk=True)
+    return outcome, items, stats
+
+def _record_page(base_url, outcome, stats):
+    store = _selector_profiles.store()
+    profile = store.get(base_url)
+    if outcome == "profiled":
+        store.update(profile.record_profiled, stats)
+        return
+    if outcome == "miss":
+        store.update(profile.record_miss)
+    if outcome in ("miss", "discovery"):
+        store.update(profile.record_discovery, stats)
+
+def _parse_lxml_cards(html, base_url, use_profile=False):
+    """
+    Те же карточки, что и _parse_html_cards, но без BeautifulSoup: скомпилированные XPath по дереву lxml.
+    use_profile — сначала селекторы, выученные для домена (parsers._selector_profiles).
+    None — документ не разобрался, нужен путь через soup.
+    """
+    plan = _profile_plan(base_url) if use_profile else None
+    res = _extract_page(html, base_url, plan, use_profile)
+    if res is None:
+        return None
+    outcome, items, stats = res
+    if use_profile:
+        _record_page(base_url, outcome, stats)
+    return items
+
+def parse_list_page(html, base_url, detail_cache=None):
+    items = None
+    if _use_lxml():
+        # CPU-часть (lxml) — в процессах parse_pool, если он включён; иначе здесь же
+        import parse_pool
+        items = parse_pool.parse_cards(html, base_url, _selector_profiles.enabled())
+    if items is None:
+        items = _parse_html_cards(html, base_url)
+
+    # если нет цены в карточке — detail pages всей страницы разом
+    return enrich_details(items, detail_cache)
+
+def _page_url(start_url, page):
+    # пробуем общую пагинацию: ?page=N или ?p=N или /page/N
+    if page <= 1:
+        return start_url
+    if "?" in start_url:
+        # try common query param
+        if "page=" in start_url or "p=" in start_url:
+            return start_url + f"&page={page}"
+        return start_url + f"?page={page}"
+    # naive append - может не работать для некоторых сайтов
+    return start_url.rstrip("/") + f"/?page={page}"
+
+def iter_listings(start_url, max_pages=1, delay=1.2, source_name="Agency", early_stop=EARLY_STOP):
+    """
+    Потоковая версия get_listings: объявления отдаются по мере разбора страниц.
+    Следующая страница качается только когда потребитель забрал предыдущие (backpressure).
+    """
     base_url = start_url
+    # паузы между запросами к хосту (и list, и detail pages) — в _fetch через throttle()
+    configure_host(start_url, delay)
+    # detail pages, уже скачанные на предыдущих страницах этого прогона
+    detail_cache = {}
     for page in range(1, max_pages+1):
-        # пробуем общую пагинацию: ?page=N или ?p=N или /page/N
-        url = start_url
-        if page > 1:
-            if "?" in start_url:
-                # try common query param
-                if "page=" in start_url or "p=" in start_url:
-                    url = start_url + f"&page={page}"
-                else:
-                    url = start_url + f"?page={page}"
-            else:
-                # naive append - может не работать для некоторых сайтов
-                url = start_url.rstrip("/") + f"/?page={page}"
+        url = _page_url(start_url, page)
 
         html = _fetch(url)
         if not html:
             continue
 
-        page_items = parse_list_page(html, base_url)
+        page_items = _parse_cached(url, html, base_url, detail_cache, source_name)
         # attach source name for each
+        for it in page_items:
+            it["source"] = source_name
+        # incremental crawl: на странице нет ничего нового — дальше не листаем
+        if (yield from emit_page(page_items, page, max_pages, source_name, early_stop)):
+            break
+
+def get_listings(start_url, max_pages=1, delay=1.2, source_name="Agency", early_stop=EARLY_STOP):
+    return list(iter_listings(
+        start_url, max_pages=max_pages, delay=delay, source_name=source_name, early_stop=early_stop,
+    ))
+
+async def async_get_listings(fetch, start_url, max_pages=1, delay=1.2, source_name="Agency", early_stop=EARLY_STOP):
+    """
+    Нативная версия для collector.py: fetch — корутина url -> html|None
+    (общий aiohttp-пул; паузы между запросами к хосту — тот же token bucket, что и в _fetch).
+    Разбор страницы (и догрузка detail pages) — в потоке, чтобы не блокировать event loop.
+    """
+    results = []
+    base_url = start_url
+    configure_host(start_url, delay)
+    detail_cache = {}
+    for page in range(1, max_pages+1):
+        url = _page_url(start_url, page)
+
+        html = await fetch(url)
+        if not html:
+            continue
+
+        page_items = await asyncio.to_thread(_parse_cached, url, html, base_url, detail_cache, source_name)
         for it in page_items:
             it["source"] = source_name
         results.extend(page_items)
-        time.sleep(delay)
+        if early_stop and page < max_pages and page_is_known([it["link"] for it in page_items]):
+            print(f"[{source_name}] page {page}: all links already known, stop paging")
+            break
     return results
@@ -1,16 +1,20 @@
 # parsers/fotocasa.py
 # Парсер для Fotocasa — пытается читать JSON-LD, иначе парсит HTML-карточки.
-# Зависит от: parsers._common.create_session, parsers._common.safe_get, parsers._common.polite_sleep
+# Зависит от: parsers._common.get_session, parsers._common.safe_get, parsers._common.configure_host,
+# parsers._jsonld (JSON-LD из сырых байт без BeautifulSoup)
 
 from bs4 import BeautifulSoup
-import json
 import re
 from urllib.parse import urljoin
 
-from parsers._common import create_session, safe_get, polite_sleep
+from parsers import _fingerprint, _jsonld
+from parsers._common import get_session, safe_get, configure_host, emit_page, with_query
 
 DEFAULT_URL = "https://www.fotocasa.es/en/buy/homes/santa-cruz-de-tenerife-province/all-zones/l"
 SOURCE_DOMAIN = "https://www.fotocasa.es"
+# порядок выдачи («сначала новые») не подтверждён — ранняя остановка пагинации
+# (incremental crawl) выключена: известная страница не значит, что дальше нет новых
+EARLY_STOP = False
 
 PRICE_CLEAN_RE = re.compile(r"[^\d]")
 
@@ -43,78 +47,24 @@ def _abs_link(href):
     # Относительный путь — делаем абсолютным для fotocasa
     return urljoin(SOURCE_DOMAIN, href)
 
-def _try_parse_json_ld(soup):
-    out = []
-    scripts = soup.select("script[type='application/ld+json']")
-    if not scripts:
-        return out
-    for tag in scripts:
-        text = (tag.string or "").strip()
-        if not text:
-            continue
-        try:
-            data = json.loads(text)
-        except Exception:
-            # иногда в теге несколько JSON объектов или мусор — попробуем аккуратно
-            try:
-                # попытка выделить JSON внутри
-                start = text.find("{")
-                end = text.rfind("}") + 1
-                data = json.loads(text[start:end])
-            except Exception:
-                continue
-        # standard JSON-LD may be dict or list
-        items = []
-        if isinstance(data, dict):
-            # возможно @graph или itemListElement
-            if "@graph" in data and isinstance(data["@graph"], list):
-                items = data["@graph"]
-            elif "itemListElement" in data and isinstance(data["itemListElement"], list):
-                # itemListElement may be list of {"item": {...}} or direct
-                items = []
-                for el in data["itemListElement"]:
-                    if isinstance(el, dict):
-                        if "item" in el and isinstance(el["item"], dict):
-                            items.append(el["item"])
-                        else:
-                            items.append(el)
-            else:
-                items = [data]
-        elif isinstance(data, list):
-            items = data
-        # normalize some item shapes (Offer, Residence, Product, ListItem)
-        for el in items:
-            if not isinstance(el, dict):
-                continue
-            title = el.get("name") or el.get("headline") or ""
-            link = el.get("url") or el.get("@id") or ""
-            price = ""
-            # price may be inside offers
-            offers = el.get("offers") or el.get("priceSpecification") or {}
-            if isinstance(offers, dict):
-                price = offers.get("price") or offers.get("priceCurrency") or ""
-            elif isinstance(offers, str):
-                price = offers
-            # if el describes an ItemList, it may contain itemListElement as nested items
-            out.append({
-                "title": title,
-                "address": el.get("address", "") if isinstance(el.get("address", ""), str) else "",
-                "price": price,
-                "link": link,
-            })
-    return out
+def _try_parse_json_ld(raw, encoding=None):
+    # JSON-LD из сырых байт ответа (parsers._jsonld) — без построения soup
+    return _jsonld.listing_items(raw, encoding)
 
-def _parse_html_cards(soup):
-    out = []
+def _select_cards(soup):
     # Попробуем несколько вероятных селекторов карточек
     card_selectors = [
         ".re-Card", ".re-card", ".fc-Card", ".listing-item", ".offer-item", "article", ".Card"
     ]
-    cards = []
     for sel in card_selectors:
         cards = soup.select(sel)
         if cards:
-            break
+            return cards
+    return []
+
+def _parse_html_cards(soup):
+    out = []
+    cards = _select_cards(soup)
     # fallback: выбирать элементы с ссылками и ценой
     if not cards:
         cards = soup.select("a")
@@ -170,38 +120,61 @@ def _parse_html_cards(soup):
             continue
     return out
 
-def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Fotocasa"):
+def iter_listings(start_url=None, max_pages=1, delay=1.5, source_name="Fotocasa"):
     """
-    Возвращает список dict:
-    {"title":..., "address":..., "price": <raw string>, "price_eur": <int or None>, "link":..., "source": source_name}
+    Объявления по мере разбора страниц (те же dict, что и у get_listings), без дублей по link+title.
     """
-    session = create_session()
-    out = []
+    # de-duplicate by link+title simple key
+    seen = set()
+
+    def emit(items):
+        for it in items:
+            key = (it.get("link",""), (it.get("title") or "")[:120])
+            if key in seen:
+                continue
+            seen.add(key)
+            yield it
+
     if not start_url:
         start_url = DEFAULT_URL
+    session = get_session(start_url)
+    # паузы между запросами к хосту — в safe_get (token bucket на хост)
+    configure_host(start_url, delay)
 
     for p in range(1, max_pages + 1):
-        if p == 1:
-            url = start_url
-        else:
+        url = start_url
+        if p > 1:
             # Fotocasa pagination: часто uses ?page=N or /pagina-N — this works as a common fallback
-            if "?" in start_url:
-                url = f"{start_url}&page={p}"
-            else:
-                url = f"{start_url}?page={p}"
+            url = with_query(url, f"page={p}")
 
         resp = safe_get(session, url)
         if resp is None or getattr(resp, "status_code", None) != 200:
             print(f"[{source_name}] fetch error for {url}")
-            polite_sleep(delay, delay + 0.5)
             continue
 
         text = resp.text or ""
-        soup = BeautifulSoup(text, "lxml")
 
-        # 1) Попытка JSON-LD
-        json_items = _try_parse_json_ld(soup)
-        if json_items:
+        # 0) страница не изменилась (304 / тот же текст) — объявления прошлого разбора
+        cached = _fingerprint.cached_items(url, text, source_name)
+        if cached is not None:
+            print(f"[{source_name}] page {p} not modified, reused {len(cached)} items")
+            if (yield from emit_page(emit(cached), p, max_pages, source_name, EARLY_STOP)):
+                break
+            continue
+
+        page_out = []
+
+        # 1) Попытка JSON-LD — прямо по байтам ответа, soup строится только для HTML-разбора
+        #    (или чтобы сверить короткий JSON-LD с числом карточек)
+        json_items = _try_parse_json_ld(resp.content, resp.encoding)
+        soup = None
+
+        def count_cards():
+            nonlocal soup
+            soup = BeautifulSoup(text, "lxml")
+            return len(_select_cards(soup))
+
+        if _jsonld.covers_cards(json_items, count_cards):
             for it in json_items:
                 title = it.get("title") or it.get("name") or ""
                 link = it.get("link") or ""
@@ -209,7 +182,7 @@ def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Fotocasa")
                 # make link absolute
                 link = _abs_link(link)
                 price_eur = _clean_price_to_int(price_raw)
-                out.append({
+                page_out.append({
                     "title": title,
                     "address": it.get("address", "") or "",
                     "price": price_raw,
@@ -220,7 +193,9 @@ def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Fotocasa")
             print(f"[{source_name}] parsed {len(json_items)} items from JSON-LD (page {p})")
         else:
             # 2) HTML parsing
-            html_items = _parse_html_cards(soup)
+            if json_items:
+                print(f"[{source_name}] JSON-LD has only {len(json_items)} items, parsing HTML (page {p})")
+            html_items = _parse_html_cards(soup if soup is not None else BeautifulSoup(text, "lxml"))
             # Normalize and make links absolute
             for it in html_items:
                 title = it.get("title","")
@@ -228,7 +203,7 @@ def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Fotocasa")
                 price_raw = it.get("price","")
                 link = _abs_link(it.get("link",""))
                 price_eur = _clean_price_to_int(price_raw)
-                out.append({
+                page_out.append({
                     "title": title,
                     "address": address,
                     "price": price_raw,
@@ -238,16 +213,15 @@ def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Fotocasa")
                 })
             print(f"[{source_name}] parsed {len(html_items)} items from HTML (page {p})")
 
-        polite_sleep(delay, delay + 0.5)
+        _fingerprint.put_items(url, text, page_out)
+        # incremental crawl: на странице нет ничего нового — дальше не листаем
+        if (yield from emit_page(emit(page_out), p, max_pages, source_name, EARLY_STOP)):
+            break
 
-    # de-duplicate by link+title simple key
-    seen = set()
-    deduped = []
-    for it in out:
-        key = (it.get("link",""), (it.get("title") or "")[:120])
-        if key in seen:
-            continue
-        seen.add(key)
-        deduped.append(it)
 
-    return deduped
+def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Fotocasa"):
+    """
+    Возвращает список dict:
+    {"title":..., "address":..., "price": <raw string>, "price_eur": <int or None>, "link":..., "source": source_name}
+    """
+    return list(iter_listings(start_url, max_pages=max_pages, delay=delay, source_name=source_name))
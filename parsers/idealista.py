@@ -1,21 +1,27 @@
 # parsers/idealista.py (diagnostic)
 from bs4 import BeautifulSoup
-from parsers._common import create_session, safe_get, polite_sleep
+from urllib.parse import urljoin
+from parsers import _fingerprint, _jsonld
+from parsers._common import get_session, safe_get, configure_host, emit_page, with_query
 
 DEFAULT_URL = "https://www.idealista.com/en/venta-viviendas/tenerife/"
+# сортировка «сначала новые» — нужна для incremental crawl (ранняя остановка пагинации)
+NEWEST_FIRST = "ordenado-por=fecha"
+EARLY_STOP = True
 
-def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Idealista"):
-    session = create_session()
-    out = []
+def iter_listings(start_url=None, max_pages=1, delay=1.5, source_name="Idealista"):
+    # объявления отдаются по мере разбора страниц (см. collector.iter_source)
     if not start_url:
         start_url = DEFAULT_URL
+    session = get_session(start_url)
+    # паузы между запросами к хосту — в safe_get (token bucket на хост)
+    configure_host(start_url, delay)
 
     for p in range(1, max_pages+1):
-        url = start_url if p == 1 else f"{start_url}?ordenado-por=fecha&page={p}"
+        url = with_query(start_url, NEWEST_FIRST) if p == 1 else with_query(start_url, f"{NEWEST_FIRST}&page={p}")
         resp = safe_get(session, url)
         if resp is None:
             print(f"[{source_name}] fetch returned None for {url}")
-            polite_sleep(delay, delay + 0.5)
             continue
 
         status = getattr(resp, "status_code", None)
@@ -33,11 +39,42 @@ def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Idealista"
 
         if status != 200:
             print(f"[{source_name}] fetch error for {url}")
-            polite_sleep(delay, delay + 0.5)
             continue
 
-        soup = BeautifulSoup(resp.text, "lxml")
-        cards = soup.select(".item, .ad, .offer-item, article")
+        # страница не изменилась (304 / тот же отпечаток) — объявления прошлого разбора
+        cached = _fingerprint.cached_items(url, resp.text, source_name)
+        if cached is not None:
+            print(f"[{source_name}] page {p} not modified, reused {len(cached)} items")
+            if (yield from emit_page(cached, p, max_pages, source_name, EARLY_STOP)):
+                break
+            continue
+
+        page_out = []
+        # структурированные данные (schema.org JSON-LD) — без построения soup,
+        # если их не заметно меньше карточек (иначе разбирается HTML)
+        json_items = _jsonld.listing_items(resp.content, resp.encoding)
+        cards = None
+
+        def count_cards():
+            nonlocal cards
+            cards = BeautifulSoup(resp.text, "lxml").select(".item, .ad, .offer-item, article")
+            return len(cards)
+
+        if _jsonld.covers_cards(json_items, count_cards):
+            for it in json_items[:50]:
+                it["link"] = urljoin(url, it["link"]) if it["link"] else ""
+                it["source"] = source_name
+                page_out.append(it)
+            print(f"[{source_name}] parsed {len(page_out)} items from JSON-LD (page {p})")
+            _fingerprint.put_items(url, resp.text, page_out)
+            if (yield from emit_page(page_out, p, max_pages, source_name, EARLY_STOP)):
+                break
+            continue
+
+        if cards is None:
+            count_cards()
+        elif json_items:
+            print(f"[{source_name}] JSON-LD has only {len(json_items)} items for {len(cards)} cards, parsing HTML (page {p})")
         if not cards:
             print(f"[{source_name}] no cards found (maybe JS or selectors changed)")
         for c in cards[:50]:
@@ -47,6 +84,12 @@ def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Idealista"
             price = price_el.get_text(strip=True) if price_el else ""
             link_el = c.select_one("a[itemprop='url'], a")
             link = link_el["href"] if link_el and link_el.has_attr("href") else ""
-            out.append({"title": title, "address": "", "price": price, "link": link, "source": source_name})
-        polite_sleep(delay, delay + 0.5)
-    return out
+            page_out.append({"title": title, "address": "", "price": price, "link": link, "source": source_name})
+        _fingerprint.put_items(url, resp.text, page_out)
+        # incremental crawl: на странице нет ничего нового — дальше не листаем
+        if (yield from emit_page(page_out, p, max_pages, source_name, EARLY_STOP)):
+            break
+
+
+def get_listings(start_url=None, max_pages=1, delay=1.5, source_name="Idealista"):
+    return list(iter_listings(start_url, max_pages=max_pages, delay=delay, source_name=source_name))
@@ -0,0 +1,163 @@
+# parsers/registry.py
+# Реестр парсеров: модули parsers/* находятся один раз, сигнатуры get_listings проверяются
+# без импорта (по исходнику, ast), сам модуль импортируется лениво — при первом опросе источника.
+# Результат загрузки (модуль или ошибка) кэшируется: битый источник из config.SOURCES
+# не переимпортируется и не засоряет лог каждый цикл, а о проблеме сообщается один раз при старте.
+
+import ast
+import importlib
+import inspect
+import os
+import pkgutil
+import threading
+
+import parsers
+
+# как collector вызывает парсеры
+_SYNC_CALL = (("https://example.test/",), {"max_pages": 1, "delay": 1.0, "source_name": "x"})
+_ASYNC_CALL = ((None, "https://example.test/"), {"max_pages": 1, "delay": 1.0, "source_name": "x"})
+
+_lock = threading.Lock()
+_modules = None     # module_path -> путь к файлу
+_loaded = {}        # module_path -> модуль | None (ошибка уже напечатана)
+_errors = {}        # module_path -> текст ошибки
+
+
+def discover():
+    """module_path -> файл для всех публичных модулей пакета parsers (без импорта)."""
+    global _modules
+    with _lock:
+        if _modules is None:
+            found = {}
+            for info in pkgutil.iter_modules(parsers.__path__):
+                if info.name.startswith("_") or info.ispkg or info.name == "registry":
+                    continue
+                found[f"parsers.{info.name}"] = os.path.join(info.module_finder.path, info.name + ".py")
+            _modules = found
+        return _modules
+
+
+def _params_ok(args, call):
+    """Подходят ли параметры функции (ast.arguments) под вызов collector'а."""
+    positional = [a.arg for a in args.posonlyargs + args.args]
+    n_pos = len(call[0])
+    if len(positional) < n_pos and args.vararg is None:
+        return False
+    kw_allowed = set(positional[n_pos:]) | {a.arg for a in args.kwonlyargs}
+    for kw in call[1]:
+        if kw not in kw_allowed and args.kwarg is None:
+            return False
+    # обязательные kw-only без значения по умолчанию вызов не передаёт
+    for a, default in zip(args.kwonlyargs, args.kw_defaults):
+        if default is None and a.arg not in call[1]:
+            return False
+    return True
+
+
+def check_source(module_path):
+    """
+    Статическая проверка модуля парсера без импорта: None — всё в порядке, иначе текст проблемы.
+    Реэкспорт (from .x import get_listings) принимается — его сигнатура проверится при загрузке.
+    """
+    path = discover().get(module_path)
+    if path is None:
+        return "module not found in parsers/"
+    try:
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=path)
+    except Exception as e:
+        return f"cannot read module: {e}"
+    funcs = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            funcs[node.name] = node
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                funcs[alias.asname or alias.name] = None
+    if not {"get_listings", "iter_listings", "async_get_listings"} & set(funcs):
+        return "no get_listings()"
+    node = funcs.get("get_listings")
+    if node is not None and not _params_ok(node.args, _SYNC_CALL):
+        return "get_listings() signature does not accept (start_url, max_pages=, delay=, source_name=)"
+    node = funcs.get("iter_listings")
+    if node is not None and not _params_ok(node.args, _SYNC_CALL):
+        return "iter_listings() signature does not accept (start_url, max_pages=, delay=, source_name=)"
+    node = funcs.get("async_get_listings")
+    if node is not None and not _params_ok(node.args, _ASYNC_CALL):
+        return "async_get_listings() signature does not accept (fetch, start_url, max_pages=, delay=, source_name=)"
+    return None
+
+
+def _check_loaded(mod):
+    for name, call in (("get_listings", _SYNC_CALL), ("iter_listings", _SYNC_CALL), ("async_get_listings", _ASYNC_CALL)):
+        fn = getattr(mod, name, None)
+        if fn is None:
+            continue
+        if not callable(fn):
+            return f"{name} is not callable"
+        try:
+            inspect.signature(fn).bind(*call[0], **call[1])
+        except TypeError as e:
+            return f"{name}() signature mismatch: {e}"
+        except ValueError:
+            pass  # сигнатуру не получить (C-функция и т.п.) — доверяем
+    if not any(hasattr(mod, n) for n in ("get_listings", "iter_listings", "async_get_listings")):
+        return "no get_listings()"
+    return None
+
+
+def load(module_path, friendly_name):
+    """Модуль парсера (импорт один раз) или None; причина отказа печатается только первый раз."""
+    with _lock:
+        if module_path in _loaded:
+            return _loaded[module_path]
+    error = check_source(module_path) if module_path.startswith("parsers.") else None
+    mod = None
+    if error is None:
+        try:
+            mod = importlib.import_module(module_path)
+            error = _check_loaded(mod)
+        except Exception as e:
+            error = f"import error: {e}"
+        if error is not None:
+            mod = None
+    if error is not None:
+        print(f"[{friendly_name}] parser disabled: {module_path}: {error}")
+    with _lock:
+        _loaded[module_path] = mod
+        if error is not None:
+            _errors[module_path] = error
+    return mod
+
+
+def validate_sources(sources):
+    """
+    Проверка config.SOURCES при старте (без импорта модулей): печатает отчёт,
+    возвращает список (friendly_name, module_path, ошибка).
+    """
+    problems = []
+    seen = set()
+    for src in sources:
+        try:
+            module_path, start_url, friendly_name = src
+        except (TypeError, ValueError):
+            problems.append((str(src), "", "source must be (module_path, start_url, friendly_name)"))
+            continue
+        if friendly_name in seen:
+            problems.append((friendly_name, module_path, "duplicate friendly name"))
+        seen.add(friendly_name)
+        error = check_source(module_path) if module_path.startswith("parsers.") else None
+        if error is not None:
+            problems.append((friendly_name, module_path, error))
+            with _lock:
+                _loaded[module_path] = None
+                _errors[module_path] = error
+    for name, module_path, error in problems:
+        print(f"[registry] misconfigured source {name!r} ({module_path}): {error}")
+    print(f"[registry] {len(sources) - len(problems)}/{len(sources)} sources OK, {len(discover())} parser modules available")
+    return problems
+
+
+def errors():
+    with _lock:
+        return dict(_errors)
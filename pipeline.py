@@ -0,0 +1,177 @@
+# pipeline.py
+# Потоковый конвейер сбора: fetch+parse -> classify -> dedupe (БД) -> notify.
+# Вместо «собрать все источники в один список, потом фильтровать, потом в БД, потом в Telegram»:
+# - источники отдают объявления по мере разбора страниц (iter_listings, см. collector.iter_source;
+#   старые парсеры с одним get_listings — одной пачкой через тот же адаптер)
+# - стадии — отдельные потоки, связанные очередями ограниченного размера (backpressure):
+#   если классификация/БД/Telegram не успевают, парсер блокируется на put() и не качает
+#   следующую страницу, пока очередь не разгрузится
+# - классификация берёт всё, что уже накопилось в очереди (до stream_batch_size), не дожидаясь полной пачки:
+#   первое объявление уходит в Telegram, пока остальные страницы ещё качаются
+# Circuit breaker, лимиты хостов и кэши — те же, что у collector.collect_sources.
+
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import collector
+
+_DONE = object()
+
+
+class BoundedStage:
+    """Очередь перед стадией + счётчики (сколько прошло, максимальная глубина)."""
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.q = queue.Queue(maxsize=max(1, maxsize))
+        self.items = 0
+        self.max_depth = 0
+        self.blocked = 0.0     # сколько секунд производители ждали на put()
+
+    def put(self, obj, count=1):
+        t0 = time.monotonic()
+        self.q.put(obj)
+        self.blocked += time.monotonic() - t0
+        if obj is not _DONE:
+            self.items += count
+        depth = self.q.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def get(self):
+        return self.q.get()
+
+
+def _drain(stage, first, limit):
+    """first + всё, что уже лежит в очереди (не больше limit); второе значение — встретился ли _DONE."""
+    batch = [first]
+    while len(batch) < limit:
+        try:
+            obj = stage.q.get_nowait()
+        except queue.Empty:
+            break
+        if obj is _DONE:
+            return batch, True
+        batch.append(obj)
+    return batch, False
+
+
+def run(sources, max_pages, delay, classify, dedupe, notify):
+    """
+    classify(items) -> candidates
+    dedupe(candidates, items) -> new_items   (сохранение в БД, mark_seen)
+    notify(new_items)
+    Возвращает сводку: items / candidates / new / per_source / first_notify_s.
+    """
+    s = config.SETTINGS
+    qsize = int(s.get("stream_queue_size", 200))
+    batch_size = int(s.get("stream_batch_size", 50))
+    workers = max(1, int(s.get("stream_source_workers", 4)))
+
+    parsed = BoundedStage("parsed", qsize)
+    classified = BoundedStage("classified", max(1, qsize // batch_size))
+    fresh = BoundedStage("new", max(1, qsize // batch_size))
+    summary = {"items": 0, "candidates": 0, "new": 0, "per_source": {}, "first_notify_s": None}
+    t0 = time.monotonic()
+
+    def produce(source, pages):
+        module_path, start_url, friendly_name = source
+        mod = collector.load_parser(module_path, friendly_name)
+        if mod is None:
+            collector.record_health(friendly_name, "parser not loadable")
+            return
+        count, error = 0, None
+        mark = collector.fetch_mark(start_url)
+        try:
+            src_delay = collector.source_delay(friendly_name, delay)
+            for it in collector.iter_source(mod, start_url, pages, src_delay, friendly_name):
+                parsed.put(it)
+                count += 1
+        except Exception as e:
+            error = f"runtime error: {e}"
+            print(f"[{friendly_name}] runtime error: {e}")
+            print(traceback.format_exc())
+        summary["per_source"][friendly_name] = count
+        print(f"[{friendly_name}] streamed {count} items")
+        collector.record_health(friendly_name, error, mark)
+
+    def classify_stage():
+        done = False
+        while not done:
+            first = parsed.get()
+            if first is _DONE:
+                break
+            batch, done = _drain(parsed, first, batch_size)
+            try:
+                candidates = classify(batch)
+            except Exception as e:
+                print("[pipeline] classify error:", e)
+                print(traceback.format_exc())
+                candidates = []
+            classified.put((candidates, batch), len(batch))
+        classified.put(_DONE)
+
+    def dedupe_stage():
+        while True:
+            obj = classified.get()
+            if obj is _DONE:
+                break
+            candidates, batch = obj
+            summary["candidates"] += len(candidates)
+            try:
+                new_items = dedupe(candidates, batch)
+            except Exception as e:
+                print("[pipeline] dedupe error:", e)
+                print(traceback.format_exc())
+                new_items = []
+            if new_items:
+                fresh.put(new_items, len(new_items))
+        fresh.put(_DONE)
+
+    def notify_stage():
+        while True:
+            obj = fresh.get()
+            if obj is _DONE:
+                break
+            summary["new"] += len(obj)
+            if summary["first_notify_s"] is None:
+                summary["first_notify_s"] = time.monotonic() - t0
+            try:
+                notify(obj)
+            except Exception as e:
+                print("[pipeline] notify error:", e)
+                print(traceback.format_exc())
+
+    stages = [
+        threading.Thread(target=fn, daemon=True, name=f"pipeline-{fn.__name__}")
+        for fn in (classify_stage, dedupe_stage, notify_stage)
+    ]
+    for t in stages:
+        t.start()
+    try:
+        admitted = collector.admit(sources, max_pages)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="source") as ex:
+            for f in [ex.submit(produce, src, pages) for src, pages in admitted]:
+                f.result()
+    finally:
+        parsed.put(_DONE)
+        for t in stages:
+            t.join()
+
+    summary["items"] = parsed.items
+    wall = time.monotonic() - t0
+    first = summary["first_notify_s"]
+    print(
+        f"[pipeline] {len(sources)} sources in {wall:.1f}s: {summary['items']} items, "
+        f"{summary['candidates']} candidates, {summary['new']} new"
+        + (f", first notification after {first:.1f}s" if first is not None else "")
+    )
+    for st in (parsed, classified, fresh):
+        print(f"[pipeline] queue {st.name}: {st.items} items, max depth {st.max_depth}/{st.q.maxsize}, "
+              f"producers blocked {st.blocked:.1f}s")
+    collector.log_cycle_stats()
+    return summary
@@ -0,0 +1,198 @@
+# scheduler.py
+# Адаптивный планировщик опроса источников вместо одного общего цикла раз в collect_interval_seconds.
+# - каждый источник — независимая задача со своим временем следующего опроса
+# - интервал подстраивается под наблюдаемый темп новых объявлений (EWMA, новых в секунду):
+#   целимся примерно в TARGET_NEW_PER_POLL новых объявлений за опрос
+# - нет новых — интервал плавно растёт; ошибки — экспоненциальный backoff;
+#   пропуск (источник не опрашивался, circuit open) интервал не меняет
+# - всё в пределах [poll_min_seconds, poll_max_seconds]; состояние переживает рестарт (JSON)
+
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+STATE_PATH = os.getenv("SCHEDULER_STATE_PATH", "scheduler_state.json")
+
+TARGET_NEW_PER_POLL = 1.0   # сколько новых объявлений в среднем хотим видеть за один опрос
+RATE_ALPHA = 0.3            # вес последнего наблюдения в EWMA
+IDLE_GROWTH = 1.5           # рост интервала, если новых объявлений не видно
+MAX_TICK = 30.0             # как часто планировщик просыпается проверить очередь (сек)
+
+# исход опроса, который возвращает run_source
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class SourceState:
+    def __init__(self, name, interval):
+        self.name = name
+        self.interval = float(interval)
+        self.next_at = 0.0          # time.time(), когда опрашивать; 0 — сразу
+        self.last_run = 0.0
+        self.new_rate = 0.0         # EWMA новых объявлений в секунду
+        self.fail_rate = 0.0        # EWMA доли неудачных опросов
+        self.failures = 0           # неудач подряд
+        self.runs = 0
+        self.new_total = 0
+        self.running = False
+
+    def to_dict(self):
+        return {
+            "interval": self.interval,
+            "next_at": self.next_at,
+            "last_run": self.last_run,
+            "new_rate": self.new_rate,
+            "fail_rate": self.fail_rate,
+            "failures": self.failures,
+            "runs": self.runs,
+            "new_total": self.new_total,
+        }
+
+    def load(self, d):
+        for k in ("interval", "next_at", "last_run", "new_rate", "fail_rate"):
+            if k in d:
+                setattr(self, k, float(d[k]))
+        for k in ("failures", "runs", "new_total"):
+            if k in d:
+                setattr(self, k, int(d[k]))
+
+
+class AdaptiveScheduler:
+    """
+    run_source(source) -> (new_count, status) — опрос одного источника из config.SOURCES
+    (кортеж module_path, start_url, friendly_name); status — OK / FAILED / SKIPPED.
+    """
+
+    def __init__(self, sources, run_source):
+        s = config.SETTINGS
+        self.min_interval = float(s.get("poll_min_seconds", 300))
+        self.max_interval = float(s.get("poll_max_seconds", 6 * 3600))
+        initial = float(s.get("collect_interval_seconds", 3600))
+        self.sources = list(sources)
+        self.run_source = run_source
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, int(s.get("scheduler_workers", 4))), thread_name_prefix="poll"
+        )
+        self.states = {}
+        for _module_path, _url, name in self.sources:
+            self.states[name] = SourceState(name, self._clamp(initial))
+        self._load()
+
+    def _clamp(self, interval):
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    # --- persistence ---
+    def _load(self):
+        try:
+            with open(STATE_PATH, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print("[scheduler] state load error:", e)
+            return
+        for name, d in (data or {}).items():
+            st = self.states.get(name)
+            if st is not None:
+                st.load(d)
+                st.interval = self._clamp(st.interval)
+
+    def _save(self):
+        with self.lock:
+            data = {name: st.to_dict() for name, st in self.states.items()}
+        try:
+            tmp = STATE_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, STATE_PATH)
+        except Exception as e:
+            print("[scheduler] state save error:", e)
+
+    # --- adaptation ---
+    def _update(self, st, new_count, status, started):
+        now = time.time()
+        with self.lock:
+            if status == SKIPPED:
+                # источник не опрашивался — ни темп, ни доля ошибок не меняются
+                st.next_at = now + st.interval
+                st.running = False
+                print(f"[scheduler] {st.name}: skipped, next in {st.interval / 60:.0f} min")
+                return
+            ok = status == OK
+            elapsed = started - st.last_run if st.last_run else st.interval
+            elapsed = max(1.0, elapsed)
+            st.runs += 1
+            st.last_run = started
+            st.fail_rate = RATE_ALPHA * (0.0 if ok else 1.0) + (1 - RATE_ALPHA) * st.fail_rate
+            if ok:
+                st.failures = 0
+                st.new_total += new_count
+                st.new_rate = RATE_ALPHA * (new_count / elapsed) + (1 - RATE_ALPHA) * st.new_rate
+                if new_count > 0 and st.new_rate > 0:
+                    interval = TARGET_NEW_PER_POLL / st.new_rate
+                else:
+                    interval = st.interval * IDLE_GROWTH
+            else:
+                # блокировка/ошибка — не долбим хост, удваиваем интервал
+                st.failures += 1
+                interval = st.interval * 2
+            st.interval = self._clamp(interval)
+            st.next_at = now + st.interval
+            st.running = False
+            print(
+                f"[scheduler] {st.name}: new={new_count} ok={ok} "
+                f"rate={st.new_rate * 3600:.2f}/h fail={st.fail_rate:.2f} next in {st.interval / 60:.0f} min"
+            )
+
+    def _run(self, source):
+        st = self.states[source[2]]
+        started = time.time()
+        try:
+            new_count, status = self.run_source(source)
+        except Exception as e:
+            print(f"[scheduler] {st.name} job error:", e)
+            print(traceback.format_exc())
+            new_count, status = 0, FAILED
+        self._update(st, int(new_count or 0), status, started)
+        self._save()
+        self.wakeup.set()
+
+    # --- loop ---
+    def _loop(self):
+        while True:
+            now = time.time()
+            due = []
+            with self.lock:
+                for src in self.sources:
+                    st = self.states[src[2]]
+                    if not st.running and st.next_at <= now:
+                        st.running = True
+                        due.append(src)
+                pending = [self.states[s[2]].next_at for s in self.sources if not self.states[s[2]].running]
+            for src in due:
+                self.executor.submit(self._run, src)
+            sleep_for = min(pending) - time.time() if pending else MAX_TICK
+            self.wakeup.wait(max(1.0, min(MAX_TICK, sleep_for)))
+            self.wakeup.clear()
+
+    def start(self, initial_delay=5):
+        def _job():
+            time.sleep(initial_delay)
+            self._loop()
+
+        t = threading.Thread(target=_job, daemon=True, name="scheduler")
+        t.start()
+        return t
+
+    def status(self):
+        """Снимок состояния по источникам (для мониторинга / логов)."""
+        with self.lock:
+            return {name: dict(st.to_dict(), running=st.running) for name, st in self.states.items()}
@@ -1,17 +1,39 @@
-# show_debug.py — печатает debug_all_items.csv (первые N строк)
-import csv, os, sys
+# show_debug.py — печатает трассировку решений фильтра (decision_trace.py, первые N строк)
+# python show_debug.py [N] [reason] — например: python show_debug.py 100 "not south"
+# Нет трассировки — старый debug_all_items.csv.
+import csv, gzip, os, sys
 
-path = os.path.join("outputs", "debug_all_items.csv")
-if not os.path.exists(path):
-    print("Debug CSV not found at", path)
+from decision_trace import TRACE_PATH
+
+limit = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+only = sys.argv[2] if len(sys.argv) > 2 else None
+
+base = TRACE_PATH[:-3] if TRACE_PATH.endswith(".gz") else TRACE_PATH
+legacy = os.path.join("outputs", "debug_all_items.csv")
+if os.path.exists(TRACE_PATH):
+    path, opener = TRACE_PATH, gzip.open
+elif os.path.exists(f"{base}.1.gz"):
+    path, opener = f"{base}.1.gz", gzip.open
+elif os.path.exists(legacy):
+    path, opener = legacy, open
+else:
+    print("Decision trace not found at", TRACE_PATH, "(enable SETTINGS['decision_trace'])")
     sys.exit(1)
 
-with open(path, newline="", encoding="utf-8") as f:
+print("Reading", path)
+with opener(path, "rt", newline="", encoding="utf-8") as f:
     rdr = csv.DictReader(f)
-    for i, row in enumerate(rdr):
-        if i >= 50:
+    i = 0
+    for row in rdr:
+        if row.get("ts") == "ts":
+            continue  # заголовок следующего gzip member
+        if only and row.get("decision") != only:
+            continue
+        if i >= limit:
             break
-        print(f"ROW {i}: source={row.get('source')}, title={row.get('title')[:80]!r}")
-        print(f"      addr={row.get('address')[:80]!r}, price_raw={row.get('price_raw')!r}, price_norm={row.get('price_norm')!r}")
-        print(f"      detected_type={row.get('detected_type')!r}, is_south={row.get('is_south')!r}, explain={row.get('explain')!r}")
+        print(f"ROW {i}: source={row.get('source')}, title={(row.get('title') or '')[:80]!r}")
+        print(f"      addr={(row.get('address') or '')[:80]!r}, price_raw={row.get('price_raw')!r}, price_norm={row.get('price_norm')!r}")
+        print(f"      detected_type={row.get('detected_type')!r}, type_match={row.get('type_match')!r}, is_south={row.get('is_south')!r}")
+        print(f"      explain={row.get('explain')!r}, decision={row.get('decision')!r}")
         print("-" * 80)
+        i += 1
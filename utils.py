@@ -10,6 +10,18 @@ from datetime import datetime
 from difflib import SequenceMatcher
 
 import config
+import gazetteer
+
+# numpy нужен только для classify_batch; без него вызывающий код фильтрует по одному объявлению
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:  # pragma: no cover
+    np = None
+    NUMPY_AVAILABLE = False
+
+from keyword_matcher import KeywordMatcher, similar_at_least
+from listing import Listing
 from user_limits import user_price_limits
 
 # Пороговые значения для нечёткого соответствия
@@ -51,6 +63,64 @@ def contains_any(text, keywords):
     return False
 
 
+# Ключевые слова из config, скомпилированные один раз в KeywordMatcher (keyword_matcher.py).
+# Пересобираются, если в config подменили списки или поменялся их размер; reload_keywords() — вручную.
+_KW_TABLES = None
+_KW_TABLES_KEY = None
+
+
+def _keywords_signature():
+    # сами объекты из config (не `or []`: новый пустой список на каждый вызов менял бы подпись)
+    tk = config.TYPE_KEYWORDS
+    sk = getattr(config, "SOUTH_KEYWORDS", None)
+    bl = getattr(config, "SOUTH_BLACKLIST", None)
+    return (id(tk), tuple(len(v) for v in tk.values()), id(sk), len(sk or ()), id(bl), len(bl or ()),
+            TOKEN_FUZZY_THRESHOLD)
+
+
+def keyword_tables():
+    global _KW_TABLES, _KW_TABLES_KEY
+    key = _keywords_signature()
+    if _KW_TABLES is None or _KW_TABLES_KEY != key:
+        _KW_TABLES = KeywordMatcher(
+            config.TYPE_KEYWORDS,
+            getattr(config, "SOUTH_KEYWORDS", []) or [],
+            getattr(config, "SOUTH_BLACKLIST", []) or [],
+            text_norm,
+            _tokens,
+            TOKEN_FUZZY_THRESHOLD,
+        )
+        _KW_TABLES_KEY = key
+    return _KW_TABLES
+
+
+def reload_keywords():
+    global _KW_TABLES
+    _KW_TABLES = None
+    return keyword_tables()
+
+
+# Справочник мест Тенерифе (gazetteer.py), загружается один раз; None — выключен или не загрузился
+_GAZETTEER = None
+
+
+def gazetteer_index():
+    global _GAZETTEER
+    if not config.SETTINGS.get("gazetteer", True):
+        return None
+    if _GAZETTEER is None:
+        try:
+            _GAZETTEER = gazetteer.load(text_norm, _tokens)
+        except Exception as e:
+            print("[gazetteer] load error:", e)
+            _GAZETTEER = False
+    return _GAZETTEER or None
+
+
+def _south_municipality(m):
+    return m.name in (getattr(config, "SOUTH_MUNICIPALITIES", None) or ())
+
+
 # Нечёткая похожесть двух строк
 def _similar(a, b):
     if not a or not b:
@@ -59,120 +129,175 @@ def _similar(a, b):
 
 
 # Определение типа объекта (land, rural_house, villa, finca)
+# Нормализованный текст объявления: Listing помнит его между detect_type и is_south, dict — считаем
+def _item_text(item):
+    if isinstance(item, Listing):
+        return item.norm_text
+    return text_norm(" ".join([str(item.get(k, "") or "") for k in ("title", "address", "description")]))
+
+
 def detect_type(item):
-    text = " ".join([str(item.get(k, "") or "") for k in ("title", "address", "description")])
-    txt = text_norm(text)
-    for t, keys in config.TYPE_KEYWORDS.items():
+    return detect_type_evidence(item)[0]
+
+
+# detect_type + чем он совпал: (type, evidence); evidence — короткий кортеж для трассировки
+#   ("exact", key) / ("fuzzy_token", key) / ("fuzzy_full", key) / None
+def detect_type_evidence(item):
+    txt = _item_text(item)
+    txt_tokens = _tokens(txt)
+    kw = keyword_tables()
+    hits = kw.hits(txt)
+    fuzzy = None  # ключи, похожие на какой-нибудь токен текста (считаем, только если точного нет)
+    for t, keys in kw.types:
         for k in keys:
             if not k:
                 continue
-            if k in txt:
-                return t
+            if k in hits:
+                return t, ("exact", k)
             # token fuzzy: сравнить ключ с токенами текста
-            for tok in _tokens(txt):
-                if _similar(k, tok) >= TOKEN_FUZZY_THRESHOLD:
-                    return t
+            if fuzzy is None:
+                fuzzy = kw.fuzzy.any_matches(txt_tokens)
+            if k in fuzzy:
+                return t, ("fuzzy_token", k)
         for k in keys:
-            if _similar(k, txt) >= FUZZY_THRESHOLD:
-                return t
+            if similar_at_least(k, txt, FUZZY_THRESHOLD):
+                return t, ("fuzzy_full", k)
+    return None, None
+
+
+# Заголовок и адрес объявления — то, что говорит о его месте (в отличие от описания)
+def _head_text(item):
+    return " ".join([str(item.get(k, "") or "") for k in ("title", "address")])
+
+
+# Координаты объявления (lat, lon) или None, если их нет или они не разбираются
+def _geo_point(item):
+    lat = item.get("lat") or item.get("latitude") or item.get("geo_lat")
+    lon = item.get("lon") or item.get("longitude") or item.get("geo_lon")
+    if lat is None or lon is None:
+        return None
+    try:
+        return float(lat), float(lon)
+    except Exception:
+        return None
+
+
+# Центр и радиус GEO_FILTER, если фильтр включён и настроен корректно
+def _geo_circle():
+    geo_conf = getattr(config, "GEO_FILTER", None)
+    if not geo_conf or not geo_conf.get("enabled", False):
+        return None
+    try:
+        center = geo_conf.get("center")
+        radius_km = float(geo_conf.get("radius_km", 30.0))
+        if center and len(center) == 2:
+            return float(center[0]), float(center[1]), radius_km
+    except Exception:
+        pass
     return None
 
 
 # Проверка, относится ли объект к южной части острова
-def is_south(item):
-    text = " ".join([str(item.get(k, "") or "") for k in ("title", "address", "description")])
-    txt = text_norm(text)
+# use_geo=False — только по тексту (ключевые слова и blacklist), без GEO_FILTER
+def is_south(item, use_geo=True):
+    return south_evidence(item, use_geo)[0]
+
+
+# is_south + почему: (south, evidence); evidence — короткий кортеж, текст из него делает explain_south
+def south_evidence(item, use_geo=True):
+    txt = _item_text(item)
     if not txt:
-        return False
+        return False, ("no_text",)
 
-    # blacklist (если задан в config)
-    bl = getattr(config, "SOUTH_BLACKLIST", []) or []
-    for b in bl:
-        if b and b in txt:
-            return False
+    kw = keyword_tables()
+    hits = kw.hits(txt)
 
-    # GEO фильтрация (если включена в config.GEO_FILTER)
-    geo_conf = getattr(config, "GEO_FILTER", None)
-    if geo_conf and geo_conf.get("enabled", False):
-        lat = item.get("lat") or item.get("latitude") or item.get("geo_lat")
-        lon = item.get("lon") or item.get("longitude") or item.get("geo_lon")
-        try:
-            if lat is not None and lon is not None:
-                lat = float(lat); lon = float(lon)
-                center = geo_conf.get("center")
-                radius_km = float(geo_conf.get("radius_km", 30.0))
-                if center and len(center) == 2:
-                    dist = _haversine_km(lat, lon, float(center[0]), float(center[1]))
-                    return dist <= radius_km
-        except Exception:
-            pass  # при ошибке гео-данных продолжаем текстовые проверки
+    # blacklist (если задан в config)
+    for b in kw.blacklist:
+        if b and b in hits:
+            return False, ("blacklist", b)
+
+    # координаты: круг config.GEO_FILTER, если он включён, иначе муниципалитет по справочнику
+    # (при ошибке гео-данных _geo_point даёт None — продолжаем текстовые проверки).
+    # Точка решает раньше текста: муниципалитет не с юга — «не юг» даже при точном SOUTH_KEYWORDS
+    point = _geo_point(item) if use_geo else None
+    if point is not None:
+        circle = _geo_circle()
+        if circle is not None:
+            dist = _haversine_km(point[0], point[1], circle[0], circle[1])
+            return dist <= circle[2], ("geo", dist, circle[2])
+        gz = gazetteer_index()
+        m = gz.municipality_at(point[0], point[1]) if gz is not None else None
+        if m is not None:
+            south = _south_municipality(m)
+            return south, ("gazetteer_point", m.name, m.zone, south)
 
     # точный поиск ключевых слов
-    south_keys = getattr(config, "SOUTH_KEYWORDS", []) or []
-    for kw in south_keys:
-        if not kw:
-            continue
-        if kw in txt:
-            return True
+    for k, _k_norm, _k_tokens in kw.south:
+        if k in hits:
+            return True, ("exact", k)
 
-    # token-wise fuzzy match
+    # названия посёлков и муниципалитетов из справочника — без нечёткого перебора:
+    # южное место где угодно в тексте — юг; только другие места в заголовке/адресе — не юг
+    # (в описании «30 минут до Santa Cruz» про само объявление ничего не говорит)
     txt_tokens = _tokens(txt)
-    for kw in south_keys:
-        if not kw:
-            continue
-        kw_norm = text_norm(kw)
-        if kw_norm in txt_tokens:
-            return True
-        kw_tokens = _tokens(kw_norm)
-        for kt in kw_tokens:
-            for tok in txt_tokens:
-                if _similar(kt, tok) >= TOKEN_FUZZY_THRESHOLD:
-                    return True
-        if _similar(kw_norm, txt) >= FUZZY_THRESHOLD:
-            return True
+    gz = gazetteer_index()
+    if gz is not None:
+        places = gz.resolve(txt_tokens)
+        for m in places:
+            if _south_municipality(m):
+                return True, ("gazetteer_place", ((m.name, m.zone),), True)
+        if places:
+            head = gz.resolve(_tokens(_head_text(item)))
+            if head:
+                return False, ("gazetteer_place", tuple((m.name, m.zone) for m in head), False)
 
-    return False
+    # token-wise fuzzy match
+    token_set = set(txt_tokens)
+    fuzzy = kw.fuzzy.any_matches(txt_tokens)
+    for k, kw_norm, kw_tokens in kw.south:
+        if kw_norm in token_set:
+            return True, ("exact", k)
+        for kt in kw_tokens:
+            if kt in fuzzy:
+                tok = next((tok for tok in txt_tokens if kt in kw.fuzzy.matches(tok)), "")
+                return True, ("fuzzy_token", kt, tok)
+        if similar_at_least(kw_norm, txt, FUZZY_THRESHOLD):
+            return True, ("fuzzy_full", k)
+
+    return False, ("none",)
+
+
+# Текст пояснения по evidence из south_evidence (для логов и трассировки решений)
+def explain_south(evidence):
+    kind = evidence[0] if evidence else "none"
+    if kind == "no_text":
+        return "No text"
+    if kind == "blacklist":
+        return f"BLACKLIST match: '{evidence[1]}'"
+    if kind == "geo":
+        dist, radius_km = evidence[1], evidence[2]
+        if dist <= radius_km:
+            return f"GEO match: distance {dist:.1f} km <= {radius_km} km"
+        return f"GEO non-match: distance {dist:.1f} km > {radius_km} km"
+    if kind == "gazetteer_point":
+        verdict = "match" if evidence[3] else "non-match"
+        return f"GAZETTEER point {verdict}: {evidence[1]} ({evidence[2]})"
+    if kind == "exact":
+        return f"KEYWORD exact match: '{evidence[1]}'"
+    if kind == "gazetteer_place":
+        verdict = "match" if evidence[2] else "non-match"
+        return f"GAZETTEER place {verdict}: " + ", ".join(f"{name} ({zone})" for name, zone in evidence[1])
+    if kind == "fuzzy_token":
+        return f"KEYWORD fuzzy token match: '{evidence[1]}' ~ '{evidence[2]}'"
+    if kind == "fuzzy_full":
+        return f"KEYWORD fuzzy full match: '{evidence[1]}'"
+    return "No south match"
 
 
 # Пояснение, почему объявление признано (или не признано) южным — полезно для логов
 def explain_is_south(item):
-    text = " ".join([str(item.get(k, "") or "") for k in ("title", "address", "description")])
-    txt = text_norm(text)
-
-    bl = getattr(config, "SOUTH_BLACKLIST", []) or []
-    for b in bl:
-        if b in txt:
-            return f"BLACKLIST match: '{b}'"
-
-    geo_conf = getattr(config, "GEO_FILTER", None)
-    if geo_conf and geo_conf.get("enabled", False):
-        lat = item.get("lat") or item.get("latitude") or item.get("geo_lat")
-        lon = item.get("lon") or item.get("longitude") or item.get("geo_lon")
-        if lat is not None and lon is not None:
-            try:
-                center = geo_conf.get("center")
-                radius_km = float(geo_conf.get("radius_km", 30.0))
-                dist = _haversine_km(float(lat), float(lon), float(center[0]), float(center[1]))
-                if dist <= radius_km:
-                    return f"GEO match: distance {dist:.1f} km <= {radius_km} km"
-                else:
-                    return f"GEO non-match: distance {dist:.1f} km > {radius_km} km"
-            except Exception:
-                pass
-
-    south_keys = getattr(config, "SOUTH_KEYWORDS", []) or []
-    for kw in south_keys:
-        if kw in txt:
-            return f"KEYWORD exact match: '{kw}'"
-    for kw in south_keys:
-        if _similar(text_norm(kw), txt) >= FUZZY_THRESHOLD:
-            return f"KEYWORD fuzzy full match: '{kw}'"
-        kw_tokens = _tokens(text_norm(kw))
-        for kt in kw_tokens:
-            for tok in _tokens(txt):
-                if _similar(kt, tok) >= TOKEN_FUZZY_THRESHOLD:
-                    return f"KEYWORD fuzzy token match: '{kt}' ~ '{tok}'"
-    return "No south match"
+    return explain_south(south_evidence(item)[1])
 
 
 # Нормализация цены: строка/число -> int (евро) или None
@@ -219,6 +344,130 @@ def is_price_ok(item):
         return False
 
 
+# Причины отказа classify_batch (по индексу кода причины)
+BATCH_REASONS = ("ok", "no type", "not south", "no price", "no price limit", "over price limit")
+
+
+# Лимит цены по типу: пользовательский (меню бота) или из config, как в is_price_ok
+def _price_limit(t):
+    limit = user_price_limits.get(t)
+    if limit is None:
+        limit = config.PRICE_THRESHOLDS.get(t)
+    try:
+        return int(limit) if limit is not None else None
+    except Exception:
+        return None
+
+
+# Пачка объявлений целиком: тип, юг (с GEO_FILTER) и цена -> (маска кандидатов, причины)
+#   verdicts — готовые (detected_type, south[, evidence]) (classify_cache / parse_pool.classify — уже
+#              с координатами); если None — считаются здесь через detect_type / is_south(use_geo=False).
+#              Юг объявлений с координатами пересчитывается здесь в любом случае
+#   prices   — цены вместо item["price"] (например, уже приведённые к int)
+# Текстовый проход остаётся поштучным; лимиты цен по типу и расстояние до центра GEO_FILTER
+# считаются над колонками numpy сразу для всей пачки. Решение то же, что у
+# detect_type + is_south + is_price_ok по одному объявлению.
+def classify_batch(items, verdicts=None, prices=None):
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("classify_batch requires numpy")
+    n = len(items)
+    if verdicts is None:
+        verdicts = []
+        for it in items:
+            t = detect_type(it)
+            verdicts.append((t, is_south(it, use_geo=False) if t else False))
+    if prices is None:
+        prices = [it.get("price") for it in items]
+
+    # колонки: код типа и юг по тексту
+    type_names = [None]
+    type_index = {None: 0}
+    codes = np.zeros(n, dtype=np.int32)
+    south = np.zeros(n, dtype=bool)
+    for i, v in enumerate(verdicts):
+        t, s = v[0], v[1]
+        if not t:
+            continue
+        code = type_index.get(t)
+        if code is None:
+            code = type_index[t] = len(type_names)
+            type_names.append(t)
+        codes[i] = code
+        south[i] = bool(s)
+    has_type = codes > 0
+
+    # координаты: юг решает круг GEO_FILTER или муниципалитет по справочнику
+    # (кроме blacklist и пустого текста); точки вне справочника остаются с вердиктом по тексту
+    circle = _geo_circle()
+    gz = gazetteer_index() if circle is None else None
+    if circle is not None or gz is not None:
+        typed = np.flatnonzero(has_type)
+        lat = np.full(len(typed), np.nan)
+        lon = np.full(len(typed), np.nan)
+        for j, i in enumerate(typed.tolist()):
+            point = _geo_point(items[i])
+            if point is not None:
+                lat[j], lon[j] = point
+        geo = ~np.isnan(lat)
+        if geo.any():
+            idx = typed[geo]
+            lat, lon = lat[geo], lon[geo]
+            if circle is not None:
+                phi1 = np.radians(lat)
+                phi2 = math.radians(circle[0])
+                dphi = np.radians(circle[0] - lat)
+                dlambda = np.radians(circle[1] - lon)
+                a = np.sin(dphi / 2.0) ** 2 + np.cos(phi1) * math.cos(phi2) * np.sin(dlambda / 2.0) ** 2
+                inside = 6371.0 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)) <= circle[2]
+                decided = np.ones(len(idx), dtype=bool)
+            else:
+                where = gz.municipalities_at(lat, lon)
+                decided = where >= 0
+                inside = np.isin(where, [m.index for m in gz.municipalities if _south_municipality(m)])
+            # blacklist побеждает координаты — текст смотрим только у тех, кто внутри
+            kw = keyword_tables()
+            for k in np.flatnonzero(inside).tolist():
+                it = items[idx[k]]
+                txt = _item_text(it)
+                if not txt:
+                    inside[k] = False
+                    continue
+                hits = kw.hits(txt)
+                if any(b and b in hits for b in kw.blacklist):
+                    inside[k] = False
+            south[idx[decided]] = inside[decided]
+
+    # нормализованная цена (nan — нет цены) — только там, где тип и юг уже есть
+    price = np.full(n, np.nan)
+    for i in np.flatnonzero(has_type & south).tolist():
+        v = prices[i]
+        p = v if type(v) is int else normalize_price(v)
+        if p is not None:
+            price[i] = p
+
+    # лимиты цен по коду типа
+    limits = np.full(len(type_names), np.nan)
+    for code, t in enumerate(type_names):
+        limit = _price_limit(t) if t else None
+        if limit is not None:
+            limits[code] = limit
+    limit = limits[codes]
+
+    has_price = ~np.isnan(price)
+    has_limit = ~np.isnan(limit)
+    within = np.zeros(n, dtype=bool)
+    both = has_price & has_limit
+    within[both] = price[both] <= limit[both]
+
+    reason = np.select(
+        [~has_type, ~south, ~has_price, ~has_limit, ~within],
+        [1, 2, 3, 4, 5],
+        default=0,
+    )
+    mask = reason == 0
+    return mask, [BATCH_REASONS[r] for r in reason.tolist()]
+
+
 # Сохранение результатов в CSV
 def save_to_csv(items, filename=None):
     if not items: